@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+文档中"优化前 / 优化后"查询的 A/B 基准测试
+
+性能章节常把一个慢查询和优化后的查询放在同一个代码块中（-- ❌ / -- ✅ 注释）。
+本工具从 Markdown 中找出标注了 bench 属性的代码块，在同一台服务器上交替执行各变体，
+报告中位数、p95 耗时和读取字节数，以及相对基线的比值，把文档中的性能提升说法变成实测数据。
+
+使用方法：
+    python ab_benchmark.py
+    python ab_benchmark.py --filter prewhere --runs 20 --warmup 3 --drop-caches mark,uncompressed
+    python ab_benchmark.py --paths "11-performance/*.md,02-advance/*.md" --output ab.json
+
+代码块标注：
+    ```sql bench=prewhere_column
+    -- ✅ 使用列名
+    SELECT ...;
+    -- ❌ 使用表达式
+    SELECT ...;
+    ```
+    - 以 -- ✅ / -- ❌ 注释开头的段落各是一个变体，没有标记时每条语句是一个变体
+    - 多个代码块使用相同的 bench 名称时合并为一组，可以用 variant=名称 指定变体名
+    - ❌ 变体（没有时为第一个变体）作为基线
+    - 示例读取的表需要事先准备好，例如 run_sql_files.py --datagen 100M
+
+测量方式：
+1. 结果以 FORMAT Null 丢弃（default_format=Null，不受 max_result_rows 限制），只测量服务端计算
+2. 先预热 --warmup 轮，再交替执行各变体 --runs 轮，减少缓存和负载变化带来的偏差
+3. --drop-caches 指定时每次测量前清除对应缓存（SYSTEM DROP ... CACHE）
+4. 耗时使用服务端 X-ClickHouse-Summary 中的 elapsed_ns，读取字节数使用 read_bytes
+"""
+
+import argparse
+import json
+import math
+import re
+import sys
+from pathlib import Path
+from statistics import median
+from typing import List, Dict
+
+import run_sql_files
+from run_sql_files import (
+    ClickHouseClient, CLICKHOUSE_HOST, CLICKHOUSE_PORT, SELECT_SETTINGS, STMT_SELECT,
+    classify_statement, parse_endpoints, split_sql_statements
+)
+from extract_sql_from_md import extract_sql_from_markdown
+
+# 默认参数
+DEFAULT_PATHS = ['11-performance/*.md']
+DEFAULT_RUNS = 10
+DEFAULT_WARMUP = 2
+
+# --drop-caches 可选的缓存
+CACHE_DROP_STATEMENTS = {
+    'mark': 'SYSTEM DROP MARK CACHE',
+    'uncompressed': 'SYSTEM DROP UNCOMPRESSED CACHE',
+    'query': 'SYSTEM DROP QUERY CACHE',
+    'mmap': 'SYSTEM DROP MMAP CACHE',
+    'filesystem': 'SYSTEM DROP FILESYSTEM CACHE',
+    'page': 'SYSTEM DROP PAGE CACHE',
+}
+
+_VARIANT_MARKER = re.compile(r'^\s*--\s*(✅|❌)\s*(.*?)\s*$')
+
+
+def split_variants(sql: str, default_label: str) -> List[Dict]:
+    """
+    把一个代码块拆分为变体
+
+    Args:
+        sql: 代码块内容
+        default_label: 没有 ✅ / ❌ 标记时的变体名
+
+    Returns:
+        [{'label': ..., 'baseline': bool, 'statements': [...]}, ...]，只保留只读语句
+    """
+    segments = []
+    current = {'label': default_label, 'baseline': False, 'lines': []}
+    for line in sql.split('\n'):
+        m = _VARIANT_MARKER.match(line)
+        if m:
+            if any(l.strip() for l in current['lines']):
+                segments.append(current)
+            current = {'label': m.group(2) or m.group(1), 'baseline': m.group(1) == '❌', 'lines': []}
+        else:
+            current['lines'].append(line)
+    if any(l.strip() for l in current['lines']):
+        segments.append(current)
+
+    variants = []
+    for segment in segments:
+        statements = [stmt for stmt in split_sql_statements('\n'.join(segment['lines']))
+                      if classify_statement(stmt) == STMT_SELECT]
+        if statements:
+            variants.append({'label': segment['label'], 'baseline': segment['baseline'], 'statements': statements})
+
+    # 没有标记时每条语句各是一个变体
+    if len(segments) == 1 and not _VARIANT_MARKER.search(sql) and variants and len(variants[0]['statements']) > 1:
+        variants = [{'label': f"{default_label} #{i}", 'baseline': False, 'statements': [stmt]}
+                    for i, stmt in enumerate(variants[0]['statements'], 1)]
+    return variants
+
+
+def collect_benchmarks(md_files: List[Path]) -> Dict[str, Dict]:
+    """
+    收集所有标注了 bench 属性的代码块
+
+    Returns:
+        {bench 名称: {'sources': [...], 'variants': [...]}}，按出现顺序；
+        每组中基线变体排在第一位
+    """
+    benchmarks = {}
+    for md_file in md_files:
+        for block in extract_sql_from_markdown(md_file):
+            name = block['attrs'].get('bench')
+            if not name or name is True:
+                continue
+            bench = benchmarks.setdefault(name, {'sources': [], 'variants': []})
+            bench['sources'].append(f"{md_file.relative_to(run_sql_files.PROJECT_ROOT)}:{block['line']}")
+            label = block['attrs'].get('variant')
+            label = label if isinstance(label, str) else block['heading_path'][-1] if block['heading_path'] else name
+            bench['variants'].extend(split_variants(block['sql'], label))
+
+    for bench in benchmarks.values():
+        variants = bench['variants']
+        baseline = next((v for v in variants if v['baseline']), variants[0] if variants else None)
+        if baseline:
+            variants.remove(baseline)
+            variants.insert(0, baseline)
+    return {name: bench for name, bench in benchmarks.items() if len(bench['variants']) >= 2}
+
+
+def percentile(values: List[float], p: float) -> float:
+    """最近秩百分位数"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def run_variant(client: ClickHouseClient, variant: Dict, database: str) -> Dict:
+    """
+    执行一次变体的所有语句
+
+    Returns:
+        {'ok': bool, 'elapsed_ms': ..., 'read_bytes': ..., 'read_rows': ..., 'error': ...}
+    """
+    sample = {'ok': True, 'elapsed_ms': 0.0, 'read_bytes': 0, 'read_rows': 0, 'error': None}
+    for stmt in variant['statements']:
+        success, result, stats = client.execute_query_with_stats(stmt, database)
+        if not success:
+            return {**sample, 'ok': False, 'error': result}
+        sample['elapsed_ms'] += stats['elapsed_ns'] / 1e6 if stats.get('elapsed_ns') else stats['elapsed'] * 1000
+        sample['read_bytes'] += stats.get('read_bytes', 0)
+        sample['read_rows'] += stats.get('read_rows', 0)
+    return sample
+
+
+def run_benchmark(client: ClickHouseClient, bench: Dict, runs: int, warmup: int,
+                  drop_caches: List[str], database: str) -> List[Dict]:
+    """
+    交替执行一组变体
+
+    Args:
+        client: ClickHouse 客户端
+        bench: collect_benchmarks() 中的一组
+        runs: 每个变体的测量次数
+        warmup: 预热轮数（不计入结果）
+        drop_caches: 每次测量前清除的缓存
+        database: 默认数据库
+
+    Returns:
+        每个变体的统计（第一个为基线）
+    """
+    variants = bench['variants']
+    samples = [[] for _ in variants]
+    errors = [None] * len(variants)
+
+    for _ in range(warmup):
+        for variant in variants:
+            run_variant(client, variant, database)
+
+    for _ in range(runs):
+        for n, variant in enumerate(variants):
+            if errors[n]:
+                continue
+            for cache in drop_caches:
+                client.execute_query(CACHE_DROP_STATEMENTS[cache])
+            sample = run_variant(client, variant, database)
+            if sample['ok']:
+                samples[n].append(sample)
+            else:
+                errors[n] = sample['error']
+
+    results = []
+    for variant, variant_samples, error in zip(variants, samples, errors):
+        elapsed = [s['elapsed_ms'] for s in variant_samples]
+        results.append({
+            'label': variant['label'],
+            'baseline': variant is variants[0],
+            'statements': variant['statements'],
+            'runs': len(variant_samples),
+            'error': error,
+            'median_ms': median(elapsed) if elapsed else None,
+            'p95_ms': percentile(elapsed, 95) if elapsed else None,
+            'min_ms': min(elapsed) if elapsed else None,
+            'read_bytes': median(s['read_bytes'] for s in variant_samples) if variant_samples else None,
+            'read_rows': median(s['read_rows'] for s in variant_samples) if variant_samples else None,
+        })
+
+    base = results[0]
+    for r in results:
+        r['speedup'] = (base['median_ms'] / r['median_ms']
+                        if base['median_ms'] and r['median_ms'] else None)
+        r['read_bytes_ratio'] = (r['read_bytes'] / base['read_bytes']
+                                 if base['read_bytes'] and r['read_bytes'] is not None else None)
+    return results
+
+
+def print_results(name: str, bench: Dict, results: List[Dict]):
+    """打印一组的结果"""
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else '-'
+
+    print(f"\n{name}（{', '.join(bench['sources'])}）")
+    print(f"  {'变体':<30} {'次数':>4} {'中位数 ms':>10} {'p95 ms':>10} {'读取字节':>14} {'加速比':>7} {'字节比':>7}")
+    for r in results:
+        label = ('[基线] ' if r['baseline'] else '') + r['label']
+        if r['error']:
+            print(f"  {label[:30]:<30} ✗ {r['error'][:100]}")
+            continue
+        print(f"  {label[:30]:<30} {r['runs']:>4} {fmt(r['median_ms'], '.2f'):>10} {fmt(r['p95_ms'], '.2f'):>10} "
+              f"{fmt(r['read_bytes'], ',.0f'):>14} {fmt(r['speedup'], '.2f'):>6}x {fmt(r['read_bytes_ratio'], '.2f'):>7}")
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="文档中优化前/优化后查询的 A/B 基准测试")
+    parser.add_argument('--paths', default=','.join(DEFAULT_PATHS),
+                        help=f"要扫描的 Markdown 文件（相对项目根目录，逗号分隔，支持通配符；默认 {','.join(DEFAULT_PATHS)}）")
+    parser.add_argument('--filter', default=None, help="只运行名称包含该字符串的组")
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help=f"每个变体的测量次数（默认 {DEFAULT_RUNS}）")
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP, help=f"预热轮数（默认 {DEFAULT_WARMUP}）")
+    parser.add_argument('--drop-caches', default='',
+                        help=f"每次测量前清除的缓存，逗号分隔（{', '.join(CACHE_DROP_STATEMENTS)}）")
+    parser.add_argument('--database', default='default', help="语句的默认数据库（默认 default）")
+    parser.add_argument('--endpoint', type=parse_endpoints, default=[(CLICKHOUSE_HOST, CLICKHOUSE_PORT)],
+                        help="执行测试的节点（host:port）")
+    parser.add_argument('--list', action='store_true', help="只列出找到的组，不执行")
+    parser.add_argument('--output', type=Path, default=None, help="结果写入 JSON 文件")
+    args = parser.parse_args()
+    args.drop_caches = [c.strip() for c in args.drop_caches.split(',') if c.strip()]
+    unknown = [c for c in args.drop_caches if c not in CACHE_DROP_STATEMENTS]
+    if unknown:
+        parser.error(f"未知的缓存: {', '.join(unknown)}")
+    return args
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+
+    print("=" * 80)
+    print("A/B 基准测试")
+    print("=" * 80)
+
+    md_files = sorted({path for pattern in args.paths.split(',') if pattern.strip()
+                       for path in run_sql_files.PROJECT_ROOT.glob(pattern.strip())})
+    benchmarks = collect_benchmarks(md_files)
+    if args.filter:
+        benchmarks = {name: bench for name, bench in benchmarks.items() if args.filter in name}
+    print(f"扫描 {len(md_files)} 个 Markdown 文件，找到 {len(benchmarks)} 组")
+
+    if args.list:
+        for name, bench in benchmarks.items():
+            print(f"  {name}: {', '.join(v['label'] for v in bench['variants'])}（{', '.join(bench['sources'])}）")
+        return
+    if not benchmarks:
+        return
+
+    # 结果丢弃在服务端，不受结果行数/字节数上限影响
+    SELECT_SETTINGS.update(default_format='Null', max_result_rows='0', max_result_bytes='0')
+    host, port = args.endpoint[0]
+    client = ClickHouseClient(host, port, cluster=None, retries=0)
+    success, version = client.execute_query("SELECT version() FORMAT TabSeparated")
+    if not success:
+        print(f"✗ 连接失败: {version}")
+        sys.exit(1)
+    print(f"ClickHouse {version}，每个变体 {args.runs} 次（预热 {args.warmup} 轮）"
+          + (f"，每次清除缓存: {', '.join(args.drop_caches)}" if args.drop_caches else ''))
+
+    report = {'server_version': version, 'runs': args.runs, 'warmup': args.warmup,
+              'drop_caches': args.drop_caches, 'benchmarks': {}}
+    for name, bench in benchmarks.items():
+        results = run_benchmark(client, bench, args.runs, args.warmup, args.drop_caches, args.database)
+        print_results(name, bench, results)
+        report['benchmarks'][name] = {'sources': bench['sources'], 'variants': results}
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f"\n结果已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
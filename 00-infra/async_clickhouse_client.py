@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+ClickHouse 异步 HTTP 客户端
+
+基于 asyncio 的 ClickHouseClient 变体，execute_query 的约定与同步版本相同，
+返回 (success, result/error_message)。
+
+功能：
+1. 有上限的 keep-alive 连接池
+2. 真正生效的连接超时和读取超时
+3. 按节点限制并发数，可以同时向集群的所有分片发送大量查询
+4. 与同步客户端相同的错误分类和临时错误退避重试
+"""
+
+import asyncio
+import contextlib
+import http.client
+import time
+
+import run_sql_files
+from typing import List, Dict, Tuple
+from urllib.parse import urlencode
+
+from run_sql_files import (
+    ClickHouseClient, CLICKHOUSE_HOST, CLICKHOUSE_PORT, CLICKHOUSE_USER,
+    CLICKHOUSE_PASSWORD, CLICKHOUSE_CLUSTER, CONNECT_TIMEOUT, READ_TIMEOUT,
+    HTTP_COMPRESSION, RETRY_ATTEMPTS, ClickHouseError, capture_result, decode_result, get_rate_limiter,
+    guard_write_retry, is_binary_result, iter_request_body, parse_clickhouse_error, parse_summary_header,
+    retry_delay
+)
+
+# 连接池配置
+POOL_SIZE = 100          # 所有节点合计的最大连接数
+PER_HOST_LIMIT = 32      # 单个节点的最大并发查询数
+
+
+class AsyncClickHouseClient:
+    """ClickHouse 异步 HTTP 客户端"""
+
+    # 查询清理和参数构建与同步客户端完全一致
+    _clean_query = ClickHouseClient._clean_query
+    _prepare_request = ClickHouseClient._prepare_request
+    _build_params = ClickHouseClient._build_params
+    _request_headers = ClickHouseClient._request_headers
+
+    def __init__(self, host=CLICKHOUSE_HOST, port=CLICKHOUSE_PORT,
+                 user=CLICKHOUSE_USER, password=CLICKHOUSE_PASSWORD,
+                 cluster=CLICKHOUSE_CLUSTER, pool_size: int = POOL_SIZE,
+                 per_host_limit: int = PER_HOST_LIMIT,
+                 connect_timeout: float = CONNECT_TIMEOUT,
+                 read_timeout: float = READ_TIMEOUT,
+                 compression: str = HTTP_COMPRESSION,
+                 retries: int = RETRY_ATTEMPTS):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.cluster = cluster
+        self.compression = compression
+        self.retries = retries
+        self.rate_limiter = get_rate_limiter(cluster)
+        self.per_host_limit = per_host_limit
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._pool_slots = asyncio.Semaphore(pool_size)
+        self._host_slots = {}
+        self._idle = {}
+        self._active = set()
+        self._closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def execute_query(self, query: str, database: str = None,
+                            cluster: str = None, host: str = None,
+                            port: int = None) -> Tuple[bool, str]:
+        """
+        执行单个 SQL 查询
+
+        Args:
+            query: SQL 查询语句
+            database: 数据库（可选）
+            cluster: 集群名称（可选）
+            host: 目标节点（可选，默认使用客户端的节点）
+            port: 目标节点端口（可选）
+
+        Returns:
+            (success, result/error_message)
+        """
+        success, result, _ = await self.execute_query_with_stats(query, database, cluster, host, port)
+        return success, result
+
+    async def execute_query_with_stats(self, query: str, database: str = None,
+                                       cluster: str = None, host: str = None,
+                                       port: int = None) -> Tuple[bool, str, Dict]:
+        """
+        执行单个 SQL 查询并返回耗时统计
+
+        Args:
+            query: SQL 查询语句
+            database: 数据库（可选）
+            cluster: 集群名称（可选）
+            host: 目标节点（可选，默认使用客户端的节点）
+            port: 目标节点端口（可选）
+
+        Returns:
+            (success, result/error_message, stats)，stats 与同步客户端相同
+        """
+        query = query.strip()
+        if not query or query.startswith('--') or query.startswith('/*'):
+            return True, "Comment - skipped", {'elapsed': 0.0}
+
+        params, text, body_offset = self._prepare_request(query, database, cluster)
+        payload = b''.join(iter_request_body(text, body_offset, self.compression))
+        endpoint = (host or self.host, port or self.port)
+        rate_limiter = get_rate_limiter(cluster) if cluster else self.rate_limiter
+
+        attempt = 0
+        while True:
+            success, result, stats = await self._execute_once(endpoint, params, payload, rate_limiter)
+            if not success:
+                # 写入语句结果未知时不重试
+                stats['error'] = guard_write_retry(query, stats['error'], stats.pop('sent', True))
+                result = str(stats['error'])
+            stats['attempts'] = attempt + 1
+            if success or not stats['error'].transient or attempt >= self.retries:
+                return success, result, stats
+            await asyncio.sleep(retry_delay(attempt))
+            attempt += 1
+
+    async def _execute_once(self, endpoint: Tuple[str, int], params: Dict[str, str],
+                            payload: bytes, rate_limiter) -> Tuple[bool, str, Dict]:
+        """发送一次查询，不重试"""
+        stats = {'elapsed': 0.0}
+
+        # 限速器是阻塞实现，放到线程中等待，不阻塞事件循环
+        if rate_limiter.interval:
+            await asyncio.to_thread(rate_limiter.acquire)
+
+        start = time.perf_counter()
+        try:
+            async with self._host_slot(endpoint):
+                status, headers, body, truncated = await self._request(endpoint, params, payload)
+            stats['elapsed'] = time.perf_counter() - start
+            stats.update(parse_summary_header(headers))
+
+            # 字节上限在读取时生效，行数上限在这里生效
+            body, row_truncated = capture_result(
+                [body], 0, 0 if is_binary_result(headers) else run_sql_files.RESULT_CAPTURE_ROWS)
+            if truncated or row_truncated:
+                stats['truncated'] = True
+
+            if status == 200:
+                return True, decode_result(body, headers, truncated or row_truncated), stats
+            error = parse_clickhouse_error(status, body.decode('utf-8', errors='replace'), headers)
+
+        except asyncio.TimeoutError:
+            # 读取超时时查询可能仍在执行，不重试
+            error = ClickHouseError("Timeout")
+        except _ConnectFailed:
+            # 连接没有建立，请求一定没有发出
+            stats['sent'] = False
+            error = ClickHouseError("Connection failed", transient=True)
+        except (ConnectionError, OSError, asyncio.IncompleteReadError):
+            error = ClickHouseError("Connection failed", transient=True)
+        except Exception as e:
+            error = ClickHouseError(f"Error: {str(e)}")
+
+        stats['elapsed'] = time.perf_counter() - start
+        stats['error'] = error
+        return False, str(error), stats
+
+    async def execute_many(self, queries: List[Tuple[str, str, str]]) -> List[Tuple[bool, str, Dict]]:
+        """
+        并发执行多条查询（并发度受连接池和单节点上限约束）
+
+        Args:
+            queries: [(query, database, cluster), ...]
+
+        Returns:
+            与 queries 一一对应的 [(success, result/error_message, stats), ...]
+        """
+        return await asyncio.gather(*(self.execute_query_with_stats(*q) for q in queries))
+
+    async def close(self):
+        """关闭所有连接（包括正在使用的连接），等待传输层关闭完成"""
+        writers = [writer for connections in self._idle.values() for _, writer in connections]
+        writers.extend(self._active)
+        self._closed = True
+        self._idle.clear()
+        self._active.clear()
+        for writer in writers:
+            writer.close()
+        await asyncio.gather(*(writer.wait_closed() for writer in writers), return_exceptions=True)
+
+    def _host_slot(self, endpoint: Tuple[str, int]) -> asyncio.Semaphore:
+        """获取节点的并发限制信号量"""
+        if endpoint not in self._host_slots:
+            self._host_slots[endpoint] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_slots[endpoint]
+
+    async def _request(self, endpoint: Tuple[str, int], params: Dict[str, str], payload: bytes):
+        """从连接池取一个连接发送请求，响应读完后归还连接"""
+        async with self._pool_slots:
+            reader, writer = await self._acquire_connection(endpoint)
+            self._active.add(writer)
+            try:
+                extra = ''.join(f"{name}: {value}\r\n" for name, value in self._request_headers().items())
+                request = (f"POST /?{urlencode(params)} HTTP/1.1\r\n"
+                           f"Host: {endpoint[0]}:{endpoint[1]}\r\n"
+                           f"Content-Length: {len(payload)}\r\n"
+                           f"Connection: keep-alive\r\n"
+                           f"{extra}"
+                           f"\r\n").encode('utf-8')
+                writer.write(request)
+                writer.write(payload)
+                await asyncio.wait_for(writer.drain(), self.read_timeout)
+                status, headers, body, keep_alive, truncated = await asyncio.wait_for(
+                    self._read_response(reader, run_sql_files.RESULT_CAPTURE_BYTES), self.read_timeout)
+            except BaseException:
+                writer.close()
+                raise
+            finally:
+                self._active.discard(writer)
+
+            if keep_alive and not self._closed:
+                self._idle.setdefault(endpoint, []).append((reader, writer))
+            else:
+                writer.close()
+                with contextlib.suppress(OSError):
+                    await writer.wait_closed()
+            return status, headers, body, truncated
+
+    async def _acquire_connection(self, endpoint: Tuple[str, int]):
+        """复用空闲连接，没有则新建"""
+        idle = self._idle.get(endpoint)
+        while idle:
+            reader, writer = idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer
+            writer.close()
+        try:
+            return await asyncio.wait_for(asyncio.open_connection(*endpoint), self.connect_timeout)
+        except OSError as e:
+            raise _ConnectFailed(str(e)) from e
+
+    async def _read_response(self, reader: asyncio.StreamReader, max_bytes: int = 0):
+        """
+        读取一个 HTTP/1.1 响应，响应体最多读取 max_bytes 字节（0 表示不限）
+
+        响应体被截断时连接不能复用，由调用方关闭。
+
+        Returns:
+            (status, headers, body, keep_alive, truncated)
+        """
+        head = await reader.readuntil(b'\r\n\r\n')
+        status_line, _, header_block = head.partition(b'\r\n')
+        version, status = status_line.split(b' ', 2)[:2]
+        headers = http.client.parse_headers(_BytesLineReader(header_block))
+
+        truncated = False
+        if headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            received = 0
+            while True:
+                size_line = await reader.readuntil(b'\r\n')
+                size = int(size_line.split(b';', 1)[0], 16)
+                if size == 0:
+                    # 跳过 trailer
+                    while (await reader.readuntil(b'\r\n')) != b'\r\n':
+                        pass
+                    break
+                if max_bytes and received + size > max_bytes:
+                    chunks.append(await reader.readexactly(max_bytes - received))
+                    truncated = True
+                    break
+                chunks.append(await reader.readexactly(size))
+                received += size
+                await reader.readexactly(2)
+            body = b''.join(chunks)
+            framed = True
+        elif headers.get('Content-Length') is not None:
+            length = int(headers['Content-Length'])
+            truncated = bool(max_bytes) and length > max_bytes
+            body = await reader.readexactly(max_bytes if truncated else length)
+            framed = True
+        else:
+            # 没有长度信息，读到连接关闭为止
+            parts = []
+            received = 0
+            while not max_bytes or received < max_bytes:
+                chunk = await reader.read(max_bytes - received if max_bytes else 65536)
+                if not chunk:
+                    break
+                parts.append(chunk)
+                received += len(chunk)
+            body = b''.join(parts)
+            truncated = bool(max_bytes) and received >= max_bytes and not reader.at_eof()
+            framed = False
+
+        connection = headers.get('Connection', '').lower()
+        keep_alive = (framed and not truncated and connection != 'close'
+                      and (version == b'HTTP/1.1' or connection == 'keep-alive'))
+        return int(status), headers, body, keep_alive, truncated
+
+
+class _ConnectFailed(ConnectionError):
+    """建立连接失败（请求没有发出）"""
+
+
+class _BytesLineReader:
+    """为 http.client.parse_headers 提供 readline 接口"""
+
+    def __init__(self, data: bytes):
+        self._lines = iter(data.splitlines(keepends=True))
+
+    def readline(self, limit: int = -1) -> bytes:
+        return next(self._lines, b'')
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+SQL 执行器性能基准测试
+
+在进程内启动模拟 ClickHouse 服务器（mock_clickhouse_server.py），
+不需要真实集群即可测量各执行路径每秒执行的语句数，用于发现性能回退。
+
+使用方法：
+    python benchmark_runner.py
+    python benchmark_runner.py --statements 2000 --concurrency 1,8,32 --latency-ms 1
+    python benchmark_runner.py --output bench.json
+    python benchmark_runner.py --baseline bench.json --tolerance 0.2
+
+测试项：
+1. client      - ClickHouseClient.execute_query_with_stats，多线程、每线程一个客户端
+2. batch       - ClickHouseClient.execute_batch 流水线，按批大小
+3. async       - AsyncClickHouseClient.execute_many，按单节点并发上限
+4. file        - execute_sql_file() 执行生成的 SQL 文件，按批大小
+5. files       - execute_sql_files_parallel() 执行多个互不依赖的文件，按并发数
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Dict
+
+import run_sql_files
+from run_sql_files import ClickHouseClient, ReportWriter, execute_sql_file, execute_sql_files_parallel
+from async_clickhouse_client import AsyncClickHouseClient
+from mock_clickhouse_server import MockClickHouseServer
+
+# 默认参数
+DEFAULT_STATEMENTS = 1000
+DEFAULT_CONCURRENCY = [1, 4, 16]
+DEFAULT_BATCH_SIZES = [1, 10, 50]
+DEFAULT_TOLERANCE = 0.2   # 比基线慢 20% 以上视为回退
+
+
+def make_statements(count: int) -> List[str]:
+    """生成测试语句（SELECT / INSERT / DDL 混合）"""
+    statements = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            statements.append(f"CREATE TABLE IF NOT EXISTS bench.t{i} (id UInt64) ENGINE = Memory")
+        elif kind == 1:
+            statements.append(f"INSERT INTO bench.t{i - 1} VALUES ({i}), ({i + 1})")
+        else:
+            statements.append(f"SELECT count() FROM bench.t{i - kind} WHERE id > {i}")
+    return statements
+
+
+def _measure(name: str, level: int, count: int, func) -> Dict:
+    """运行一次测试并计算吞吐"""
+    start = time.perf_counter()
+    errors = func()
+    elapsed = time.perf_counter() - start
+    result = {
+        'name': name,
+        'level': level,
+        'statements': count,
+        'errors': errors,
+        'elapsed': elapsed,
+        'statements_per_sec': count / elapsed if elapsed else 0.0,
+    }
+    print(f"  {name:<8} {level:>5}  {count:>7}  {errors:>6}  {elapsed:>8.3f}s  "
+          f"{result['statements_per_sec']:>10.1f}")
+    return result
+
+
+def bench_client(host: str, port: int, statements: List[str], concurrency: int) -> int:
+    """多线程逐条执行，每个线程一个客户端（requests.Session 非线程安全）"""
+    def worker(part: List[str]) -> int:
+        client = ClickHouseClient(host, port, cluster=None)
+        return sum(not client.execute_query_with_stats(stmt)[0] for stmt in part)
+
+    parts = [statements[i::concurrency] for i in range(concurrency)]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return sum(executor.map(worker, parts))
+
+
+def bench_batch(host: str, port: int, statements: List[str], batch_size: int) -> int:
+    """单连接流水线批量执行"""
+    client = ClickHouseClient(host, port, cluster=None)
+    errors = 0
+    for i in range(0, len(statements), batch_size):
+        batch = [(stmt, None, None) for stmt in statements[i:i + batch_size]]
+        errors += sum(not ok for ok, _, _ in client.execute_batch(batch))
+    return errors
+
+
+def bench_async(host: str, port: int, statements: List[str], concurrency: int) -> int:
+    """asyncio 客户端并发执行"""
+    async def run():
+        async with AsyncClickHouseClient(host, port, cluster=None, per_host_limit=concurrency) as client:
+            outcomes = await client.execute_many([(stmt, None, None) for stmt in statements])
+        return sum(not ok for ok, _, _ in outcomes)
+
+    return asyncio.run(run())
+
+
+def bench_file(host: str, port: int, sql_file: Path, batch_size: int) -> int:
+    """execute_sql_file() 执行单个文件（包括写入事件日志）"""
+    client = ClickHouseClient(host, port, cluster=None)
+    with ReportWriter(sql_file.parent / "bench_events.jsonl") as results, \
+            contextlib.redirect_stdout(io.StringIO()):
+        execute_sql_file(sql_file, client, results, batch_size)
+    return results.totals['total_errors']
+
+
+def bench_files(host: str, port: int, sql_files: List[Path], jobs: int) -> int:
+    """execute_sql_files_parallel() 并发执行多个文件（包括写入事件日志）"""
+    with ReportWriter(sql_files[0].parent / "bench_events.jsonl") as results, \
+            contextlib.redirect_stdout(io.StringIO()):
+        execute_sql_files_parallel(sql_files, results, jobs,
+                                   client_factory=lambda: ClickHouseClient(host, port, cluster=None))
+    return results.totals['total_errors']
+
+
+def run_benchmarks(host: str, port: int, count: int, concurrency: List[int],
+                   batch_sizes: List[int], work_dir: Path) -> List[Dict]:
+    """
+    运行所有测试项
+
+    Args:
+        host: 服务器地址
+        port: 服务器端口
+        count: 每个测试项执行的语句数
+        concurrency: 并发度列表
+        batch_sizes: 批大小列表
+        work_dir: 生成 SQL 文件的临时目录
+
+    Returns:
+        每个测试项的结果列表
+    """
+    statements = make_statements(count)
+
+    # execute_sql_file 按 PROJECT_ROOT 计算相对路径，指向临时目录
+    run_sql_files.PROJECT_ROOT = work_dir
+    sql_file = work_dir / "bench_examples.sql"
+    sql_file.write_text(';\n'.join(statements) + ';\n', encoding='utf-8')
+
+    # 多文件测试：每个文件使用独立的库，互不依赖
+    file_count = max(concurrency)
+    sql_files = []
+    for n in range(file_count):
+        path = work_dir / f"bench_{n:03d}_examples.sql"
+        part = [stmt.replace('bench.', f'bench{n}.') for stmt in statements[n::file_count]]
+        path.write_text(';\n'.join(part) + ';\n', encoding='utf-8')
+        sql_files.append(path)
+
+    print(f"  {'测试项':<6} {'级别':>4}  {'语句数':>5}  {'失败':>4}  {'耗时':>7}  {'语句/秒':>8}")
+    results = []
+    for level in concurrency:
+        results.append(_measure('client', level, count, lambda: bench_client(host, port, statements, level)))
+    for level in batch_sizes:
+        results.append(_measure('batch', level, count, lambda: bench_batch(host, port, statements, level)))
+    for level in concurrency:
+        results.append(_measure('async', level, count, lambda: bench_async(host, port, statements, level)))
+    for level in batch_sizes:
+        results.append(_measure('file', level, count, lambda: bench_file(host, port, sql_file, level)))
+    for level in concurrency:
+        results.append(_measure('files', level, count, lambda: bench_files(host, port, sql_files, level)))
+    return results
+
+
+def compare_with_baseline(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """
+    与基线结果比较
+
+    Args:
+        results: 本次结果
+        baseline: 基线结果
+        tolerance: 允许的吞吐下降比例
+
+    Returns:
+        回退描述列表（为空表示没有回退）
+    """
+    previous = {(r['name'], r['level']): r['statements_per_sec'] for r in baseline}
+    regressions = []
+    for r in results:
+        base = previous.get((r['name'], r['level']))
+        if base and r['statements_per_sec'] < base * (1 - tolerance):
+            regressions.append(f"{r['name']} (级别 {r['level']}): "
+                               f"{r['statements_per_sec']:.1f} 语句/秒，基线 {base:.1f} 语句/秒")
+    return regressions
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="SQL 执行器性能基准测试（使用模拟 ClickHouse 服务器）")
+    parser.add_argument('--statements', type=int, default=DEFAULT_STATEMENTS,
+                        help=f"每个测试项执行的语句数（默认 {DEFAULT_STATEMENTS}）")
+    parser.add_argument('--concurrency', type=_int_list, default=DEFAULT_CONCURRENCY,
+                        help="并发度列表，逗号分隔（默认 1,4,16）")
+    parser.add_argument('--batch-sizes', type=_int_list, default=DEFAULT_BATCH_SIZES,
+                        help="批大小列表，逗号分隔（默认 1,10,50）")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="模拟服务器每个查询的延迟（毫秒）")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="模拟服务器随机返回错误的比例")
+    parser.add_argument('--server', default=None,
+                        help="使用已运行的服务器（host:port），不启动进程内模拟服务器")
+    parser.add_argument('--output', type=Path, default=None, help="结果写入 JSON 文件")
+    parser.add_argument('--baseline', type=Path, default=None, help="与基线 JSON 比较，有回退时返回非零退出码")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f"允许的吞吐下降比例（默认 {DEFAULT_TOLERANCE}）")
+    return parser.parse_args()
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+
+    print("=" * 80)
+    print("SQL 执行器性能基准测试")
+    print("=" * 80)
+
+    server = None
+    if args.server:
+        host, _, port = args.server.rpartition(':')
+        port = int(port)
+    else:
+        server = MockClickHouseServer(latency=args.latency_ms / 1000, error_rate=args.error_rate, seed=0).start()
+        host, port = server.host, server.port
+        print(f"模拟服务器: http://{host}:{port}（延迟 {args.latency_ms} ms，错误率 {args.error_rate}）")
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            results = run_benchmarks(host, port, args.statements, args.concurrency,
+                                     args.batch_sizes, Path(tmp))
+    finally:
+        if server:
+            server.stop()
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f"\n结果已保存: {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding='utf-8'))
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n✗ 发现 {len(regressions)} 项性能回退（容差 {args.tolerance:.0%}）:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print(f"\n✓ 与基线相比没有性能回退（容差 {args.tolerance:.0%}）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+ClickHouse 集群并行健康检查
+
+执行 healthcheck/cluster_healthcheck.sql 中的检查，替代逐条串行执行的 shell / PowerShell 脚本：
+所有节点、所有互不依赖的检查同时执行，每项检查有独立的超时，几秒内返回带耗时的结构化结果，
+可以作为频繁执行的就绪探针。
+
+使用方法：
+    python cluster_healthcheck.py
+    python cluster_healthcheck.py --endpoints localhost:8123,localhost:8124 --timeout 3
+    python cluster_healthcheck.py --keepers keeper1:9181,keeper2:9181,keeper3:9181 --json
+    python cluster_healthcheck.py --read-only     # 就绪探针：跳过建表、写入等有副作用的检查
+
+检查的组织方式：
+1. SQL 文件中以 SELECT '===== N. 标题 =====' as step 开头的每一段是一项检查，
+   只返回常量的提示语句（如 SELECT 'Health Check Completed' as status）不执行，
+   SET 语句作为所有检查的查询设置（HTTP 接口没有会话）
+2. 只读检查在每个节点上执行；有写入的检查（建库建表、插入）只在第一个节点上执行一次
+3. 检查之间按读写的对象确定依赖（与 run_sql_files.py -j 的文件依赖规则相同），
+   例如读取测试表的检查在插入完成后才在各节点执行；依赖失败的检查记为跳过
+4. 每个节点另有内置检查：/ping 和服务端版本，所有节点的版本必须一致
+5. 指定 --keepers 时用 Keeper 的四字命令（ruok / mntr）检查每个 Keeper 节点，
+   并要求集群中恰好有一个 leader
+
+每项检查的超时（--timeout）同时作为服务端 max_execution_time 和客户端读取超时；
+全部检查通过时退出码为 0，否则为 1。
+"""
+
+import argparse
+import json
+import re
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Tuple
+
+import requests
+
+import run_sql_files
+from run_sql_files import (
+    ClickHouseClient, STMT_SELECT, STMT_SET, classify_statement, extract_object_refs,
+    parse_endpoints, read_sql_statements, _files_conflict
+)
+
+# 默认参数
+HEALTHCHECK_SQL = Path(__file__).parent / "healthcheck" / "cluster_healthcheck.sql"
+HEALTHCHECK_ENDPOINTS = [('localhost', 8123), ('localhost', 8124)]   # docker-compose.yml 映射的两个节点
+DEFAULT_TIMEOUT = 5.0   # 每项检查的超时（秒）
+
+# Keeper 四字命令（需要在 four_letter_word_white_list 中，默认已包含）
+KEEPER_OK_RESPONSE = 'imok'
+
+CHECK_OK = 'ok'
+CHECK_FAILED = 'failed'
+CHECK_SKIPPED = 'skipped'
+
+_STEP_MARKER = re.compile(r"^\s*SELECT\s+'=+\s*(\d+)\.\s*(.*?)\s*=+'\s+as\s+\w+\s*$", re.IGNORECASE)
+_BANNER = re.compile(r"^\s*SELECT\s+'[^']*'\s+as\s+\w+\s*$", re.IGNORECASE)
+_SET_ITEM = re.compile(r"(\w+)\s*=\s*('[^']*'|[^,\s]+)")
+
+
+def load_checks(sql_file: Path) -> Tuple[Dict[str, str], List[Dict]]:
+    """
+    把健康检查 SQL 文件拆分为检查项
+
+    Args:
+        sql_file: 健康检查 SQL 文件
+
+    Returns:
+        (settings, checks)
+        settings 为 SET 语句中的查询设置；
+        checks 为 [{'id', 'name', 'statements', 'read_only', 'depends'}, ...]，
+        depends 是必须先完成的检查 id
+    """
+    settings = {}
+    checks = []
+    for stmt in read_sql_statements(sql_file):
+        marker = _STEP_MARKER.match(stmt)
+        if marker:
+            checks.append({'id': int(marker.group(1)), 'name': marker.group(2), 'statements': []})
+            continue
+        if classify_statement(stmt) == STMT_SET:
+            for name, value in _SET_ITEM.findall(re.sub(r'^\s*SET\s+', '', stmt, flags=re.IGNORECASE)):
+                settings[name] = value.strip("'")
+            continue
+        if _BANNER.match(stmt) or not checks:
+            continue
+        checks[-1]['statements'].append(stmt)
+
+    checks = [check for check in checks if check['statements']]
+    refs = {}
+    for i, check in enumerate(checks):
+        check['read_only'] = all(classify_statement(s) == STMT_SELECT for s in check['statements'])
+        refs[check['id']] = extract_object_refs(check['statements'])
+        check['depends'] = [prev['id'] for prev in checks[:i]
+                            if _files_conflict(refs[check['id']], refs[prev['id']])]
+    return settings, checks
+
+
+class HealthCheckClient(ClickHouseClient):
+    """附加查询设置、使用较短超时的 ClickHouseClient（健康检查不重试）"""
+
+    def __init__(self, endpoint: Tuple[str, int], settings: Dict[str, str], timeout: float):
+        super().__init__(endpoint[0], endpoint[1], cluster=None, retries=0)
+        self.settings = settings
+        # 服务端先按 max_execution_time 中止查询，客户端多等 1 秒以收到服务端的错误信息
+        self.timeout = (min(run_sql_files.CONNECT_TIMEOUT, timeout), timeout + 1)
+
+    def _build_params(self, database: str = None, cluster: str = None) -> Dict[str, str]:
+        params = super()._build_params(database, cluster)
+        params.update(self.settings)
+        return params
+
+
+def run_node_check(check: Dict, endpoint: Tuple[str, int], settings: Dict[str, str],
+                   timeout: float) -> Dict:
+    """
+    在一个节点上执行一项检查的所有语句（遇到失败即停止）
+
+    Returns:
+        {'check', 'name', 'node', 'status', 'elapsed_ms', 'statements', 'error'}
+    """
+    client = HealthCheckClient(endpoint, settings, timeout)
+    result = {'check': check['id'], 'name': check['name'], 'node': f"{endpoint[0]}:{endpoint[1]}",
+              'status': CHECK_OK, 'elapsed_ms': 0.0, 'statements': [], 'error': None}
+    for stmt in check['statements']:
+        success, output, stats = client.execute_query_with_stats(stmt)
+        elapsed_ms = stats['elapsed'] * 1000
+        result['elapsed_ms'] += elapsed_ms
+        result['statements'].append({'statement': ' '.join(stmt.split()), 'success': success,
+                                     'elapsed_ms': elapsed_ms, 'result': output})
+        if not success:
+            result.update(status=CHECK_FAILED, error=output.strip())
+            break
+    return result
+
+
+def run_builtin_check(endpoint: Tuple[str, int], timeout: float) -> Dict:
+    """节点内置检查：/ping 和服务端版本"""
+    node = f"{endpoint[0]}:{endpoint[1]}"
+    result = {'check': 0, 'name': 'HTTP 服务和版本', 'node': node, 'status': CHECK_OK,
+              'elapsed_ms': 0.0, 'statements': [], 'error': None, 'version': None}
+    start = time.perf_counter()
+    try:
+        response = requests.get(f"http://{node}/ping", timeout=timeout)
+        if response.status_code != 200:
+            result.update(status=CHECK_FAILED, error=f"/ping 返回 HTTP {response.status_code}")
+    except requests.exceptions.RequestException as e:
+        result.update(status=CHECK_FAILED, error=f"/ping 失败: {str(e)}")
+    if result['status'] == CHECK_OK:
+        success, version = HealthCheckClient(endpoint, {}, timeout).execute_query(
+            "SELECT version() FORMAT TabSeparated")
+        if success:
+            result['version'] = version
+        else:
+            result.update(status=CHECK_FAILED, error=version)
+    result['elapsed_ms'] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def keeper_command(endpoint: Tuple[str, int], command: str, timeout: float) -> str:
+    """向 Keeper 发送一个四字命令，返回响应文本"""
+    with socket.create_connection(endpoint, timeout=timeout) as sock:
+        sock.settimeout(timeout)
+        sock.sendall(command.encode('ascii'))
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b''.join(chunks).decode('utf-8', errors='replace')
+
+
+def run_keeper_check(endpoint: Tuple[str, int], timeout: float) -> Dict:
+    """
+    检查一个 Keeper 节点（ruok 和 mntr）
+
+    Returns:
+        {'node', 'status', 'elapsed_ms', 'state', 'metrics', 'error'}
+    """
+    result = {'node': f"{endpoint[0]}:{endpoint[1]}", 'status': CHECK_OK, 'elapsed_ms': 0.0,
+              'state': None, 'metrics': {}, 'error': None}
+    start = time.perf_counter()
+    try:
+        answer = keeper_command(endpoint, 'ruok', timeout).strip()
+        if answer != KEEPER_OK_RESPONSE:
+            result.update(status=CHECK_FAILED, error=f"ruok 返回: {answer or '（空）'}")
+        else:
+            for line in keeper_command(endpoint, 'mntr', timeout).splitlines():
+                name, _, value = line.partition('\t')
+                if name:
+                    result['metrics'][name] = value
+            result['state'] = result['metrics'].get('zk_server_state')
+    except OSError as e:
+        result.update(status=CHECK_FAILED, error=f"连接失败: {str(e)}")
+    result['elapsed_ms'] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def run_healthcheck(endpoints: List[Tuple[str, int]], checks: List[Dict], settings: Dict[str, str],
+                    keepers: List[Tuple[str, int]] = None, timeout: float = DEFAULT_TIMEOUT,
+                    read_only: bool = False) -> Dict:
+    """
+    并发执行所有检查
+
+    Args:
+        endpoints: ClickHouse 节点（第一个节点执行有写入的检查）
+        checks: load_checks() 返回的检查项
+        settings: 查询设置
+        keepers: Keeper 节点（可选）
+        timeout: 每项检查的超时（秒）
+        read_only: 跳过有写入的检查及依赖它们的检查
+
+    Returns:
+        {'ok': bool, 'elapsed_ms': ..., 'checks': [...], 'keepers': [...], 'problems': [...]}
+    """
+    settings = {**settings, 'max_execution_time': str(int(timeout) or 1)}
+    start = time.perf_counter()
+    skipped = set()
+    tasks = []
+    for check in checks:
+        if read_only and (not check['read_only'] or any(d in skipped for d in check['depends'])):
+            skipped.add(check['id'])
+            continue
+        for endpoint in (endpoints if check['read_only'] else endpoints[:1]):
+            tasks.append((check, endpoint))
+
+    keepers = keepers or []
+    # 等待依赖的任务也占用线程，线程数必须不少于任务数，否则可能死锁
+    workers = len(tasks) + len(endpoints) + len(keepers)
+    futures_by_check = {}
+
+    def run_task(check, endpoint):
+        for dep in check['depends']:
+            failed = [f.result() for f in futures_by_check.get(dep, [])
+                      if f.result()['status'] != CHECK_OK]
+            if failed:
+                return {'check': check['id'], 'name': check['name'], 'node': f"{endpoint[0]}:{endpoint[1]}",
+                        'status': CHECK_SKIPPED, 'elapsed_ms': 0.0, 'statements': [],
+                        'error': f"依赖的检查 {dep}. {failed[0]['name']} 失败"}
+        return run_node_check(check, endpoint, settings, timeout)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        builtin = [executor.submit(run_builtin_check, endpoint, timeout) for endpoint in endpoints]
+        keeper_futures = [executor.submit(run_keeper_check, endpoint, timeout) for endpoint in keepers]
+        # 按检查顺序提交，依赖的检查总是先提交
+        for check, endpoint in tasks:
+            futures_by_check.setdefault(check['id'], []).append(executor.submit(run_task, check, endpoint))
+        results = [f.result() for f in builtin]
+        results += [f.result() for futures in futures_by_check.values() for f in futures]
+        keeper_results = [f.result() for f in keeper_futures]
+
+    problems = [f"{r['node']} {r['check']}. {r['name']}: {r['error']}"
+                for r in results if r['status'] != CHECK_OK]
+    versions = {r['version'] for r in results if r['check'] == 0 and r['version']}
+    if len(versions) > 1:
+        problems.append(f"节点版本不一致: {', '.join(sorted(versions))}")
+    problems += [f"Keeper {r['node']}: {r['error']}" for r in keeper_results if r['status'] != CHECK_OK]
+    if keepers and all(r['status'] == CHECK_OK for r in keeper_results):
+        leaders = [r['node'] for r in keeper_results if r['state'] == 'leader']
+        if len(keepers) > 1 and len(leaders) != 1:
+            problems.append(f"Keeper 集群应有 1 个 leader，实际 {len(leaders)} 个")
+
+    return {
+        'ok': not problems,
+        'elapsed_ms': (time.perf_counter() - start) * 1000,
+        'timeout': timeout,
+        'skipped_checks': sorted(skipped),
+        'checks': results,
+        'keepers': keeper_results,
+        'problems': problems,
+    }
+
+
+def print_report(report: Dict):
+    """打印检查结果"""
+    symbols = {CHECK_OK: '✓', CHECK_FAILED: '✗', CHECK_SKIPPED: '-'}
+    for r in report['checks']:
+        detail = r.get('version') or (r['error'] or '')[:150]
+        print(f"  {symbols[r['status']]} {r['check']:>2}. {r['name'][:45]:<45} {r['node']:<21} "
+              f"{r['elapsed_ms']:>8.1f} ms  {detail}")
+    for r in report['keepers']:
+        detail = r['state'] or (r['error'] or '')[:150]
+        print(f"  {symbols[r['status']]}     Keeper {'':<38} {r['node']:<21} {r['elapsed_ms']:>8.1f} ms  {detail}")
+    if report['skipped_checks']:
+        print(f"  （只读模式跳过检查: {', '.join(map(str, report['skipped_checks']))}）")
+
+    print(f"\n总耗时 {report['elapsed_ms']:.0f} ms")
+    if report['ok']:
+        print("✓ 集群健康检查通过")
+    else:
+        print(f"✗ 发现 {len(report['problems'])} 个问题:")
+        for problem in report['problems']:
+            print(f"  - {problem[:200]}")
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="ClickHouse 集群并行健康检查")
+    parser.add_argument('--endpoints', type=parse_endpoints, default=HEALTHCHECK_ENDPOINTS,
+                        help="ClickHouse 节点（host:port，逗号分隔；第一个节点执行写入类检查）")
+    parser.add_argument('--keepers', type=parse_endpoints, default=[],
+                        help="Keeper 节点（host:port，逗号分隔，如 keeper1:9181），用四字命令检查")
+    parser.add_argument('--sql', type=Path, default=HEALTHCHECK_SQL, help="健康检查 SQL 文件")
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help=f"每项检查的超时（秒，默认 {DEFAULT_TIMEOUT}）")
+    parser.add_argument('--read-only', action='store_true',
+                        help="只执行只读检查（跳过建表、插入及依赖它们的检查），适合作为频繁的就绪探针")
+    parser.add_argument('--json', action='store_true', help="以 JSON 输出结构化结果")
+    return parser.parse_args()
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+    settings, checks = load_checks(args.sql)
+    report = run_healthcheck(args.endpoints, checks, settings, args.keepers, args.timeout, args.read_only)
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print("=" * 80)
+        print(f"ClickHouse 集群健康检查（{len(args.endpoints)} 个节点，{len(args.keepers)} 个 Keeper，"
+              f"{len(checks)} 项检查，每项超时 {args.timeout:g} 秒）")
+        print("=" * 80)
+        print_report(report)
+    sys.exit(0 if report['ok'] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,20 +3,33 @@
 自动从 Markdown 文件中提取 SQL 的工具
 
 使用方法：
-    python extract_sql_from_md.py
+    python extract_sql_from_md.py            # 增量提取
+    python extract_sql_from_md.py --check    # 只检查是否有过期的 .sql 文件，不写入
 
 功能：
 1. 扫描指定目录下的所有 .md 文件
 2. 提取 ```sql ... ``` 代码块
 3. 生成对应的 .sql 文件
+4. 通过清单文件记录源文件哈希，只重新生成 Markdown 有变化的文件，
+   并删除源文件已不存在的 .sql 文件
+
+清单 extract_manifest.json 随仓库提交；已有的 .sql 文件都登记在清单中，
+不在清单中的 .sql 文件会被单独报告，--check 时视为失败。
 """
 
+import argparse
+import contextlib
+import hashlib
+import io
+import json
 import os
 import re
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
-from typing import List, Tuple
+from typing import List, Tuple, Dict, Iterable, Iterator
 
 # 配置
 PROJECT_ROOT = Path(r"d:\workspace\superset-github\clickhouse-doc")
@@ -44,8 +57,111 @@ EXCLUDE_FILES = [
     "SQL_EXECUTION_GUIDE.md"
 ]
 
+# 提取清单：记录每个 .md 文件及其生成的 .sql 文件的哈希
+MANIFEST_FILE = PROJECT_ROOT / "00-infra" / "extract_manifest.json"
+
+
+# 代码围栏（``` 或 ~~~，最多缩进 3 个空格）和 ATX 标题
+_FENCE = re.compile(r'^( {0,3})(`{3,}|~{3,})\s*([^`]*?)\s*$')
+_HEADING = re.compile(r'^ {0,3}(#{1,6})\s+(.*?)(?:\s+#+)?\s*$')
+
 
-def extract_sql_from_markdown(file_path: Path) -> List[Tuple[str, str]]:
+def parse_fence_info(info: str) -> Tuple[str, Dict[str, object]]:
+    """
+    解析代码围栏的 info string
+
+    例如 "sql skip" -> ("sql", {"skip": True})，
+    "sql cluster bench=prewhere" -> ("sql", {"cluster": True, "bench": "prewhere"})
+
+    Args:
+        info: 围栏开始行中语言及其后的部分
+
+    Returns:
+        (语言, 属性字典)
+    """
+    tokens = info.replace('{', ' ').replace('}', ' ').split()
+    if not tokens:
+        return '', {}
+
+    attrs = {}
+    for token in tokens[1:]:
+        name, sep, value = token.partition('=')
+        attrs[name] = value.strip('"\'') if sep else True
+    return tokens[0].lower(), attrs
+
+
+def iter_sql_blocks(lines: Iterable[str]) -> Iterator[Dict]:
+    """
+    单遍扫描 Markdown 行，产出每个 SQL 代码块（线性时间）
+
+    非 SQL 代码块同样会被跟踪，其中以 # 开头的行不会被误认为标题。
+
+    Args:
+        lines: Markdown 文件的行
+
+    Yields:
+        {'heading_path': [...], 'line': 围栏所在行号（从 1 开始）,
+         'attrs': 围栏属性, 'sql': 代码块内容}
+    """
+    headings = []          # [(level, text), ...]
+    fence = None           # 当前围栏的 (字符, 长度)
+    fence_lang = ''
+    fence_attrs = {}
+    fence_line = 0
+    body = []
+
+    for lineno, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+
+        if fence is None:
+            m = _FENCE.match(line)
+            if m and not (m.group(2)[0] == '`' and '`' in m.group(3)):
+                fence = (m.group(2)[0], len(m.group(2)))
+                fence_lang, fence_attrs = parse_fence_info(m.group(3))
+                fence_line = lineno
+                body = []
+                continue
+
+            m = _HEADING.match(line)
+            if m:
+                level = len(m.group(1))
+                while headings and headings[-1][0] >= level:
+                    headings.pop()
+                headings.append((level, m.group(2).strip()))
+            continue
+
+        # 在代码块中：检查结束围栏（同种字符，长度不小于开始围栏）
+        m = _FENCE.match(line)
+        if m and not m.group(3) and m.group(2)[0] == fence[0] and len(m.group(2)) >= fence[1]:
+            if fence_lang == 'sql':
+                yield {
+                    'heading_path': [text for _, text in headings],
+                    'line': fence_line,
+                    'attrs': fence_attrs,
+                    'sql': '\n'.join(body)
+                }
+            fence = None
+            continue
+
+        if fence_lang == 'sql':
+            body.append(line)
+
+    # 未闭合的代码块按 CommonMark 规则延续到文件末尾
+    if fence is not None and fence_lang == 'sql':
+        yield {
+            'heading_path': [text for _, text in headings],
+            'line': fence_line,
+            'attrs': fence_attrs,
+            'sql': '\n'.join(body)
+        }
+
+
+def _is_comment_only(sql_code: str) -> bool:
+    """代码块是否只有注释"""
+    return all(not line.strip() or line.strip().startswith('--') for line in sql_code.split('\n'))
+
+
+def extract_sql_from_markdown(file_path: Path) -> List[Dict]:
     """
     从 Markdown 文件中提取 SQL 代码块
 
@@ -53,49 +169,26 @@ def extract_sql_from_markdown(file_path: Path) -> List[Tuple[str, str]]:
         file_path: Markdown 文件路径
 
     Returns:
-        List of (description, sql_code) tuples
+        SQL 块列表，每个块包含 description（标题路径）、heading_path、
+        line（行号）、attrs（围栏属性）和 sql
     """
+    result = []
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-    except Exception as e:
-        print(f"无法读取文件 {file_path}: {e}")
-        return []
+            for i, block in enumerate(iter_sql_blocks(f), 1):
+                sql_code = block['sql'].strip()
 
-    # 匹配 SQL 代码块 ```sql ... ```
-    pattern = r'```sql\s*\n(.*?)\n```'
-    matches = re.findall(pattern, content, re.DOTALL)
+                # 跳过标记为 skip 的代码块、空代码或纯注释
+                if block['attrs'].get('skip') or not sql_code or _is_comment_only(sql_code):
+                    continue
 
-    if not matches:
+                block['sql'] = sql_code
+                block['description'] = ' > '.join(block['heading_path']) or f"SQL Block {i}"
+                result.append(block)
+    except Exception as e:
+        print(f"无法读取文件 {file_path}: {e}")
         return []
 
-    # 提取每个代码块前的标题或描述
-    result = []
-    content_lines = content.split('\n')
-    
-    for i, match in enumerate(matches):
-        sql_code = match.strip()
-        
-        # 跳过空代码或纯注释
-        if not sql_code or sql_code.startswith('--'):
-            continue
-        
-        # 查找代码块前的标题
-        description = f"SQL Block {i+1}"
-        block_start = content.find('```sql')
-        if block_start > 0:
-            # 查找最近的一个标题
-            lines_before = content[:block_start].split('\n')[-5:]
-            for line in reversed(lines_before):
-                if line.strip().startswith('##'):
-                    description = line.strip().replace('##', '').replace('#', '').strip()
-                    break
-                elif line.strip().startswith('###'):
-                    description = line.strip().replace('###', '').replace('#', '').strip()
-                    break
-        
-        result.append((description, sql_code))
-
     return result
 
 
@@ -127,7 +220,119 @@ def clean_sql_code(sql: str) -> str:
     return '\n'.join(cleaned_lines)
 
 
-def write_sql_file(md_file: Path, sql_blocks: List[Tuple[str, str]]) -> int:
+def file_hash(path: Path) -> str:
+    """计算文件内容的 SHA-256"""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_manifest() -> Dict:
+    """读取提取清单，不存在时返回空清单"""
+    if MANIFEST_FILE.exists():
+        with open(MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {'version': 1, 'files': {}}
+
+
+def save_manifest(manifest: Dict):
+    """写入提取清单（按路径排序，便于版本控制）"""
+    manifest['files'] = dict(sorted(manifest['files'].items()))
+    with open(MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+
+
+def sql_file_for(md_file: Path) -> Path:
+    """Markdown 文件对应的 .sql 文件"""
+    return md_file.parent / (md_file.stem + "_examples.sql")
+
+
+def sync_markdown_file(md_file: Path, manifest: Dict, check: bool = False) -> Tuple[str, int]:
+    """
+    按清单同步单个 Markdown 文件的 .sql 输出
+
+    不在清单中但已存在的 .sql 文件视为手工维护，不会被覆盖（--check 时报告为失败）；
+    清单中的 .sql 文件如果被手工修改过（哈希与清单不符），同样不会被覆盖。
+
+    Args:
+        md_file: Markdown 文件路径
+        manifest: 提取清单（生成文件时会更新）
+        check: 只检查，不写入
+
+    Returns:
+        (status, 写入的 SQL 块数量)，status 为
+        unchanged / unmanaged / modified / stale / created / updated / removed / empty
+    """
+    key = md_file.relative_to(PROJECT_ROOT).as_posix()
+    sql_file = sql_file_for(md_file)
+    entry = manifest['files'].get(key)
+    source_hash = file_hash(md_file)
+    output_exists = sql_file.exists()
+
+    if entry is None and output_exists:
+        return 'unmanaged', 0
+
+    if entry is not None and entry['output_hash'] and output_exists \
+            and file_hash(sql_file) != entry['output_hash']:
+        return 'modified', 0
+
+    if entry is not None and entry['source_hash'] == source_hash \
+            and output_exists == bool(entry['output_hash']):
+        return 'unchanged', 0
+
+    if check:
+        return 'stale', 0
+
+    sql_blocks = extract_sql_from_markdown(md_file)
+    count = write_sql_file(md_file, sql_blocks) if sql_blocks else 0
+    if not count:
+        # 没有可提取的 SQL：记录源文件哈希，删除之前生成的文件
+        manifest['files'][key] = {'output': None, 'source_hash': source_hash, 'output_hash': None}
+        if entry is not None and entry['output_hash'] and output_exists:
+            sql_file.unlink()
+            return 'removed', 0
+        return 'empty', 0
+
+    manifest['files'][key] = {
+        'output': sql_file.relative_to(PROJECT_ROOT).as_posix(),
+        'source_hash': source_hash,
+        'output_hash': file_hash(sql_file)
+    }
+    return ('updated' if entry is not None else 'created'), count
+
+
+def prune_deleted_sources(manifest: Dict, check: bool = False) -> List[str]:
+    """
+    删除源 Markdown 已不存在的 .sql 文件
+
+    Args:
+        manifest: 提取清单
+        check: 只检查，不删除
+
+    Returns:
+        源文件已删除的清单条目
+    """
+    deleted = []
+    for key, entry in list(manifest['files'].items()):
+        if (PROJECT_ROOT / key).exists():
+            continue
+        deleted.append(key)
+        if check:
+            continue
+
+        sql_file = PROJECT_ROOT / entry['output'] if entry['output'] else None
+        if sql_file is not None and sql_file.exists():
+            if file_hash(sql_file) != entry['output_hash']:
+                print(f"  保留（已手工修改）: {entry['output']}")
+                continue
+            sql_file.unlink()
+            print(f"  ✓ 删除: {entry['output']}（源文件 {key} 已删除）")
+        del manifest['files'][key]
+
+    return deleted
+
+
+def write_sql_file(md_file: Path, sql_blocks: List[Dict]) -> int:
     """
     将提取的 SQL 写入文件
 
@@ -142,13 +347,8 @@ def write_sql_file(md_file: Path, sql_blocks: List[Tuple[str, str]]) -> int:
         return 0
 
     # 确定 SQL 文件名
-    sql_filename = md_file.stem + "_examples.sql"
-    sql_file = md_file.parent / sql_filename
-
-    # 检查是否已存在
-    if sql_file.exists():
-        print(f"  跳过（已存在）: {sql_file.relative_to(PROJECT_ROOT)}")
-        return 0
+    sql_file = sql_file_for(md_file)
+    sql_filename = sql_file.name
 
     try:
         with open(sql_file, 'w', encoding='utf-8') as f:
@@ -158,11 +358,16 @@ def write_sql_file(md_file: Path, sql_blocks: List[Tuple[str, str]]) -> int:
             f.write(f"-- 提取时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
             f.write(f"-- ================================================\n\n")
 
-            for i, (description, sql_code) in enumerate(sql_blocks):
+            for block in sql_blocks:
                 f.write(f"\n-- ========================================\n")
-                f.write(f"-- {description}\n")
+                f.write(f"-- {block['description']}\n")
+                f.write(f"-- 来源: {md_file.name}:{block['line']}\n")
+                if block['attrs']:
+                    attrs = ', '.join(name if value is True else f"{name}={value}"
+                                      for name, value in block['attrs'].items())
+                    f.write(f"-- 属性: {attrs}\n")
                 f.write(f"-- ========================================\n\n")
-                f.write(sql_code)
+                f.write(block['sql'])
                 f.write("\n")
 
         print(f"  ✓ 写入: {sql_file.relative_to(PROJECT_ROOT)} ({len(sql_blocks)} 个 SQL 块)")
@@ -173,109 +378,182 @@ def write_sql_file(md_file: Path, sql_blocks: List[Tuple[str, str]]) -> int:
         return 0
 
 
-def process_directory(directory: str):
+# 各状态在输出中的说明（unchanged / empty 不输出）
+STATUS_MESSAGES = {
+    'unmanaged': '跳过（手工维护，不在清单中）',
+    'modified': '跳过（生成的文件已被手工修改）',
+    'stale': '需要重新提取',
+    'removed': '删除（Markdown 中已没有 SQL）',
+}
+
+
+def collect_markdown_files() -> List[Path]:
     """
-    处理单个目录
+    按 TARGET_DIRS 顺序收集所有待处理的 Markdown 文件
 
-    Args:
-        directory: 目录名称
+    Returns:
+        Markdown 文件列表（目录内按文件名排序，保证输出顺序确定）
     """
-    dir_path = PROJECT_ROOT / directory
-    
-    if not dir_path.exists():
-        print(f"目录不存在: {directory}")
-        return
+    md_files = []
+    for directory in TARGET_DIRS:
+        dir_path = PROJECT_ROOT / directory
+        if not dir_path.exists():
+            continue
+        md_files.extend(f for f in sorted(dir_path.glob("*.md")) if f.name not in EXCLUDE_FILES)
+    return md_files
 
-    print(f"\n处理目录: {directory}")
-    print("-" * 60)
 
-    md_files = list(dir_path.glob("*.md"))
-    
-    # 过滤排除的文件
-    md_files = [f for f in md_files if f.name not in EXCLUDE_FILES]
+def _sync_worker(task: Tuple[str, Dict, bool]) -> Tuple[str, str, int, Dict, str]:
+    """
+    在工作进程中同步单个 Markdown 文件
 
-    if not md_files:
-        print("未找到 Markdown 文件")
-        return
+    工作进程不能修改主进程的清单，因此只传入该文件的清单条目，
+    返回新的条目和捕获的输出，由主进程合并。
 
-    print(f"找到 {len(md_files)} 个 Markdown 文件")
+    Args:
+        task: (Markdown 文件路径, 清单条目, 是否只检查)
 
-    total_blocks = 0
-    created_files = 0
+    Returns:
+        (清单键, status, SQL 块数量, 新的清单条目, 输出文本)
+    """
+    md_path, entry, check = task
+    md_file = Path(md_path)
+    key = md_file.relative_to(PROJECT_ROOT).as_posix()
+    manifest = {'files': {key: entry} if entry is not None else {}}
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            status, count = sync_markdown_file(md_file, manifest, check)
+        except Exception as e:
+            print(f"  ✗ 处理失败 {md_file}: {e}")
+            status, count = 'error', 0
+
+    return key, status, count, manifest['files'].get(key), output.getvalue()
 
-    for md_file in md_files:
-        # 跳过已提取的文件
-        sql_file = md_file.parent / (md_file.stem + "_examples.sql")
-        if sql_file.exists():
-            print(f"  跳过（已提取）: {md_file.name}")
-            continue
 
-        sql_blocks = extract_sql_from_markdown(md_file)
-        
-        if sql_blocks:
-            count = write_sql_file(md_file, sql_blocks)
-            total_blocks += count
-            created_files += 1
+def run_extraction(manifest: Dict, check: bool = False, jobs: int = 1) -> Dict[str, int]:
+    """
+    提取流水线：并行解析和写入所有 Markdown 文件，按确定的顺序输出结果并合并清单
+
+    Args:
+        manifest: 提取清单（原地更新）
+        check: 只检查，不写入
+        jobs: 工作进程数（1 表示在当前进程中执行）
 
-    print(f"\n完成: 创建 {created_files} 个 SQL 文件，共 {total_blocks} 个 SQL 块")
+    Returns:
+        各项统计和过期文件列表
+    """
+    md_files = collect_markdown_files()
+    tasks = [(str(f), manifest['files'].get(f.relative_to(PROJECT_ROOT).as_posix()), check)
+             for f in md_files]
+
+    if jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            # map 按提交顺序返回结果
+            outcomes = list(executor.map(_sync_worker, tasks, chunksize=max(1, len(tasks) // (jobs * 4))))
+    else:
+        outcomes = [_sync_worker(task) for task in tasks]
+
+    totals = {
+        'directories': 0, 'markdown_files': len(md_files), 'sql_files': 0, 'sql_blocks': 0,
+        'unchanged': 0, 'skipped': 0, 'errors': 0, 'stale': [], 'unmanaged': []
+    }
+    current_dir = None
+
+    for key, status, count, entry, output in outcomes:
+        directory = key.rsplit('/', 1)[0]
+        if directory != current_dir:
+            current_dir = directory
+            totals['directories'] += 1
+            print(f"\n处理目录: {directory}")
+            print("-" * 60)
+
+        if output:
+            print(output, end='')
+        if status in STATUS_MESSAGES:
+            print(f"  {STATUS_MESSAGES[status]}: {key.rsplit('/', 1)[-1]}")
+
+        if entry is not None:
+            manifest['files'][key] = entry
+        else:
+            manifest['files'].pop(key, None)
+
+        if status == 'stale':
+            totals['stale'].append(key)
+        elif status == 'unchanged':
+            totals['unchanged'] += 1
+        elif status == 'unmanaged':
+            totals['unmanaged'].append(key)
+        elif status == 'modified':
+            totals['skipped'] += 1
+        elif status == 'error':
+            totals['errors'] += 1
+        if count:
+            totals['sql_files'] += 1
+            totals['sql_blocks'] += count
+
+    return totals
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="Markdown 到 SQL 提取工具")
+    parser.add_argument('--check', action='store_true',
+                        help="只检查 .sql 文件是否与 Markdown 一致，不写入；有差异时返回非零退出码")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="并行解析和写入的进程数（默认等于 CPU 核数）")
+    return parser.parse_args()
 
 
 def main():
     """主函数"""
+    args = parse_args()
+
     print("=" * 60)
     print("Markdown 到 SQL 提取工具")
     print("=" * 60)
     print()
 
-    total_dirs = 0
-    total_files = 0
-    total_blocks = 0
-
-    for directory in TARGET_DIRS:
-        dir_path = PROJECT_ROOT / directory
-        if not dir_path.exists():
-            continue
-
-        print(f"\n处理目录: {directory}")
-        print("-" * 60)
-
-        md_files = list(dir_path.glob("*.md"))
-        md_files = [f for f in md_files if f.name not in EXCLUDE_FILES]
-
-        if not md_files:
-            continue
-
-        print(f"找到 {len(md_files)} 个 Markdown 文件")
-
-        dir_blocks = 0
-        dir_files = 0
-
-        for md_file in md_files:
-            # 跳过已提取的文件
-            sql_file = md_file.parent / (md_file.stem + "_examples.sql")
-            if sql_file.exists():
-                print(f"  跳过（已提取）: {md_file.name}")
-                continue
-
-            sql_blocks = extract_sql_from_markdown(md_file)
-            
-            if sql_blocks:
-                count = write_sql_file(md_file, sql_blocks)
-                dir_blocks += count
-                dir_files += 1
-
-        print(f"\n完成: 创建 {dir_files} 个 SQL 文件，共 {dir_blocks} 个 SQL 块")
-        
-        total_dirs += 1
-        total_files += dir_files
-        total_blocks += dir_blocks
+    manifest = load_manifest()
+    start = time.perf_counter()
+    totals = run_extraction(manifest, args.check, args.jobs)
+    deleted = prune_deleted_sources(manifest, args.check)
+    elapsed = time.perf_counter() - start
+    stale = totals['stale']
+    unmanaged = totals['unmanaged']
 
     print("\n" + "=" * 60)
     print("提取总结")
     print("=" * 60)
-    print(f"处理的目录: {total_dirs}")
-    print(f"创建的 SQL 文件: {total_files}")
-    print(f"提取的 SQL 块: {total_blocks}")
+    print(f"处理的目录: {totals['directories']}")
+    print(f"Markdown 文件: {totals['markdown_files']}")
+    print(f"未变化: {totals['unchanged']}")
+    print(f"跳过（生成后被手工修改）: {totals['skipped']}")
+    print(f"不在清单中: {len(unmanaged)}")
+    if totals['errors']:
+        print(f"处理失败: {totals['errors']}")
+    print(f"耗时: {elapsed:.2f}s（{args.jobs} 个进程）")
+
+    if args.check:
+        for key in stale:
+            print(f"  过期: {key}")
+        for key in deleted:
+            print(f"  源文件已删除: {key}")
+        for key in unmanaged:
+            print(f"  不在清单中: {sql_file_for(PROJECT_ROOT / key).relative_to(PROJECT_ROOT).as_posix()}")
+        if stale or deleted or unmanaged:
+            print(f"\n✗ {len(stale)} 个文件需要重新提取，{len(deleted)} 个文件的源文件已删除，"
+                  f"{len(unmanaged)} 个 .sql 文件不在清单中")
+            print("  运行 python extract_sql_from_md.py 重新提取，并把 .sql 文件和 extract_manifest.json 一起提交")
+            sys.exit(1)
+        print("\n✓ 所有 .sql 文件都是最新的")
+        return
+
+    save_manifest(manifest)
+    print(f"生成的 SQL 文件: {totals['sql_files']}")
+    print(f"提取的 SQL 块: {totals['sql_blocks']}")
+    print(f"删除的 SQL 文件: {len(deleted)}")
     print("\n完成！")
 
 
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+基于示例 SQL 语料的并发压测
+
+从提取出的 .sql 文件中取出只读语句（SELECT / WITH / SHOW ...），按目标 QPS 或并发数
+在指定时长内重放，报告吞吐曲线、延迟直方图（HDR 风格，对数分桶）和服务端拒绝次数，
+用文档中实际使用的查询做可重复的容量测试。
+
+使用方法：
+    python load_test.py --concurrency 8 --duration 60
+    python load_test.py --qps 50,100,200,400 --duration 30 --endpoints node1:8123,node2:8123
+    python load_test.py --paths "11-performance/**/*.sql" --filter "GROUP BY" --output load.json
+
+两种模式：
+1. --concurrency N（闭环）：N 个线程各自不停发送查询，测量系统在该并发下能达到的吞吐
+2. --qps R（开环）：按固定间隔计划发送时间，延迟从计划时间开始计算。服务端变慢时
+   请求排队，排队时间计入延迟（避免 coordinated omission 低估尾延迟）；
+   --max-workers 限制同时在途的请求数
+
+两种模式都可以给出逗号分隔的多个值，逐级加压，每级运行 --duration 秒，得到吞吐曲线。
+
+注意：
+- 只读语句使用 SELECT_SETTINGS 中的 readonly=2 执行，结果以 FORMAT Null 在服务端丢弃
+- 先对每条语句预执行一次，剔除失败的语句（缺表等），--no-preflight 关闭
+- 压测期间不重试，过载类错误（TOO_MANY_SIMULTANEOUS_QUERIES 等）按异常码计数
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict
+
+import run_sql_files
+from run_sql_files import (
+    ClickHouseClient, EndpointPool, CLICKHOUSE_ENDPOINTS, ROUTING_POLICY, SELECT_SETTINGS, STMT_SELECT,
+    classify_statement, parse_endpoints, read_sql_statements, scan_sql_files
+)
+
+# 默认参数
+DEFAULT_DURATION = 30        # 每级压力的持续时间（秒）
+DEFAULT_CONCURRENCY = [8]
+DEFAULT_MAX_WORKERS = 256    # 开环模式下最多同时在途的请求数
+DEFAULT_SEED = 42
+
+# 服务端因过载拒绝或中止查询的异常码
+REJECTION_CODES = {
+    202: 'TOO_MANY_SIMULTANEOUS_QUERIES',
+    203: 'NO_FREE_CONNECTION',
+    241: 'MEMORY_LIMIT_EXCEEDED',
+    159: 'TIMEOUT_EXCEEDED',
+    160: 'TOO_SLOW',
+    201: 'QUOTA_EXCEEDED',
+}
+
+# 直方图精度：每个 2 的幂区间分为 2^SUB_BUCKET_BITS 个子桶（相对误差 < 1%）
+SUB_BUCKET_BITS = 7
+REPORT_PERCENTILES = (50, 90, 99, 99.9, 99.99)
+
+
+class LatencyHistogram:
+    """
+    HDR 风格的延迟直方图（微秒）
+
+    值按所在的 2 的幂区间分段，每段再线性分为 2^SUB_BUCKET_BITS 个子桶，
+    在很大的取值范围内保持固定的相对精度，内存只与出现过的桶数有关，可以合并。
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @staticmethod
+    def _bucket(value: int) -> int:
+        """值所在的桶编号（单调递增）"""
+        if value < (1 << SUB_BUCKET_BITS):
+            return value
+        shift = value.bit_length() - SUB_BUCKET_BITS - 1
+        return ((shift + 1) << SUB_BUCKET_BITS) + (value >> shift) - (1 << SUB_BUCKET_BITS)
+
+    @staticmethod
+    def _bucket_upper(bucket: int) -> int:
+        """桶内的最大值"""
+        if bucket < (1 << SUB_BUCKET_BITS):
+            return bucket
+        shift = (bucket >> SUB_BUCKET_BITS) - 1
+        mantissa = (bucket & ((1 << SUB_BUCKET_BITS) - 1)) + (1 << SUB_BUCKET_BITS)
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, seconds: float):
+        """记录一个延迟（秒）"""
+        value = max(0, int(seconds * 1e6))
+        bucket = self._bucket(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.total += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: 'LatencyHistogram'):
+        """合并另一个直方图"""
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p: float) -> float:
+        """百分位数（毫秒），没有样本时为 None"""
+        if not self.total:
+            return None
+        rank = max(1, math.ceil(p / 100 * self.total))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(self._bucket_upper(bucket), self.max) / 1000
+        return self.max / 1000
+
+    def summary(self) -> Dict:
+        """{'count', 'min_ms', 'max_ms', 'p50_ms', ...}"""
+        result = {'count': self.total,
+                  'min_ms': self.min / 1000 if self.min is not None else None,
+                  'max_ms': self.max / 1000 if self.total else None}
+        for p in REPORT_PERCENTILES:
+            result[f"p{p:g}_ms"] = self.percentile(p)
+        return result
+
+
+def collect_statements(paths: List[str], pattern: str = None) -> List[Dict]:
+    """
+    从 SQL 文件中收集只读语句（按规范化文本去重）
+
+    Args:
+        paths: 相对项目根目录的通配符，为空时扫描整个项目
+        pattern: 只保留匹配该正则的语句（可选）
+
+    Returns:
+        [{'file': ..., 'statement': ...}, ...]
+    """
+    root = run_sql_files.PROJECT_ROOT
+    if paths:
+        sql_files = sorted({path for p in paths for path in root.glob(p) if path.suffix == '.sql'})
+    else:
+        sql_files = scan_sql_files(root)
+    regex = re.compile(pattern, re.IGNORECASE) if pattern else None
+
+    statements = []
+    seen = set()
+    for sql_file in sql_files:
+        for stmt in read_sql_statements(sql_file):
+            if classify_statement(stmt) != STMT_SELECT or (regex and not regex.search(stmt)):
+                continue
+            key = ' '.join(stmt.split())
+            if key not in seen:
+                seen.add(key)
+                statements.append({'file': str(sql_file.relative_to(root)), 'statement': stmt})
+    return statements
+
+
+def preflight(client: ClickHouseClient, statements: List[Dict], database: str) -> List[Dict]:
+    """预执行每条语句一次，返回执行成功的语句"""
+    usable = []
+    for item in statements:
+        success, _, _ = client.execute_query_with_stats(item['statement'], database)
+        if success:
+            usable.append(item)
+    return usable
+
+
+class LoadStage:
+    """
+    一级压力的执行状态（所有工作线程共享）
+
+    Args:
+        statements: 重放的语句
+        duration: 持续时间（秒）
+        qps: 目标 QPS（开环模式），None 表示闭环模式
+        seed: 选择语句的随机数种子
+    """
+
+    def __init__(self, statements: List[Dict], duration: float, qps: float = None, seed: int = DEFAULT_SEED):
+        self.statements = statements
+        self.duration = duration
+        self.qps = qps
+        self.start = None
+        self.deadline = None
+        self.histogram = LatencyHistogram()
+        self.service_histogram = LatencyHistogram()
+        self.seconds = [{'completed': 0, 'errors': 0, 'rejected': 0} for _ in range(int(math.ceil(duration)))]
+        self.error_codes = {}
+        self.error_samples = {}
+        self._order = random.Random(seed)
+        self._next = 0
+        self._lock = threading.Lock()
+        self._started = threading.Event()
+
+    def begin(self):
+        """开始计时（工作线程都就绪后调用）"""
+        self.start = time.perf_counter()
+        self.deadline = self.start + self.duration
+        self._started.set()
+
+    def next_request(self):
+        """
+        取下一个请求
+
+        Returns:
+            (语句, 计划发送时间)，时长已到时返回 None
+        """
+        self._started.wait()
+        with self._lock:
+            index = self._next
+            self._next += 1
+            statement = self._order.choice(self.statements)
+        if self.qps:
+            scheduled = self.start + index / self.qps
+            if scheduled >= self.deadline:
+                return None
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            return statement, scheduled
+        now = time.perf_counter()
+        return (statement, now) if now < self.deadline else None
+
+    def record(self, scheduled: float, sent: float, success: bool, stats: Dict, message: str):
+        """记录一个请求的结果"""
+        end = time.perf_counter()
+        second = min(int(end - self.start), len(self.seconds) - 1)
+        with self._lock:
+            bucket = self.seconds[second]
+            if success:
+                bucket['completed'] += 1
+                self.histogram.record(end - scheduled)
+                self.service_histogram.record(end - sent)
+                return
+            bucket['errors'] += 1
+            error = stats.get('error')
+            code = error.code if error is not None and error.code is not None else 'connection'
+            if code in REJECTION_CODES:
+                bucket['rejected'] += 1
+            self.error_codes[code] = self.error_codes.get(code, 0) + 1
+            self.error_samples.setdefault(code, message.strip()[:300])
+
+    def summary(self) -> Dict:
+        """本级压力的统计"""
+        elapsed = max(time.perf_counter(), self.deadline) - self.start
+        completed = sum(s['completed'] for s in self.seconds)
+        errors = sum(s['errors'] for s in self.seconds)
+        return {
+            'target_qps': self.qps,
+            'elapsed': elapsed,
+            'completed': completed,
+            'errors': errors,
+            'rejected': sum(s['rejected'] for s in self.seconds),
+            'achieved_qps': completed / elapsed if elapsed else 0.0,
+            'latency': self.histogram.summary(),
+            'service_time': self.service_histogram.summary(),
+            'error_codes': {str(code): count for code, count in self.error_codes.items()},
+            'error_samples': {str(code): message for code, message in self.error_samples.items()},
+            'throughput': self.seconds,
+        }
+
+
+def run_stage(pool: EndpointPool, stage: LoadStage, workers: int, database: str) -> Dict:
+    """
+    用 workers 个线程执行一级压力
+
+    Args:
+        pool: 节点池（只读语句按路由策略分散到各节点）
+        stage: 压力参数和共享状态
+        workers: 工作线程数（闭环模式下即并发数）
+        database: 语句的默认数据库
+
+    Returns:
+        LoadStage.summary()
+    """
+    def worker():
+        # requests.Session 非线程安全，每个线程一个客户端
+        client = ClickHouseClient(cluster=None, retries=0, pool=pool)
+        while True:
+            request = stage.next_request()
+            if request is None:
+                break
+            item, scheduled = request
+            sent = time.perf_counter()
+            success, result, stats = client.execute_query_with_stats(item['statement'], database)
+            stage.record(scheduled, sent, success, stats, result)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+    # 线程启动需要时间，全部启动后再开始计时，避免开环模式一开始就落后于计划
+    for thread in threads:
+        thread.start()
+    stage.begin()
+    for thread in threads:
+        thread.join()
+    return stage.summary()
+
+
+def print_stage(level: str, result: Dict):
+    """打印一级压力的结果"""
+    def fmt(value):
+        return f"{value:.1f}" if value is not None else '-'
+
+    latency = result['latency']
+    print(f"  {level:>10}  {result['achieved_qps']:>9.1f}  {result['completed']:>8}  {result['errors']:>6}  "
+          f"{result['rejected']:>6}  {fmt(latency['p50_ms']):>8}  {fmt(latency['p90_ms']):>8}  "
+          f"{fmt(latency['p99_ms']):>8}  {fmt(latency['p99.9_ms']):>8}  {fmt(latency['max_ms']):>8}")
+
+
+def print_details(level: str, result: Dict):
+    """打印一级压力的每秒吞吐和错误"""
+    print(f"\n{level}: 每秒完成数 / 错误数")
+    print("  " + ' '.join(f"{s['completed']}/{s['errors']}" for s in result['throughput']))
+    for code, count in sorted(result['error_codes'].items(), key=lambda item: -item[1]):
+        name = REJECTION_CODES.get(int(code), '') if code.isdigit() else ''
+        print(f"  ✗ {code} {name}: {count} 次，例如 {result['error_samples'][code][:150]}")
+
+
+def _float_list(value: str) -> List[float]:
+    return [float(v) for v in value.split(',') if v.strip()]
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="基于示例 SQL 语料的并发压测")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--concurrency', type=_float_list, default=None,
+                      help=f"闭环模式的并发数，逗号分隔时逐级加压（默认 {DEFAULT_CONCURRENCY[0]}）")
+    mode.add_argument('--qps', type=_float_list, default=None,
+                      help="开环模式的目标 QPS，逗号分隔时逐级加压")
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION,
+                        help=f"每级压力的持续时间（秒，默认 {DEFAULT_DURATION}）")
+    parser.add_argument('--max-workers', type=int, default=DEFAULT_MAX_WORKERS,
+                        help=f"开环模式下最多同时在途的请求数（默认 {DEFAULT_MAX_WORKERS}）")
+    parser.add_argument('--paths', default=None,
+                        help="语料 SQL 文件（相对项目根目录，逗号分隔，支持通配符；默认全部 .sql 文件）")
+    parser.add_argument('--filter', default=None, help="只重放匹配该正则的语句")
+    parser.add_argument('--database', default='default', help="语句的默认数据库（默认 default）")
+    parser.add_argument('--endpoints', type=parse_endpoints, default=CLICKHOUSE_ENDPOINTS,
+                        help="压测的节点列表（host:port，逗号分隔），只读语句分散到各节点")
+    parser.add_argument('--routing', choices=['round_robin', 'least_in_flight'], default=ROUTING_POLICY,
+                        help=f"路由策略（默认 {ROUTING_POLICY}）")
+    parser.add_argument('--no-preflight', action='store_true', help="不预执行，保留执行失败的语句")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="选择语句的随机数种子")
+    parser.add_argument('--output', type=Path, default=None, help="结果写入 JSON 文件")
+    args = parser.parse_args()
+    if args.qps is None and args.concurrency is None:
+        args.concurrency = DEFAULT_CONCURRENCY
+    return args
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+
+    print("=" * 80)
+    print("ClickHouse 并发压测")
+    print("=" * 80)
+
+    # 结果丢弃在服务端，只测量查询本身
+    SELECT_SETTINGS.update(default_format='Null', max_result_rows='0', max_result_bytes='0')
+    pool = EndpointPool(args.endpoints, args.routing)
+    client = ClickHouseClient(cluster=None, retries=0, pool=pool)
+    success, version = client.execute_query("SELECT version() FORMAT TabSeparated")
+    if not success:
+        print(f"✗ 连接失败: {version}")
+        sys.exit(1)
+
+    paths = [p.strip() for p in args.paths.split(',') if p.strip()] if args.paths else []
+    statements = collect_statements(paths, args.filter)
+    print(f"ClickHouse {version}，{len(args.endpoints)} 个节点，语料中找到 {len(statements)} 条只读语句")
+    if not args.no_preflight:
+        statements = preflight(client, statements, args.database)
+        print(f"预执行后保留 {len(statements)} 条可以执行的语句")
+    if not statements:
+        sys.exit(1)
+
+    levels = args.qps or args.concurrency
+    unit = 'QPS' if args.qps else '并发'
+    print(f"\n{unit}逐级加压: {', '.join(f'{v:g}' for v in levels)}，每级 {args.duration:g} 秒"
+          f"（延迟单位 ms{'，从计划发送时间开始计算' if args.qps else ''}）")
+    print(f"  {unit:>10}  {'实际 QPS':>9}  {'完成':>8}  {'错误':>6}  {'拒绝':>6}  "
+          f"{'p50':>8}  {'p90':>8}  {'p99':>8}  {'p99.9':>8}  {'max':>8}")
+
+    stages = []
+    for level in levels:
+        stage = LoadStage(statements, args.duration, level if args.qps else None, args.seed)
+        workers = args.max_workers if args.qps else int(level)
+        result = run_stage(pool, stage, workers, args.database)
+        result['concurrency'] = None if args.qps else int(level)
+        stages.append(result)
+        print_stage(f"{level:g}", result)
+
+    for level, result in zip(levels, stages):
+        print_details(f"{unit} {level:g}", result)
+
+    if args.output:
+        report = {'server_version': version, 'endpoints': [f"{h}:{p}" for h, p in args.endpoints],
+                  'mode': 'qps' if args.qps else 'concurrency', 'duration': args.duration,
+                  'statements': len(statements), 'stages': stages}
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f"\n结果已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+本地 ClickHouse HTTP 接口模拟服务器
+
+用于在没有 docker-compose 集群的情况下测试和压测 run_sql_files.py。
+
+使用方法：
+    python mock_clickhouse_server.py --port 8123 --latency-ms 2 --error-rate 0.01
+
+功能：
+1. HTTP/1.1 keep-alive，支持分块请求体和 gzip/zstd 压缩的请求体
+2. 可配置的延迟（固定值 + 随机抖动）
+3. 错误注入：按比例返回指定的 ClickHouse 异常，或对匹配的查询返回语法错误
+4. 返回 X-ClickHouse-Summary / X-ClickHouse-Progress / X-ClickHouse-Query-Id 等响应头
+5. 记录指定了 query_id 的查询，按 startsWith(query_id, '...') 查询 system.query_log 时以 JSONEachRow 返回
+"""
+
+import argparse
+import gzip
+import json
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+from urllib.parse import urlparse, parse_qs
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MOCK_VERSION = "24.8.1.1-mock"
+
+# 常见的 ClickHouse 异常码和名称
+ERROR_NAMES = {
+    62: 'SYNTAX_ERROR',
+    60: 'UNKNOWN_TABLE',
+    81: 'UNKNOWN_DATABASE',
+    159: 'TIMEOUT_EXCEEDED',
+    202: 'TOO_MANY_SIMULTANEOUS_QUERIES',
+    242: 'TABLE_IS_READ_ONLY',
+    999: 'KEEPER_EXCEPTION',
+}
+
+_QUERY_LOG_PREFIX = re.compile(r"system\.query_log.*startsWith\(query_id,\s*'([^']*)'\)", re.DOTALL)
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    """处理单个连接上的请求（同一连接上的请求按顺序处理，支持流水线）"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'ClickHouse'
+    sys_version = ''
+
+    def setup(self):
+        super().setup()
+        # 关闭 Nagle，避免与客户端延迟 ACK 叠加出 40ms 的假延迟
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        # /ping 和 /?query=... 都支持
+        if urlparse(self.path).path == '/ping':
+            self._send(200, b'Ok.\n', {})
+            return
+        self._handle(b'')
+
+    def do_POST(self):
+        self._handle(self._read_body())
+
+    def _read_body(self) -> bytes:
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';', 1)[0].strip(), 16)
+                if size == 0:
+                    while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            body = b''.join(chunks)
+        else:
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        encoding = self.headers.get('Content-Encoding', '').lower()
+        if encoding == 'gzip':
+            body = gzip.decompress(body)
+        elif encoding == 'zstd' and zstandard is not None:
+            body = zstandard.ZstdDecompressor().decompressobj().decompress(body)
+        return body
+
+    def _handle(self, body: bytes):
+        mock = self.server.mock
+        params = {k: v[-1] for k, v in parse_qs(urlparse(self.path).query).items()}
+        query = params.get('query', '')
+        if body:
+            query = f"{query} {body.decode('utf-8', errors='replace')}" if query else body.decode('utf-8', errors='replace')
+
+        query_id = params.get('query_id') or str(uuid.uuid4())
+        status, text, summary = mock.respond(query)
+        if params.get('query_id'):
+            mock.log_query(query_id, status, summary)
+
+        headers = {
+            'X-ClickHouse-Query-Id': query_id,
+            'X-ClickHouse-Server-Display-Name': 'mock',
+            'X-ClickHouse-Summary': json.dumps({k: str(v) for k, v in summary.items()}),
+        }
+        if params.get('send_progress_in_http_headers') == '1':
+            headers['X-ClickHouse-Progress'] = headers['X-ClickHouse-Summary']
+        if status != 200:
+            headers['X-ClickHouse-Exception-Code'] = str(summary.get('exception_code', 0))
+
+        self._send(status, text.encode('utf-8'), headers)
+
+    def _send(self, status: int, payload: bytes, headers: Dict[str, str]):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/tab-separated-values; charset=UTF-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端读够结果后提前断开，相当于取消查询
+            self.close_connection = True
+
+
+class _MockHTTPServer(ThreadingHTTPServer):
+    # 默认的 listen 队列只有 5，压测时大量并发连接会被丢弃并在 1 秒后重发 SYN
+    request_queue_size = 1024
+
+
+class MockClickHouseServer:
+    """
+    进程内的 ClickHouse HTTP 接口模拟服务器
+
+    Args:
+        host: 监听地址
+        port: 监听端口（0 表示随机端口）
+        latency: 每个查询的固定延迟（秒）
+        latency_jitter: 额外的随机延迟上限（秒）
+        error_rate: 随机返回错误的比例（0~1）
+        error_code: 随机错误使用的 ClickHouse 异常码
+        fail_pattern: 匹配该正则的查询总是返回语法错误
+        read_rows: 每个 SELECT 在 Summary 中报告的读取行数
+        result_rows: 每个 SELECT 返回的结果行数
+        seed: 随机数种子（保证可重复）
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 latency_jitter: float = 0.0, error_rate: float = 0.0, error_code: int = 202,
+                 fail_pattern: str = None, read_rows: int = 1000, result_rows: int = 1,
+                 seed: int = None):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.fail_pattern = re.compile(fail_pattern, re.IGNORECASE) if fail_pattern else None
+        self.read_rows = read_rows
+        self.result_rows = result_rows
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.query_log = []
+        self._lock = threading.Lock()
+
+        self.httpd = _MockHTTPServer((host, port), _MockHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self._thread = None
+
+    @property
+    def host(self) -> str:
+        return self.httpd.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def start(self) -> 'MockClickHouseServer':
+        """在后台线程中启动服务器"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务器"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def log_query(self, query_id: str, status: int, summary: Dict):
+        """记录一条 query_log（只记录客户端指定了 query_id 的查询）"""
+        with self._lock:
+            self.query_log.append({
+                'query_id': query_id,
+                'type': 'QueryFinish' if status == 200 else 'ExceptionWhileProcessing',
+                'host': 'mock',
+                'query_duration_ms': summary['elapsed_ns'] // 1000000,
+                'memory_usage': 4096 + summary['read_bytes'],
+                'read_rows': summary['read_rows'],
+                'read_bytes': summary['read_bytes'],
+                'written_rows': summary['written_rows'],
+                'written_bytes': summary['written_bytes'],
+                'result_rows': summary['result_rows'],
+                'result_bytes': summary['result_bytes'],
+                'exception_code': summary.get('exception_code', 0),
+                'ProfileEvents': {'Query': 1, 'RealTimeMicroseconds': summary['elapsed_ns'] // 1000,
+                                  'OSCPUVirtualTimeMicroseconds': summary['elapsed_ns'] // 2000,
+                                  'SelectedRows': summary['read_rows']},
+            })
+
+    def respond(self, query: str):
+        """
+        生成查询的模拟响应
+
+        Returns:
+            (HTTP 状态码, 响应文本, Summary 统计)
+        """
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + (self.random.random() * self.latency_jitter if self.latency_jitter else 0)
+            inject_error = self.error_rate and self.random.random() < self.error_rate
+
+        start = time.perf_counter()
+        if delay:
+            time.sleep(delay)
+
+        summary = {'read_rows': 0, 'read_bytes': 0, 'written_rows': 0, 'written_bytes': 0,
+                   'total_rows_to_read': 0, 'result_rows': 0, 'result_bytes': 0}
+
+        code = None
+        if self.fail_pattern and self.fail_pattern.search(query):
+            code = 62
+        elif inject_error:
+            code = self.error_code
+
+        if code is not None:
+            with self._lock:
+                self.errors += 1
+            name = ERROR_NAMES.get(code, 'UNKNOWN_EXCEPTION')
+            summary['elapsed_ns'] = int((time.perf_counter() - start) * 1e9)
+            summary['exception_code'] = code
+            return 500, f"Code: {code}. DB::Exception: Mock error. ({name}) (version {MOCK_VERSION})\n", summary
+
+        stripped = query.lstrip().upper()
+        query_log = _QUERY_LOG_PREFIX.search(query)
+        if query_log:
+            with self._lock:
+                entries = [e for e in self.query_log if e['query_id'].startswith(query_log.group(1))]
+            text = ''.join(json.dumps(e) + '\n' for e in entries)
+            summary['result_rows'] = len(entries)
+            summary['result_bytes'] = len(text)
+        elif stripped.startswith('SELECT VERSION()'):
+            text = MOCK_VERSION + '\n'
+            summary['result_rows'] = 1
+        elif stripped.startswith(('SELECT', 'WITH', 'SHOW', 'DESCRIBE', 'EXPLAIN')):
+            text = ''.join(f"{i + 1}\n" for i in range(self.result_rows))
+            summary['read_rows'] = self.read_rows
+            summary['read_bytes'] = self.read_rows * 8
+            summary['total_rows_to_read'] = self.read_rows
+            summary['result_rows'] = self.result_rows
+            summary['result_bytes'] = len(text)
+        else:
+            text = ''
+            if stripped.startswith('INSERT'):
+                summary['written_rows'] = max(1, query.count('('))
+                summary['written_bytes'] = len(query)
+
+        summary['elapsed_ns'] = int((time.perf_counter() - start) * 1e9)
+        return 200, text, summary
+
+
+def main():
+    """以独立进程运行模拟服务器"""
+    parser = argparse.ArgumentParser(description="ClickHouse HTTP 接口模拟服务器")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8123)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="每个查询的固定延迟（毫秒）")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="额外的随机延迟上限（毫秒）")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="随机返回错误的比例（0~1）")
+    parser.add_argument('--error-code', type=int, default=202, help="随机错误的 ClickHouse 异常码")
+    parser.add_argument('--fail-pattern', default=None, help="匹配该正则的查询返回语法错误")
+    parser.add_argument('--result-rows', type=int, default=1, help="每个 SELECT 返回的结果行数")
+    args = parser.parse_args()
+
+    server = MockClickHouseServer(args.host, args.port, args.latency_ms / 1000, args.jitter_ms / 1000,
+                                  args.error_rate, args.error_code, args.fail_pattern,
+                                  result_rows=args.result_rows)
+    print(f"模拟 ClickHouse 服务器已启动: http://{server.host}:{server.port}（Ctrl+C 退出）")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+ClickHouse 监控采集器
+
+按固定间隔对每个节点查询系统表，把累计计数器换算为增量和速率，
+写入本地 CSV（安装了 pyarrow 时可选 Parquet）时间序列，用于长时间观察集群状态。
+
+采集查询（COLLECTORS）参考 13-monitor 中的文档查询编写，但是独立维护：
+为了合并成一个查询并统一输出 (名称, 值)，它们只取文档查询中的部分指标并改写了输出格式，
+不会随 13-monitor 中的 .sql 文件自动更新，修改文档查询时需要同时检查这里。
+
+使用方法：
+    python monitor_collector.py --endpoints node1:8123,node2:8123 --interval 10
+    python monitor_collector.py --collectors events,metrics,query_profile_events --duration 3600
+    python monitor_collector.py --format parquet --output-dir monitoring
+
+采集项（COLLECTORS，--collectors 选择；括号内为参考的文档）：
+- events               system.events 累计计数器（服务端 ProfileEvents 总量），记录增量和每秒速率
+- metrics              system.metrics 当前值（CurrentMetrics，如正在执行的查询数、合并数）
+- cpu_memory           system.asynchronous_metrics 中的 CPU 和内存指标（01_system_monitoring_queries.sql）
+- disks                system.disks 空间使用（同上）
+- parts                每个表的活跃分区片段数和磁盘占用（同上）
+- replicas             副本队列长度、延迟、只读状态（同上）
+- query_profile_events 按用户汇总的 query_log ProfileEvents（CPU 时间、读取行数等，top_cpu_queries.md），
+                       每个间隔只统计该间隔内结束的查询
+
+采集方式：
+1. 每个间隔对每个节点只发送一个查询：所选采集项以 UNION ALL 合并，统一输出 (采集项, 名称, 值)，
+   在 system.query_log 中也只产生一条记录，采集器本身不会成为负载来源
+2. 启动时对每个节点逐项试探一次，节点上不可用的采集项（如没有 query_log）不参与合并
+3. 各节点并发采集；上一次采集超时未完成时跳过错过的间隔，不堆积
+4. query_log 按 flush_interval_milliseconds 批量写入，query_profile_events 统计的时间窗口
+   整体后移 QUERY_LOG_LAG 秒，避免漏掉尚未落盘的查询；时间以服务端时钟为准
+
+输出（长表格式，每天一个文件 monitor_YYYYMMDD.csv / .parquet）：
+    timestamp, node, collector, name, value, delta, rate
+- 计数器：第一次采集只建立基线；之后只写入有变化的项，delta 为增量，rate 为每秒速率；
+  计数器变小（服务重启）时以当前值作为增量
+- 当前值：第一次全部写入，之后只写入与上次不同的项（没有记录表示值未变化）
+"""
+
+import argparse
+import csv
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Tuple
+
+import run_sql_files
+from run_sql_files import ClickHouseClient, CLICKHOUSE_ENDPOINTS, SELECT_SETTINGS, parse_endpoints
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# 默认参数
+DEFAULT_INTERVAL = 10          # 采集间隔（秒）
+QUERY_LOG_LAG = 10             # query_log 统计窗口后移的秒数（大于 flush_interval_milliseconds）
+PARQUET_ROW_GROUP_ROWS = 50000 # Parquet 每个行组的行数（行数不足时在退出或换天时写入）
+
+KIND_COUNTER = 'counter'   # 累计值，记录增量
+KIND_GAUGE = 'gauge'       # 当前值
+KIND_WINDOW = 'window'     # 查询本身按时间窗口统计，结果即为增量
+
+# 每个采集项输出 metric_name (String) 和 metric_value 两列；window 类型的 $since / $until 为毫秒时间戳表达式
+COLLECTORS = {
+    'events': {
+        'kind': KIND_COUNTER,
+        'sql': "SELECT event AS metric_name, value AS metric_value FROM system.events",
+    },
+    'metrics': {
+        'kind': KIND_GAUGE,
+        'sql': "SELECT metric AS metric_name, value AS metric_value FROM system.metrics",
+    },
+    'cpu_memory': {
+        'kind': KIND_GAUGE,
+        'sql': "SELECT metric AS metric_name, value AS metric_value FROM system.asynchronous_metrics "
+               "WHERE metric LIKE 'OSCPU%' OR metric LIKE 'OSMemory%' "
+               "OR metric IN ('MemoryResident', 'LoadAverage1', 'LoadAverage5', 'LoadAverage15')",
+    },
+    'disks': {
+        'kind': KIND_GAUGE,
+        'sql': "SELECT concat(name, '.', field) AS metric_name, metric_value FROM system.disks "
+               "ARRAY JOIN ['total_space', 'free_space', 'keep_free_space'] AS field, "
+               "[toFloat64(total_space), toFloat64(free_space), toFloat64(keep_free_space)] AS metric_value",
+    },
+    'parts': {
+        'kind': KIND_GAUGE,
+        'sql': "SELECT concat(database, '.', table, '.', field) AS metric_name, metric_value FROM ("
+               "SELECT database, table, count() AS part_count, sum(bytes_on_disk) AS bytes_on_disk "
+               "FROM system.parts WHERE active = 1 GROUP BY database, table) "
+               "ARRAY JOIN ['part_count', 'bytes_on_disk'] AS field, "
+               "[toFloat64(part_count), toFloat64(bytes_on_disk)] AS metric_value",
+    },
+    'replicas': {
+        'kind': KIND_GAUGE,
+        'sql': "SELECT concat(database, '.', table, '.', field) AS metric_name, metric_value FROM system.replicas "
+               "ARRAY JOIN ['queue_size', 'absolute_delay', 'is_readonly', 'is_session_expired'] AS field, "
+               "[toFloat64(queue_size), toFloat64(absolute_delay), toFloat64(is_readonly), "
+               "toFloat64(is_session_expired)] AS metric_value",
+    },
+    'query_profile_events': {
+        'kind': KIND_WINDOW,
+        'sql': "SELECT concat(user, '.', field) AS metric_name, metric_value FROM ("
+               "SELECT user, count() AS queries, "
+               "sum(ProfileEvents['OSCPUVirtualTimeMicroseconds']) AS cpu_us, "
+               "sum(ProfileEvents['UserTimeMicroseconds']) AS user_time_us, "
+               "sum(ProfileEvents['SystemTimeMicroseconds']) AS system_time_us, "
+               "sum(query_duration_ms) AS duration_ms, sum(read_rows) AS read_rows, "
+               "sum(read_bytes) AS read_bytes, sum(memory_usage) AS memory_usage "
+               "FROM system.query_log "
+               "WHERE event_date >= yesterday() AND type != 'QueryStart' "
+               "AND event_time_microseconds >= fromUnixTimestamp64Milli(toInt64($since)) "
+               "AND event_time_microseconds < fromUnixTimestamp64Milli(toInt64($until)) "
+               "GROUP BY user) "
+               "ARRAY JOIN ['queries', 'cpu_us', 'user_time_us', 'system_time_us', 'duration_ms', "
+               "'read_rows', 'read_bytes', 'memory_usage'] AS field, "
+               "[toFloat64(queries), toFloat64(cpu_us), toFloat64(user_time_us), toFloat64(system_time_us), "
+               "toFloat64(duration_ms), toFloat64(read_rows), toFloat64(read_bytes), "
+               "toFloat64(memory_usage)] AS metric_value",
+    },
+}
+
+# 合并查询中 collector 为空的一行：服务端当前时间（毫秒）
+_TIME_ROW = "SELECT '' AS collector, '' AS name, toFloat64(toUnixTimestamp64Milli(now64(3))) AS value"
+
+OUTPUT_COLUMNS = ['timestamp', 'node', 'collector', 'name', 'value', 'delta', 'rate']
+
+
+def build_collect_query(collectors: List[str], since_ms: float = None) -> str:
+    """
+    把多个采集项合并为一个查询
+
+    window 类型采集项的窗口终点为服务端当前时间减 QUERY_LOG_LAG 秒
+    （now64() 在一个查询内取值相同，与第一行的服务端时间一致）。
+
+    Args:
+        collectors: 采集项名称
+        since_ms: window 类型采集项的窗口起点（服务端毫秒时间戳），为 None 时不包含这些采集项
+
+    Returns:
+        输出 (collector, name, value) 的 SQL，其中 collector 为空的一行是服务端时间
+    """
+    parts = [_TIME_ROW]
+    for name in collectors:
+        collector = COLLECTORS[name]
+        if collector['kind'] == KIND_WINDOW:
+            if since_ms is None:
+                continue
+            until = f"toUnixTimestamp64Milli(now64(3)) - {int(QUERY_LOG_LAG * 1000)}"
+            sql = collector['sql'].replace('$since', str(int(since_ms))).replace('$until', until)
+        else:
+            sql = collector['sql']
+        parts.append(f"SELECT '{name}' AS collector, toString(metric_name) AS name, toFloat64(metric_value) AS value "
+                     f"FROM ({sql})")
+    return '\nUNION ALL\n'.join(parts) + '\nFORMAT TabSeparated'
+
+
+def parse_collect_result(text: str) -> Tuple[float, List[Tuple[str, str, float]]]:
+    """
+    解析合并查询的结果
+
+    Returns:
+        (服务端时间毫秒, [(collector, name, value), ...])
+    """
+    server_ms = None
+    rows = []
+    for line in text.split('\n'):
+        if not line:
+            continue
+        collector, name, value = line.split('\t')
+        if not collector:
+            server_ms = float(value)
+        else:
+            rows.append((collector, name, float(value)))
+    return server_ms, rows
+
+
+class NodeCollector:
+    """
+    一个节点的采集状态
+
+    Args:
+        endpoint: (host, port)
+        collectors: 要采集的项
+    """
+
+    def __init__(self, endpoint: Tuple[str, int], collectors: List[str]):
+        self.endpoint = endpoint
+        self.node = f"{endpoint[0]}:{endpoint[1]}"
+        self.client = ClickHouseClient(endpoint[0], endpoint[1], cluster=None, retries=0)
+        self.collectors = list(collectors)
+        self.server_ms = None
+        self.window_ms = None
+        self.last = {}
+
+    def probe(self) -> Dict[str, str]:
+        """
+        逐项试探采集项，去掉节点上不可用的项
+
+        Returns:
+            {不可用的采集项: 错误信息}
+        """
+        unavailable = {}
+        now_ms = time.time() * 1000
+        for name in list(self.collectors):
+            query = build_collect_query([name], now_ms - QUERY_LOG_LAG * 1000)
+            success, result = self.client.execute_query(query, 'system')
+            if not success:
+                unavailable[name] = result
+                self.collectors.remove(name)
+        return unavailable
+
+    def collect(self) -> List[Dict]:
+        """
+        采集一次并计算增量
+
+        Returns:
+            要写入的行（OUTPUT_COLUMNS）
+        """
+        query = build_collect_query(self.collectors, self.window_ms)
+        success, result = self.client.execute_query(query, 'system')
+        if not success:
+            raise RuntimeError(result)
+        server_ms, rows = parse_collect_result(result)
+
+        interval = (server_ms - self.server_ms) / 1000 if self.server_ms is not None else None
+        until_ms = server_ms - QUERY_LOG_LAG * 1000
+        window = (until_ms - self.window_ms) / 1000 if self.window_ms is not None else None
+        timestamp = datetime.fromtimestamp(server_ms / 1000).isoformat(timespec='milliseconds')
+        output = []
+        for collector, name, value in rows:
+            kind = COLLECTORS[collector]['kind']
+            row = {'timestamp': timestamp, 'node': self.node, 'collector': collector,
+                   'name': name, 'value': value, 'delta': None, 'rate': None}
+            key = (collector, name)
+            previous = self.last.get(key)
+            if kind == KIND_COUNTER:
+                self.last[key] = value
+                if interval is None:
+                    continue
+                delta = value - previous if previous is not None and value >= previous else value
+                if not delta:
+                    continue
+                row.update(delta=delta, rate=delta / interval if interval > 0 else None)
+            elif kind == KIND_WINDOW:
+                if not value:
+                    continue
+                row.update(delta=value, rate=value / window if window else None)
+            else:
+                if previous == value:
+                    continue
+                self.last[key] = value
+            output.append(row)
+
+        # 下一次 query_log 窗口从本次窗口的终点开始（首次采集不统计，只确定起点）
+        self.window_ms = until_ms
+        self.server_ms = server_ms
+        return output
+
+
+class TimeSeriesWriter:
+    """
+    时间序列文件写入（每天一个文件）
+
+    Args:
+        output_dir: 输出目录
+        file_format: 'csv' 或 'parquet'（需要 pyarrow）
+    """
+
+    def __init__(self, output_dir: Path, file_format: str = 'csv'):
+        output_dir.mkdir(parents=True, exist_ok=True)
+        self.output_dir = output_dir
+        self.format = file_format
+        self.day = None
+        self._file = None
+        self._csv = None
+        self._parquet = None
+        self._buffer = []
+        self.rows = 0
+
+    def write(self, rows: List[Dict]):
+        """写入一批行（CSV 立即落盘，Parquet 攒满一个行组后写入）"""
+        self.rows += len(rows)
+        for row in rows:
+            day = row['timestamp'][:10].replace('-', '')
+            if day != self.day:
+                self._open(day)
+            if self.format == 'csv':
+                self._csv.writerow(row)
+            else:
+                self._buffer.append(row)
+        if self.format == 'csv':
+            if self._file:
+                self._file.flush()
+        elif len(self._buffer) >= PARQUET_ROW_GROUP_ROWS:
+            self._flush_parquet()
+
+    def close(self):
+        """写入剩余数据并关闭文件"""
+        if self.format == 'parquet':
+            self._flush_parquet()
+            if self._parquet:
+                self._parquet.close()
+        elif self._file:
+            self._file.close()
+
+    def _open(self, day: str):
+        """换到新的一天的文件"""
+        self.close()
+        self.day = day
+        path = self.output_dir / f"monitor_{day}.{self.format}"
+        if self.format == 'csv':
+            new = not path.exists()
+            self._file = open(path, 'a', encoding='utf-8', newline='')
+            self._csv = csv.DictWriter(self._file, OUTPUT_COLUMNS)
+            if new:
+                self._csv.writeheader()
+        else:
+            # Parquet 文件不能追加，同一天重新启动时写入新的文件
+            if path.exists():
+                path = self.output_dir / f"monitor_{day}_{datetime.now().strftime('%H%M%S')}.parquet"
+            schema = pyarrow.schema([('timestamp', pyarrow.string()), ('node', pyarrow.string()),
+                                     ('collector', pyarrow.string()), ('name', pyarrow.string()),
+                                     ('value', pyarrow.float64()), ('delta', pyarrow.float64()),
+                                     ('rate', pyarrow.float64())])
+            self._parquet = pyarrow.parquet.ParquetWriter(str(path), schema, compression='zstd')
+
+    def _flush_parquet(self):
+        if self._buffer and self._parquet:
+            table = pyarrow.Table.from_pylist(self._buffer, schema=self._parquet.schema)
+            self._parquet.write_table(table)
+        self._buffer = []
+
+
+def run_collector(nodes: List[NodeCollector], writer: TimeSeriesWriter, interval: float,
+                  duration: float = 0, verbose: bool = True):
+    """
+    按固定间隔采集所有节点
+
+    Args:
+        nodes: 各节点的采集状态
+        writer: 输出
+        interval: 采集间隔（秒）
+        duration: 运行时长（秒，0 表示直到中断）
+        verbose: 打印每次采集的摘要
+    """
+    start = time.monotonic()
+    tick = 0
+    with ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+        while not duration or time.monotonic() - start < duration:
+            futures = [(node, executor.submit(node.collect)) for node in nodes]
+            summary = []
+            for node, future in futures:
+                try:
+                    rows = future.result()
+                except Exception as e:
+                    summary.append(f"{node.node} ✗ {str(e)[:100]}")
+                    continue
+                writer.write(rows)
+                summary.append(f"{node.node} {len(rows)}")
+            if verbose:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] {', '.join(summary)}")
+
+            # 对齐到固定的间隔，采集耗时超过间隔时跳过错过的间隔
+            elapsed = time.monotonic() - start
+            tick = max(tick + 1, int(elapsed // interval) + 1)
+            next_time = tick * interval
+            if duration and next_time >= duration:
+                break
+            time.sleep(max(0.0, next_time - elapsed))
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="ClickHouse 监控采集器")
+    parser.add_argument('--endpoints', type=parse_endpoints, default=CLICKHOUSE_ENDPOINTS,
+                        help="要采集的节点列表（host:port，逗号分隔）")
+    parser.add_argument('--collectors', default=','.join(COLLECTORS),
+                        help=f"采集项，逗号分隔（默认全部: {', '.join(COLLECTORS)}）")
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                        help=f"采集间隔（秒，默认 {DEFAULT_INTERVAL}）")
+    parser.add_argument('--duration', type=float, default=0, help="运行时长（秒，默认直到 Ctrl+C）")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help="输出格式（默认 csv）")
+    parser.add_argument('--output-dir', type=Path, default=None,
+                        help="输出目录（默认 00-infra/execution_results/monitoring）")
+    parser.add_argument('--quiet', action='store_true', help="不打印每次采集的摘要")
+    args = parser.parse_args()
+    args.collectors = [c.strip() for c in args.collectors.split(',') if c.strip()]
+    unknown = [c for c in args.collectors if c not in COLLECTORS]
+    if unknown:
+        parser.error(f"未知的采集项: {', '.join(unknown)}")
+    if args.format == 'parquet' and pyarrow is None:
+        parser.error("Parquet 输出需要安装 pyarrow（pip install pyarrow）")
+    return args
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+
+    print("=" * 80)
+    print("ClickHouse 监控采集器")
+    print("=" * 80)
+
+    # 结果需要完整读取，不使用示例执行时的结果上限
+    SELECT_SETTINGS.update(max_result_rows='0', max_result_bytes='0')
+    run_sql_files.RESULT_CAPTURE_BYTES = run_sql_files.RESULT_CAPTURE_ROWS = 0
+
+    nodes = []
+    for endpoint in args.endpoints:
+        node = NodeCollector(endpoint, args.collectors)
+        unavailable = node.probe()
+        for name, error in unavailable.items():
+            print(f"  ⚠ {node.node} 不采集 {name}: {error[:150]}")
+        print(f"  ✓ {node.node}: {', '.join(node.collectors) or '（没有可用的采集项）'}")
+        nodes.append(node)
+
+    output_dir = args.output_dir or run_sql_files.PROJECT_ROOT / "00-infra" / "execution_results" / "monitoring"
+    writer = TimeSeriesWriter(output_dir, args.format)
+    print(f"\n每 {args.interval:g} 秒采集 {len(nodes)} 个节点，写入 {output_dir}（{args.format}）")
+    try:
+        run_collector(nodes, writer, args.interval, args.duration, not args.quiet)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+    print(f"\n共写入 {writer.rows} 行")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+执行历史查看和性能回退检测
+
+run_sql_files.py 每次执行后把每条语句的耗时（优先使用服务端耗时）和服务端统计
+记录到 execution_results/run_history.sqlite（按语句哈希和服务端版本区分）。
+本工具比较两次执行，或把一次执行与最近若干次执行组成的滚动基线比较，
+发现显著变慢的语句时返回非零退出码，可以直接用于 CI。
+
+使用方法：
+    python run_history.py list
+    python run_history.py compare                         # 最新一次 vs 之前 5 次（同一服务端版本）
+    python run_history.py compare --run 12 --against 10   # 两次执行比较
+    python run_history.py compare --baseline-version 24.3.2.23 --baseline-runs 3   # 版本升级前后比较
+
+判定规则（同时满足才算回退）：
+1. 比基线中位数慢 --tolerance 以上，且绝对差值不小于 --min-ms（忽略毫秒级噪声）
+2. 基线至少有 3 个样本时，还要求超出基线中位数 --z 倍的 MAD（中位数绝对偏差），
+   即超出该语句平时的波动范围
+另外对所有共同语句做符号检验：变慢的语句数显著多于变快的（p < --alpha）时，
+即使单条语句都未超过阈值，也视为整体回退。
+"""
+
+import argparse
+import math
+import sys
+from pathlib import Path
+from statistics import median
+from typing import List, Dict
+
+import run_sql_files
+from run_sql_files import RunHistory
+
+# 默认参数
+DEFAULT_BASELINE_RUNS = 5
+DEFAULT_TOLERANCE = 0.2    # 比基线慢 20% 以上
+DEFAULT_MIN_MS = 5.0       # 差值小于 5ms 的视为噪声
+DEFAULT_Z = 3.0            # 超出基线 3 倍 MAD
+DEFAULT_ALPHA = 0.01       # 符号检验显著性水平
+MIN_SIGN_TEST_STATEMENTS = 10
+MAD_SCALE = 1.4826         # 正态分布下 MAD 与标准差的换算系数
+
+
+def default_history_path() -> Path:
+    return run_sql_files.PROJECT_ROOT / "00-infra" / "execution_results" / "run_history.sqlite"
+
+
+def sign_test_p_value(slower: int, faster: int) -> float:
+    """单侧符号检验：无变化假设下至少有 slower 条语句变慢的概率"""
+    n = slower + faster
+    if n == 0:
+        return 1.0
+    return sum(math.comb(n, k) for k in range(slower, n + 1)) / 2 ** n
+
+
+def compare_runs(history: RunHistory, run_id: int, baseline_ids: List[int],
+                 tolerance: float = DEFAULT_TOLERANCE, min_ms: float = DEFAULT_MIN_MS,
+                 z: float = DEFAULT_Z, alpha: float = DEFAULT_ALPHA) -> Dict:
+    """
+    比较一次执行与基线
+
+    Args:
+        history: 执行历史
+        run_id: 要检查的执行
+        baseline_ids: 基线执行（一次或多次）
+        tolerance: 允许的变慢比例
+        min_ms: 忽略的绝对差值（毫秒）
+        z: 基线样本足够时要求超出的 MAD 倍数
+        alpha: 符号检验显著性水平
+
+    Returns:
+        {'regressions': [...], 'improvements': int, 'compared': int, 'slower': int, 'faster': int,
+         'p_value': float, 'geomean_ratio': float, 'significant': bool}
+    """
+    samples = history.statement_samples([run_id] + baseline_ids)
+    regressions = []
+    slower = faster = compared = improvements = 0
+    log_ratio_sum = 0.0
+
+    for stmt_hash, item in samples.items():
+        current = item['runs'].get(run_id)
+        baseline_runs = [item['runs'][r] for r in baseline_ids if r in item['runs']]
+        if not current or not baseline_runs:
+            continue
+        # 多次基线执行时每次取中位数作为一个样本；只有一次时使用该次的全部样本
+        base_samples = [median(v) for v in baseline_runs] if len(baseline_runs) > 1 else baseline_runs[0]
+        base = median(base_samples)
+        value = median(current)
+        compared += 1
+
+        diff = value - base
+        if abs(diff) >= min_ms:
+            if diff > 0:
+                slower += 1
+            else:
+                faster += 1
+        if base > 0 and value > 0:
+            log_ratio_sum += math.log(value / base)
+
+        if diff < min_ms or value < base * (1 + tolerance):
+            if -diff >= min_ms and value <= base / (1 + tolerance):
+                improvements += 1
+            continue
+        mad = median(abs(x - base) for x in base_samples) * MAD_SCALE if len(base_samples) >= 3 else 0.0
+        if mad and diff < z * mad:
+            # 在该语句平时的波动范围内
+            continue
+
+        base_bytes = [b for r in baseline_ids for b in item['read_bytes'].get(r, [])]
+        regressions.append({
+            'file': item['file'],
+            'statement': item['statement'],
+            'baseline_ms': base,
+            'current_ms': value,
+            'ratio': value / base if base else float('inf'),
+            'mad_ms': mad,
+            'read_bytes_ratio': (median(item['read_bytes'][run_id]) / median(base_bytes)
+                                 if base_bytes and median(base_bytes) else None),
+        })
+
+    regressions.sort(key=lambda r: r['ratio'], reverse=True)
+    p_value = sign_test_p_value(slower, faster)
+    return {
+        'regressions': regressions,
+        'improvements': improvements,
+        'compared': compared,
+        'slower': slower,
+        'faster': faster,
+        'p_value': p_value,
+        'geomean_ratio': math.exp(log_ratio_sum / compared) if compared else 1.0,
+        'significant': slower + faster >= MIN_SIGN_TEST_STATEMENTS and p_value < alpha,
+    }
+
+
+def cmd_list(history: RunHistory, args) -> int:
+    """列出最近的执行"""
+    print(f"  {'run':>5}  {'开始时间':<26}  {'服务端版本':<20}  {'语句数':>6}  {'失败':>5}")
+    for run in history.runs(args.limit):
+        print(f"  {run['run_id']:>5}  {run['started_at']:<26}  {run['server_version']:<20}  "
+              f"{run['statements']:>6}  {run['errors']:>5}")
+    return 0
+
+
+def cmd_compare(history: RunHistory, args) -> int:
+    """比较执行，发现回退时返回 1"""
+    if args.run is None:
+        latest = history.runs(1)
+        if not latest:
+            print("✗ 没有执行历史")
+            return 2
+        current = latest[0]
+    else:
+        current = next((r for r in history.runs(1, before=args.run + 1) if r['run_id'] == args.run), None)
+        if current is None:
+            print(f"✗ 找不到执行 #{args.run}")
+            return 2
+
+    if args.against is not None:
+        baseline_ids = [args.against]
+    else:
+        version = args.baseline_version or current['server_version']
+        baseline_ids = [r['run_id'] for r in history.runs(args.baseline_runs, version, before=current['run_id'])]
+    if not baseline_ids:
+        print(f"✗ 执行 #{current['run_id']} 之前没有可用的基线执行")
+        return 2
+
+    print(f"执行 #{current['run_id']}（{current['server_version']}，{current['started_at']}）"
+          f" vs 基线 {', '.join(f'#{r}' for r in baseline_ids)}")
+    report = compare_runs(history, current['run_id'], baseline_ids,
+                          args.tolerance, args.min_ms, args.z, args.alpha)
+
+    print(f"共同语句: {report['compared']}，变慢 {report['slower']} / 变快 {report['faster']}"
+          f"（差值 ≥ {args.min_ms} ms），耗时几何平均比值 {report['geomean_ratio']:.3f}，"
+          f"符号检验 p = {report['p_value']:.4g}")
+    print(f"明显变快的语句: {report['improvements']}")
+
+    regressions = report['regressions']
+    if regressions:
+        print(f"\n✗ 发现 {len(regressions)} 条语句性能回退（容差 {args.tolerance:.0%}）:")
+        print(f"  {'比值':>7}  {'基线 ms':>10}  {'本次 ms':>10}  {'读取字节比':>8}  文件 / 语句")
+        for r in regressions[:args.top]:
+            bytes_ratio = f"{r['read_bytes_ratio']:.2f}" if r['read_bytes_ratio'] is not None else '-'
+            statement = ' '.join(r['statement'].split())
+            print(f"  {r['ratio']:>6.2f}x  {r['baseline_ms']:>10.1f}  {r['current_ms']:>10.1f}  "
+                  f"{bytes_ratio:>10}  {r['file']}: {statement[:80]}")
+        if len(regressions) > args.top:
+            print(f"  ...（另有 {len(regressions) - args.top} 条）")
+    if report['significant']:
+        print(f"\n✗ 整体性能回退：变慢的语句显著多于变快的（p < {args.alpha}）")
+    if regressions or report['significant']:
+        return 1
+    print("\n✓ 没有发现性能回退")
+    return 0
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="执行历史查看和性能回退检测")
+    parser.add_argument('--history', type=Path, default=None,
+                        help="执行历史文件（默认 execution_results/run_history.sqlite）")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    list_parser = commands.add_parser('list', help="列出最近的执行")
+    list_parser.add_argument('--limit', type=int, default=20, help="显示的条数（默认 20）")
+
+    compare = commands.add_parser('compare', help="与另一次执行或滚动基线比较，有回退时返回非零退出码")
+    compare.add_argument('--run', type=int, default=None, help="要检查的执行（默认最新一次）")
+    compare.add_argument('--against', type=int, default=None, help="与指定的一次执行比较（不使用滚动基线）")
+    compare.add_argument('--baseline-runs', type=int, default=DEFAULT_BASELINE_RUNS,
+                         help=f"滚动基线包含的执行次数（默认 {DEFAULT_BASELINE_RUNS}）")
+    compare.add_argument('--baseline-version', default=None,
+                         help="滚动基线使用该服务端版本的执行（默认与本次相同；用于比较版本升级）")
+    compare.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                         help=f"允许的变慢比例（默认 {DEFAULT_TOLERANCE}）")
+    compare.add_argument('--min-ms', type=float, default=DEFAULT_MIN_MS,
+                         help=f"忽略小于该值的耗时差（毫秒，默认 {DEFAULT_MIN_MS}）")
+    compare.add_argument('--z', type=float, default=DEFAULT_Z,
+                         help=f"基线样本足够时要求超出的 MAD 倍数（默认 {DEFAULT_Z}）")
+    compare.add_argument('--alpha', type=float, default=DEFAULT_ALPHA,
+                         help=f"整体符号检验的显著性水平（默认 {DEFAULT_ALPHA}）")
+    compare.add_argument('--top', type=int, default=30, help="最多显示的回退语句数（默认 30）")
+    return parser.parse_args()
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+    path = args.history or default_history_path()
+    if not path.exists():
+        print(f"✗ 执行历史不存在: {path}")
+        sys.exit(2)
+
+    history = RunHistory(path)
+    try:
+        handler = cmd_list if args.command == 'list' else cmd_compare
+        sys.exit(handler(history, args))
+    finally:
+        history.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -9,17 +9,36 @@ ClickHouse SQL 文件扫描和执行工具
 4. 自动重试失败的查询
 """
 
+import fnmatch
+import hashlib
+import http.client
+import io
 import os
+import random
 import re
+import socket
+import sqlite3
 import subprocess
 import sys
+import argparse
+import threading
+from functools import partial
 from pathlib import Path
+from string import Template
+from urllib.parse import urlencode
 from datetime import datetime
 import json
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Set, Callable, Iterable, Iterator, TextIO
 import time
+import zlib
 import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib3.exceptions import NewConnectionError
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 # 配置
 PROJECT_ROOT = Path(r"d:\workspace\superset-github\clickhouse-doc")
@@ -29,17 +48,668 @@ CLICKHOUSE_USER = "default"
 CLICKHOUSE_PASSWORD = ""
 CLICKHOUSE_CLUSTER = "treasurycluster"
 
+# 集群各节点的 HTTP 接口（docker-compose 中 clickhouse1 映射到 8123，clickhouse2 映射到 8124），
+# 也可以用 --endpoints localhost:8123,localhost:8124 指定
+CLICKHOUSE_ENDPOINTS = [(CLICKHOUSE_HOST, CLICKHOUSE_PORT)]
+# 只读语句在多个节点间的路由策略：'round_robin'（轮询）或 'least_in_flight'（最少在途请求）
+ROUTING_POLICY = 'round_robin'
+# 节点连续连接失败多少次后摘除，摘除多久后重新探测（秒）
+EJECT_AFTER_FAILURES = 3
+EJECT_DURATION = 30
+# 健康检查（/ping）超时（秒）
+HEALTH_CHECK_TIMEOUT = 2
+
+# 连接超时和读取超时（秒）
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 300  # 5 分钟超时
+
+# 流水线批量执行：单批请求的最大字节数
+PIPELINE_MAX_BYTES = 256 * 1024
+# 流水线中已发送但还没有读到响应的请求数上限
+PIPELINE_MAX_IN_FLIGHT = 16
+
+# 请求体压缩方式：None / 'gzip' / 'zstd'（zstd 需要安装 zstandard）
+HTTP_COMPRESSION = None
+# 请求体流式发送时每块的字符数
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# 每个集群的查询速率上限（每秒查询数），未配置或为 0 表示不限速
+CLUSTER_RATE_LIMITS = {
+    CLICKHOUSE_CLUSTER: 0,
+}
+
+# 只读查询（SELECT/SHOW/DESCRIBE 等）的附加设置：只读模式，结果行数/字节数上限（超出时截断而不是报错）。
+# readonly=2 而不是 1：readonly=1 不允许修改设置，会让带 SETTINGS 子句的示例查询和上面的上限本身都失败。
+# default_format 可改为 RowBinary / Native 以减少传输量，此时报告中只记录结果大小
+SELECT_SETTINGS = {
+    'readonly': '2',
+    'max_result_rows': '10000',
+    'max_result_bytes': str(10 * 1024 * 1024),
+    'result_overflow_mode': 'break',
+    'default_format': 'TabSeparated',
+    # 客户端读够结果提前断开时，服务端取消查询
+    'cancel_http_readonly_queries_on_client_close': '1',
+}
+# 每条语句最多读取的响应字节数和行数（0 表示不限），读满后断开连接，不再下载剩余结果
+RESULT_CAPTURE_BYTES = 64 * 1024
+RESULT_CAPTURE_ROWS = 100
+# 读取响应的块大小
+RESPONSE_CHUNK_SIZE = 16 * 1024
+
+# 性能分析（--profile）：每条语句的 query_id 前缀，执行结束后按前缀从 system.query_log 批量取回统计
+QUERY_ID_PREFIX = 'chdoc'
+# HTML 报告详情中显示的 ProfileEvents（JSON 报告保留全部）
+REPORT_PROFILE_EVENTS = (
+    'RealTimeMicroseconds', 'OSCPUVirtualTimeMicroseconds', 'UserTimeMicroseconds', 'SystemTimeMicroseconds',
+    'SelectedParts', 'SelectedRanges', 'SelectedMarks', 'SelectedRows', 'SelectedBytes',
+    'MarkCacheHits', 'MarkCacheMisses', 'ReadCompressedBytes', 'DiskReadElapsedMicroseconds',
+    'NetworkSendBytes', 'NetworkReceiveBytes', 'ExternalSortWritePart', 'ExternalAggregationWritePart',
+)
+
+# 沙箱模式（--sandbox）：每个文件使用独立的临时数据库，库名前缀和批量建库/删库时每批的语句数
+SANDBOX_PREFIX = 'sandbox'
+SANDBOX_DDL_BATCH = 100
+
+# 数据生成（--datagen）：为性能示例读取的表在服务端用 numbers() 生成数据
+DATAGEN_FILES = (
+    '11-performance/02_primary_indexes_examples.sql',
+    '11-performance/04_skipping_indexes_examples.sql',
+    '11-performance/05_prewhere_optimization_examples.sql',
+    '11-performance/06_bulk_inserts_examples.sql',
+)
+DATAGEN_CHUNK_ROWS = 10_000_000      # 每个 INSERT ... SELECT 生成的行数
+DATAGEN_TIME_RANGE_DAYS = 90         # 时间列分布在最近 90 天内
+DATAGEN_CARDINALITY = 1_000_000      # 外键类 *_id 列和普通字符串列的不同值个数
+DATAGEN_ENGINES = ('MergeTree', 'Memory', 'Log')   # 只向这些引擎（后缀匹配）的表生成数据
+# 常用的枚举型字符串列使用示例查询中出现的取值
+DATAGEN_STRING_VALUES = {
+    'event_type': ['click', 'view', 'purchase', 'login', 'logout', 'search'],
+    'status': ['active', 'inactive', 'pending', 'completed', 'cancelled'],
+    'country': ['CN', 'US', 'JP', 'DE', 'GB', 'FR', 'IN', 'BR'],
+    'device': ['mobile', 'desktop', 'tablet'],
+    'device_type': ['mobile', 'desktop', 'tablet'],
+    'level': ['DEBUG', 'INFO', 'WARN', 'ERROR'],
+}
+
+# 不能按文本显示的输出格式（前缀匹配）
+BINARY_FORMATS = ('RowBinary', 'Native', 'Parquet', 'Arrow', 'ORC', 'Avro', 'MsgPack', 'Protobuf', 'CapnProto')
+
+# 失败重试：最多重试次数、首次退避时间和退避上限（秒）
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 10.0
+
+# 可重试的 ClickHouse 异常：服务端过载、Keeper 故障、副本暂不可用、节点间网络问题
+TRANSIENT_ERROR_CODES = {
+    202: 'TOO_MANY_SIMULTANEOUS_QUERIES',
+    209: 'SOCKET_TIMEOUT',
+    210: 'NETWORK_ERROR',
+    225: 'NO_ZOOKEEPER',
+    242: 'TABLE_IS_READ_ONLY',
+    252: 'TOO_MANY_PARTS',
+    279: 'ALL_CONNECTION_TRIES_FAILED',
+    285: 'TOO_FEW_LIVE_REPLICAS',
+    289: 'REPLICA_IS_NOT_IN_QUORUM',
+    319: 'UNKNOWN_STATUS_OF_INSERT',
+    369: 'ALL_REPLICAS_ARE_STALE',
+    473: 'DEADLOCK_AVOIDED',
+    999: 'KEEPER_EXCEPTION',
+}
+# 没有异常码时，这些 HTTP 状态码表示服务端暂时不可用
+TRANSIENT_HTTP_STATUS = {502, 503, 504}
+# 在语句执行之前就拒绝语句的临时错误：写入语句只有遇到这些错误（或连接没有建立）时才重试，
+# 其他临时错误（如 UNKNOWN_STATUS_OF_INSERT、请求发出后连接中断）下重发可能重复写入
+REJECTED_BEFORE_EXECUTION_CODES = {
+    202,    # TOO_MANY_SIMULTANEOUS_QUERIES：排队前拒绝
+    242,    # TABLE_IS_READ_ONLY：写入前检查
+    252,    # TOO_MANY_PARTS：写入数据块之前拒绝
+}
+
+# 只读的系统库，读取它们不构成文件之间的依赖
+SYSTEM_DATABASES = {'system', 'information_schema', 'INFORMATION_SCHEMA'}
+# 用户、角色、权限等访问控制对象统一视为一个全局对象
+ACCESS_OBJECT = '@access'
+
+
+class RateLimiter:
+    """线程安全的简单限速器：保证相邻两次查询之间的最小间隔"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def acquire(self):
+        """阻塞直到允许发起下一次查询"""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(cluster: str) -> RateLimiter:
+    """获取集群共享的限速器（同一集群的所有客户端共用一个）"""
+    with _rate_limiters_lock:
+        if cluster not in _rate_limiters:
+            _rate_limiters[cluster] = RateLimiter(CLUSTER_RATE_LIMITS.get(cluster, 0))
+        return _rate_limiters[cluster]
+
+
+def parse_summary_header(headers) -> Dict[str, int]:
+    """
+    解析 X-ClickHouse-Summary / X-ClickHouse-Progress 响应头
+
+    Args:
+        headers: HTTP 响应头
+
+    Returns:
+        服务端统计信息（read_rows, read_bytes, written_rows, written_bytes,
+        result_rows, result_bytes, elapsed_ns），缺失的字段不包含在结果中
+    """
+    raw = headers.get('X-ClickHouse-Summary')
+    if not raw:
+        # 多个 Progress 头会被合并为逗号分隔的字符串，取最后一个
+        raw = headers.get('X-ClickHouse-Progress')
+        if raw and '}' in raw:
+            raw = '{' + raw.rstrip().rsplit('{', 1)[-1]
+    if not raw:
+        return {}
+
+    try:
+        summary = json.loads(raw)
+    except ValueError:
+        return {}
+
+    stats = {}
+    for key in ('read_rows', 'read_bytes', 'written_rows', 'written_bytes',
+                'result_rows', 'result_bytes', 'elapsed_ns'):
+        if key in summary:
+            try:
+                stats[key] = int(summary[key])
+            except (TypeError, ValueError):
+                pass
+    return stats
+
+
+class ClickHouseError(Exception):
+    """
+    查询失败的结构化描述
+
+    Attributes:
+        code: ClickHouse 异常码（连接错误等没有异常码时为 None）
+        name: 异常名称，如 TOO_MANY_SIMULTANEOUS_QUERIES
+        http_status: HTTP 状态码（没有收到响应时为 None）
+        transient: 是否为可重试的临时错误
+        unknown_status: 写入语句可能已经执行（临时错误但不能安全重试）
+    """
+
+    def __init__(self, message: str, code: int = None, name: str = None,
+                 http_status: int = None, transient: bool = False, unknown_status: bool = False):
+        super().__init__(message)
+        self.code = code
+        self.name = name
+        self.http_status = http_status
+        self.transient = transient
+        self.unknown_status = unknown_status
+
+
+_EXCEPTION_CODE = re.compile(r'Code:\s*(\d+)')
+_EXCEPTION_NAME = re.compile(r'\(([A-Z][A-Z0-9_]+)\)(?:\s*\(version [^)]*\))?\s*$')
+
+
+def parse_clickhouse_error(status: int, body: str, headers=None) -> ClickHouseError:
+    """
+    从错误响应解析 ClickHouse 异常
+
+    Args:
+        status: HTTP 状态码
+        body: 响应文本
+        headers: 响应头（优先使用 X-ClickHouse-Exception-Code）
+
+    Returns:
+        ClickHouseError，消息为 "HTTP <status>: <body>"
+    """
+    code = None
+    header = headers.get('X-ClickHouse-Exception-Code') if headers else None
+    if header and header.strip().isdigit():
+        code = int(header)
+    else:
+        m = _EXCEPTION_CODE.search(body)
+        if m:
+            code = int(m.group(1))
+
+    m = _EXCEPTION_NAME.search(body.strip())
+    name = m.group(1) if m else TRANSIENT_ERROR_CODES.get(code)
+    transient = (code in TRANSIENT_ERROR_CODES or name in TRANSIENT_ERROR_CODES.values()
+                 or (code is None and status in TRANSIENT_HTTP_STATUS))
+    return ClickHouseError(f"HTTP {status}: {body}", code, name, status, transient)
+
+
+def retry_delay(attempt: int) -> float:
+    """第 attempt 次重试（从 0 开始）前的等待时间：指数退避，在 [0, 上限] 内随机抖动"""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+# 标识符：普通名称、`反引号` 或 "双引号"，可带 db. 前缀
+_IDENT = r'(?:`[^`]+`|"[^"]+"|\w+)'
+_QUALIFIED = rf'({_IDENT}(?:\s*\.\s*{_IDENT})?)'
+
+# 语句类型
+STMT_SELECT = 'select'        # SELECT / WITH / SHOW / DESCRIBE / EXISTS / EXPLAIN：只读，返回结果集
+STMT_DDL = 'ddl'              # CREATE / DROP / ALTER（非变更）/ RENAME / TRUNCATE / 权限管理等
+STMT_DML = 'dml'              # INSERT
+STMT_MUTATION = 'mutation'    # ALTER TABLE ... UPDATE/DELETE/MATERIALIZE，轻量 DELETE / UPDATE
+STMT_SYSTEM = 'system'        # SYSTEM / KILL
+STMT_SET = 'set'              # SET / USE（HTTP 接口无会话，对后续语句不生效）
+STMT_OTHER = 'other'
+
+# 可以流水线发送的语句类型：响应很小，不会因为结果集占满连接缓冲区
+PIPELINE_STATEMENT_TYPES = (STMT_DDL, STMT_DML, STMT_SET)
+# 重复执行会重复写入的语句类型
+NON_IDEMPOTENT_STATEMENT_TYPES = (STMT_DML, STMT_MUTATION)
+
+_MUTATION_STATEMENT = re.compile(
+    rf'^\s*(?:ALTER\s+TABLE\s+{_QUALIFIED}(?:\s+ON\s+CLUSTER\s+\S+)?\s+'
+    rf'(?:UPDATE|DELETE|MATERIALIZE\s+(?:COLUMN|INDEX|PROJECTION|TTL|STATISTICS)|'
+    rf'CLEAR\s+(?:COLUMN|INDEX|PROJECTION))\b|DELETE\s+FROM\b|UPDATE\s+{_QUALIFIED}\s+SET\b)',
+    re.IGNORECASE)
+_STATEMENT_KEYWORDS = [
+    (re.compile(r'^\s*(?:SELECT|WITH|SHOW|DESC|DESCRIBE|EXISTS|EXPLAIN)\b', re.IGNORECASE), STMT_SELECT),
+    (re.compile(r'^\s*INSERT\b', re.IGNORECASE), STMT_DML),
+    (re.compile(r'^\s*(?:SYSTEM|KILL)\b', re.IGNORECASE), STMT_SYSTEM),
+    (re.compile(r'^\s*(?:SET|USE)\b(?!\s+(?:DEFAULT\s+)?ROLE\b)', re.IGNORECASE), STMT_SET),
+    (re.compile(r'^\s*(?:CREATE|DROP|ALTER|ATTACH|DETACH|RENAME|TRUNCATE|EXCHANGE|OPTIMIZE|'
+                r'GRANT|REVOKE|SET|UNDROP|BACKUP|RESTORE)\b', re.IGNORECASE), STMT_DDL),
+]
+
+
+def classify_statement(stmt: str) -> str:
+    """
+    判断语句类型
+
+    Args:
+        stmt: SQL 语句（已去掉开头的注释）
+
+    Returns:
+        STMT_SELECT / STMT_DDL / STMT_DML / STMT_MUTATION / STMT_SYSTEM / STMT_SET / STMT_OTHER
+    """
+    if _MUTATION_STATEMENT.match(stmt):
+        return STMT_MUTATION
+    for pattern, kind in _STATEMENT_KEYWORDS:
+        if pattern.match(stmt):
+            return kind
+    return STMT_OTHER
+
+
+def is_binary_result(headers) -> bool:
+    """响应是否为二进制输出格式（X-ClickHouse-Format 为实际输出格式）"""
+    result_format = headers.get('X-ClickHouse-Format') if headers else None
+    return bool(result_format) and result_format.startswith(BINARY_FORMATS)
+
+
+def capture_result(chunks: Iterable[bytes], max_bytes: int = RESULT_CAPTURE_BYTES,
+                   max_rows: int = RESULT_CAPTURE_ROWS) -> Tuple[bytes, bool]:
+    """
+    只读取响应体的开头部分
+
+    读到上限后立即停止迭代，调用方负责关闭连接（或丢弃剩余数据）。
+
+    Args:
+        chunks: 响应体数据块迭代器
+        max_bytes: 最多保留的字节数（0 表示不限）
+        max_rows: 最多保留的行数（按换行符计，0 表示不限；二进制格式应传 0）
+
+    Returns:
+        (content, truncated)，truncated 表示还有未读取的数据
+    """
+    parts = []
+    size = 0
+    rows = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        cut = None
+        if max_rows:
+            newlines = chunk.count(b'\n')
+            if rows + newlines >= max_rows:
+                # 找到第 max_rows 个换行符
+                pos = -1
+                for _ in range(max_rows - rows):
+                    pos = chunk.index(b'\n', pos + 1)
+                cut = pos + 1
+            rows += newlines
+        if max_bytes and size + len(chunk[:cut]) > max_bytes:
+            cut = max_bytes - size
+        if cut is not None and cut < len(chunk):
+            parts.append(chunk[:cut])
+            return b''.join(parts), True
+        parts.append(chunk)
+        size += len(chunk)
+    return b''.join(parts), False
+
+
+def decode_result(body: bytes, headers=None, truncated: bool = False) -> str:
+    """
+    将成功响应转换为报告中的结果文本
+
+    Args:
+        body: 响应体（可能只是开头部分）
+        headers: 响应头
+        truncated: 响应体是否被截断
+
+    Returns:
+        文本格式返回去掉首尾空白的内容，二进制格式只返回大小描述
+    """
+    suffix = "（结果已截断）" if truncated else ""
+    if is_binary_result(headers):
+        return f"<{len(body)} 字节 {headers.get('X-ClickHouse-Format')}>{suffix}"
+    text = body.decode('utf-8', errors='replace').strip()
+    return f"{text}\n...{suffix}" if truncated else text
+
+
+class EndpointPool:
+    """
+    多节点路由和故障转移（线程安全，所有客户端共享一个实例）
+
+    - 只读语句（STMT_SELECT）按轮询或最少在途请求分散到健康的节点
+    - DDL、ON CLUSTER、INSERT、SYSTEM 等其他语句固定发往协调节点，保持执行顺序；
+      协调节点被摘除时切换到下一个健康节点
+    - 读取本次执行中写入过的对象的只读语句也发往协调节点
+      （非复制表的数据只在写入的节点上，复制表的同步也有延迟）
+    - 节点连续连接失败 EJECT_AFTER_FAILURES 次后被摘除，EJECT_DURATION 秒后用 /ping 探测，
+      探测成功后重新加入
+    """
+
+    def __init__(self, endpoints: List[Tuple[str, int]], policy: str = ROUTING_POLICY,
+                 eject_after: int = EJECT_AFTER_FAILURES, eject_duration: float = EJECT_DURATION):
+        if not endpoints:
+            raise ValueError("至少需要一个节点")
+        if policy not in ('round_robin', 'least_in_flight'):
+            raise ValueError(f"不支持的路由策略: {policy}")
+        self.endpoints = list(endpoints)
+        self.policy = policy
+        self.eject_after = eject_after
+        self.eject_duration = eject_duration
+        self.coordinator = self.endpoints[0]
+        self._lock = threading.Lock()
+        self._in_flight = {endpoint: 0 for endpoint in self.endpoints}
+        self._failures = {endpoint: 0 for endpoint in self.endpoints}
+        self._ejected_until = {}
+        self._next = 0
+        self._written = set()
+
+    def route(self, query: str, database: str = None) -> Tuple[str, int]:
+        """
+        为一条语句选择节点（调用方执行完后必须调用 release）
+
+        Args:
+            query: SQL 语句
+            database: 语句的默认数据库
+
+        Returns:
+            (host, port)
+        """
+        if len(self.endpoints) == 1:
+            with self._lock:
+                self._in_flight[self.coordinator] += 1
+            return self.coordinator
+
+        self._probe_ejected()
+        # 只分析语句头部，INSERT 的内联数据可能有几 MB
+        head = statement_head(query)
+        writes, reads = extract_object_refs([head], database or 'default')
+        read_only = classify_statement(head) == STMT_SELECT
+
+        with self._lock:
+            if read_only and not any(_objects_overlap(r, w) for r in reads for w in self._written):
+                endpoint = self._pick_reader()
+            else:
+                self._written |= writes
+                endpoint = self._pick_coordinator()
+            self._in_flight[endpoint] += 1
+        return endpoint
+
+    def route_batch(self, queries: List[Tuple[str, str]]) -> Tuple[str, int]:
+        """为一批流水线语句选择节点（整批发往协调节点），queries 为 [(query, database), ...]"""
+        self._probe_ejected()
+        with self._lock:
+            for query, database in queries:
+                self._written |= extract_object_refs([statement_head(query)], database or 'default')[0]
+            endpoint = self._pick_coordinator()
+            self._in_flight[endpoint] += 1
+        return endpoint
+
+    def release(self, endpoint: Tuple[str, int], connected: bool = True):
+        """
+        归还节点并记录连接结果
+
+        Args:
+            endpoint: route()/route_batch() 返回的节点
+            connected: 是否与节点正常通信（收到任何 HTTP 响应都算正常）
+        """
+        with self._lock:
+            self._in_flight[endpoint] -= 1
+            if connected:
+                self._failures[endpoint] = 0
+                return
+            self._failures[endpoint] += 1
+            if (self._failures[endpoint] >= self.eject_after and endpoint not in self._ejected_until
+                    and len(self.endpoints) > 1):
+                self._ejected_until[endpoint] = time.monotonic() + self.eject_duration
+                print(f"  ⚠️  节点 {endpoint[0]}:{endpoint[1]} 连续 {self._failures[endpoint]} 次连接失败，"
+                      f"暂时摘除 {self.eject_duration}s")
+
+    def check_health(self) -> Dict[Tuple[str, int], bool]:
+        """检查所有节点（/ping），摘除不可用的节点"""
+        health = {endpoint: self._ping(endpoint) for endpoint in self.endpoints}
+        with self._lock:
+            for endpoint, healthy in health.items():
+                if healthy:
+                    self._ejected_until.pop(endpoint, None)
+                    self._failures[endpoint] = 0
+                elif len(self.endpoints) > 1:
+                    self._ejected_until[endpoint] = time.monotonic() + self.eject_duration
+        return health
+
+    def _ping(self, endpoint: Tuple[str, int]) -> bool:
+        try:
+            response = requests.get(f"http://{endpoint[0]}:{endpoint[1]}/ping", timeout=HEALTH_CHECK_TIMEOUT)
+            return response.status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    def _probe_ejected(self):
+        """摘除时间已到的节点：探测一次，成功则重新加入，失败则继续摘除"""
+        now = time.monotonic()
+        with self._lock:
+            due = [ep for ep, until in self._ejected_until.items() if until <= now]
+            # 先延长摘除时间，避免多个线程同时探测同一节点
+            for endpoint in due:
+                self._ejected_until[endpoint] = now + self.eject_duration
+        for endpoint in due:
+            if self._ping(endpoint):
+                with self._lock:
+                    self._ejected_until.pop(endpoint, None)
+                    self._failures[endpoint] = 0
+                print(f"  ✓ 节点 {endpoint[0]}:{endpoint[1]} 已恢复")
+
+    def _healthy(self) -> List[Tuple[str, int]]:
+        healthy = [ep for ep in self.endpoints if ep not in self._ejected_until]
+        # 全部被摘除时仍然尝试所有节点，由重试机制处理
+        return healthy or self.endpoints
+
+    def _pick_reader(self) -> Tuple[str, int]:
+        healthy = self._healthy()
+        if self.policy == 'least_in_flight':
+            # 在途请求数相同时轮询，避免总是选中第一个节点
+            start = self._next % len(healthy)
+            self._next += 1
+            rotated = healthy[start:] + healthy[:start]
+            return min(rotated, key=lambda ep: self._in_flight[ep])
+        endpoint = healthy[self._next % len(healthy)]
+        self._next += 1
+        return endpoint
+
+    def _pick_coordinator(self) -> Tuple[str, int]:
+        if self.coordinator in self._ejected_until:
+            healthy = [ep for ep in self.endpoints if ep not in self._ejected_until]
+            if healthy:
+                self.coordinator = healthy[0]
+                print(f"  ⚠️  协调节点切换为 {self.coordinator[0]}:{self.coordinator[1]}")
+        return self.coordinator
+
+
+# INSERT 语句中数据部分之前的头部：INSERT INTO ... VALUES / FORMAT <name>
+_INSERT_HEAD = re.compile(r'^\s*INSERT\s+INTO\s+[^\'"]*?\b(?:VALUES|FORMAT\s+\w+)(?=[\s(\[{])', re.IGNORECASE)
+# 只在语句开头这么长的范围内查找 INSERT 头部，避免扫描整个数据块
+_INSERT_HEAD_SCAN = 4096
+
+
+def split_insert_data(query: str) -> Tuple[str, int]:
+    """
+    拆分 INSERT 语句的头部和内联数据
+
+    Args:
+        query: SQL 语句
+
+    Returns:
+        (head, data_offset)：INSERT ... VALUES/FORMAT 语句返回头部和数据的起始位置；
+        其他语句返回 (None, 0)，整个语句作为请求体
+    """
+    m = _INSERT_HEAD.match(query[:_INSERT_HEAD_SCAN])
+    if not m or re.search(r'\bSELECT\b', m.group(), re.IGNORECASE):
+        return None, 0
+    return m.group(), m.end()
+
+
+def statement_head(query: str) -> str:
+    """语句中用于分类和分析对象的部分：INSERT ... VALUES/FORMAT 去掉内联数据，其他语句原样返回"""
+    head, _ = split_insert_data(query)
+    return query if head is None else head
+
+
+def guard_write_retry(query: str, error: ClickHouseError, sent: bool = True) -> ClickHouseError:
+    """
+    写入语句的临时错误只有在确定语句没有执行时才可以重试
+
+    INSERT / 变更语句结果未知时重发可能重复写入（非复制表和异步插入没有数据块去重），
+    这类错误改为不重试的"状态未知"错误。
+
+    Args:
+        query: 失败的语句
+        error: 错误
+        sent: 请求是否可能已经到达服务端（连接没有建立时为 False）
+
+    Returns:
+        原错误，或不可重试的状态未知错误
+    """
+    if not error.transient or not sent or error.code in REJECTED_BEFORE_EXECUTION_CODES:
+        return error
+    if classify_statement(statement_head(query)) not in NON_IDEMPOTENT_STATEMENT_TYPES:
+        return error
+    return ClickHouseError(f"Unknown status, not retried: {error}", error.code, error.name,
+                           error.http_status, unknown_status=True)
+
+
+def _make_compressor(compression: str):
+    """创建流式压缩器（提供 compress()/flush()）"""
+    if not compression:
+        return None
+    if compression == 'gzip':
+        return zlib.compressobj(wbits=31)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstd 压缩需要安装 zstandard: pip install zstandard")
+        return zstandard.ZstdCompressor().compressobj()
+    raise ValueError(f"不支持的压缩方式: {compression}")
+
+
+def iter_request_body(query: str, offset: int = 0, compression: str = None,
+                      chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    分块生成 POST 请求体（可选压缩）
+
+    按块编码和压缩 query[offset:]，不会复制整个查询文本。
+
+    Args:
+        query: SQL 语句
+        offset: 请求体的起始位置
+        compression: 压缩方式（None / 'gzip' / 'zstd'）
+        chunk_size: 每块的字符数
+
+    Yields:
+        请求体数据块
+    """
+    compressor = _make_compressor(compression)
+    for pos in range(offset, len(query), chunk_size):
+        chunk = query[pos:pos + chunk_size].encode('utf-8')
+        if compressor:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+    if compressor:
+        tail = compressor.flush()
+        if tail:
+            yield tail
+
+
+class _NonClosingReader:
+    """
+    缓冲读取流的包装
+
+    http.client.HTTPResponse 读完响应后会关闭底层文件对象，
+    流水线中多个响应共享同一个缓冲流，因此忽略 close()。
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def close(self):
+        pass
+
+
+class _PipelineSocket:
+    """让 HTTPResponse 从共享的缓冲流读取，而不是为每个响应新建 makefile()"""
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    def makefile(self, *args, **kwargs):
+        return self.reader
+
 
 class ClickHouseClient:
     """ClickHouse HTTP 客户端"""
 
     def __init__(self, host=CLICKHOUSE_HOST, port=CLICKHOUSE_PORT,
-                 user=CLICKHOUSE_USER, password=CLICKHOUSE_PASSWORD):
-        self.base_url = f"http://{host}:{port}"
+                 user=CLICKHOUSE_USER, password=CLICKHOUSE_PASSWORD,
+                 cluster=CLICKHOUSE_CLUSTER, compression=HTTP_COMPRESSION,
+                 retries: int = RETRY_ATTEMPTS, pool: EndpointPool = None):
+        # 没有指定节点池时只使用 host:port 一个节点
+        self.pool = pool or EndpointPool([(host, port)])
+        self.host, self.port = self.pool.endpoints[0]
+        self.base_url = f"http://{self.host}:{self.port}"
         self.user = user
         self.password = password
+        self.cluster = cluster
+        self.compression = compression
+        self.retries = retries
+        self.rate_limiter = get_rate_limiter(cluster)
         self.session = requests.Session()
-        self.session.timeout = 300  # 5 分钟超时
+        self.timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+        self._pipeline = None
+        self._pipeline_endpoint = None
 
     def execute_query(self, query: str, database: str = None,
                    cluster: str = None) -> Tuple[bool, str]:
@@ -54,44 +724,372 @@ class ClickHouseClient:
         Returns:
             (success, result/error_message)
         """
+        success, result, _ = self.execute_query_with_stats(query, database, cluster)
+        return success, result
+
+    def execute_query_with_stats(self, query: str, database: str = None,
+                                 cluster: str = None, query_id: str = None) -> Tuple[bool, str, Dict]:
+        """
+        执行单个 SQL 查询并返回耗时统计
+
+        Args:
+            query: SQL 查询语句
+            database: 数据库（可选）
+            cluster: 集群名称（可选）
+            query_id: 查询 ID（可选，重试时沿用同一个 ID）
+
+        Returns:
+            (success, result/error_message, stats)
+            stats 包含客户端耗时 elapsed（秒）、尝试次数 attempts 以及服务端返回的
+            read_rows、read_bytes、elapsed_ns 等统计；失败时 stats['error'] 为 ClickHouseError
+        """
+        query = query.strip()
+        if not query or query.startswith('--') or query.startswith('/*'):
+            return True, "Comment - skipped", {'elapsed': 0.0}
+
+        # 临时错误按指数退避重试，语法、表结构等永久错误立即返回
+        attempt = 0
+        while True:
+            success, result, stats = self._execute_once(query, database, cluster, query_id)
+            stats['attempts'] = attempt + 1
+            if success or not stats['error'].transient or attempt >= self.retries:
+                return success, result, stats
+            time.sleep(retry_delay(attempt))
+            attempt += 1
+
+    def _execute_once(self, query: str, database: str = None, cluster: str = None,
+                      query_id: str = None) -> Tuple[bool, str, Dict]:
+        """发送一次查询，不重试"""
+        endpoint = self.pool.route(query, database)
+        stats = {'elapsed': 0.0, 'endpoint': f"{endpoint[0]}:{endpoint[1]}"}
+        if query_id:
+            stats['query_id'] = query_id
+        connected = True
+        sent = True
+        start = None
         try:
-            # 清理查询
+            # 构建参数（查询文本放在 POST 请求体中）
+            params, text, body_offset = self._prepare_request(query, database, cluster, query_id)
+            headers = self._request_headers()
+            if self.compression:
+                headers['Accept-Encoding'] = self.compression
+
+            # 限速（按集群配置），等待时间不计入耗时
+            self._acquire_rate_limit(cluster)
+
+            # 执行查询（请求体分块流式发送，响应流式读取，只保留开头部分）
+            start = time.perf_counter()
+            response = self.session.post(f"http://{endpoint[0]}:{endpoint[1]}", params=params, headers=headers,
+                                         data=iter_request_body(text, body_offset, self.compression),
+                                         timeout=self.timeout, stream=True)
+            content, truncated = capture_result(
+                response.iter_content(RESPONSE_CHUNK_SIZE), RESULT_CAPTURE_BYTES,
+                0 if is_binary_result(response.headers) else RESULT_CAPTURE_ROWS)
+            if truncated:
+                # 断开连接，不下载剩余结果；只读查询会被服务端取消
+                response.close()
+                stats['truncated'] = True
+            stats['elapsed'] = time.perf_counter() - start
+            # 服务端统计来自响应头，截断时仍然保留
+            stats.update(parse_summary_header(response.headers))
+
+            if response.status_code == 200:
+                self.pool.release(endpoint)
+                return True, decode_result(content, response.headers, truncated), stats
+            error = parse_clickhouse_error(response.status_code, content.decode('utf-8', errors='replace'),
+                                           response.headers)
+
+        except requests.exceptions.Timeout as e:
+            # 连接超时可以重试（换一个节点）；读取超时时查询可能仍在执行，不重试
+            connect_timeout = isinstance(e, requests.exceptions.ConnectTimeout)
+            connected = sent = not connect_timeout
+            error = ClickHouseError("Timeout", transient=connect_timeout)
+        except requests.exceptions.ConnectionError as e:
+            # 连接没有建立时请求一定没有发出；请求发出后连接中断时语句可能已经执行
+            connected = False
+            sent = not isinstance(getattr(e.args[0], 'reason', None) if e.args else None, NewConnectionError)
+            error = ClickHouseError("Connection failed", transient=True)
+        except Exception as e:
+            error = ClickHouseError(f"Error: {str(e)}")
+
+        self.pool.release(endpoint, connected)
+        if start is not None:
+            stats['elapsed'] = time.perf_counter() - start
+        error = guard_write_retry(query, error, sent)
+        stats['error'] = error
+        return False, str(error), stats
+
+    def execute_batch(self, queries: List[Tuple]) -> List[Tuple[bool, str, Dict]]:
+        """
+        通过一个持久连接流水线（HTTP pipelining）发送多条语句
+
+        只有响应很小的语句（PIPELINE_STATEMENT_TYPES：DDL / INSERT / SET）走流水线；
+        SELECT 等可能返回大结果集的语句在批内按原顺序逐条执行。
+        服务端在同一连接上按顺序逐个处理请求，因此语句的执行顺序与逐条执行相同，
+        每条语句仍有独立的响应，失败可以精确对应到具体语句。
+        流水线语句都发往协调节点。某条语句因临时错误失败时停止发送后面的语句，
+        原地重试该语句，再按顺序继续执行剩下的语句。
+
+        Args:
+            queries: [(query, database, cluster[, query_id]), ...]
+
+        Returns:
+            与 queries 一一对应的 [(success, result/error_message, stats), ...]
+        """
+        outcomes = [None] * len(queries)
+
+        run = []
+        for index, (query, database, cluster, *query_id) in enumerate(queries):
             query = query.strip()
             if not query or query.startswith('--') or query.startswith('/*'):
-                return True, "Comment - skipped"
+                outcomes[index] = (True, "Comment - skipped", {'elapsed': 0.0})
+            elif classify_statement(query) in PIPELINE_STATEMENT_TYPES:
+                run.append((index, query, database, cluster, query_id[0] if query_id else None))
+            else:
+                # 先执行完前面的流水线语句，保持执行顺序
+                self._execute_run(run, outcomes)
+                run = []
+                outcomes[index] = self.execute_query_with_stats(*queries[index])
+        self._execute_run(run, outcomes)
 
-            # 移除注释
-            query = self._clean_query(query)
+        return outcomes
 
-            # 构建参数
-            params = {
-                'query': query,
-                'database': database if database else 'default'
-            }
+    def _execute_run(self, run: List[Tuple], outcomes: List):
+        """
+        按顺序执行一段连续的流水线语句，临时错误原地重试
 
-            if cluster:
-                params['cluster'] = cluster
+        Args:
+            run: [(index, query, database, cluster, query_id), ...]
+            outcomes: 结果列表，按 index 写入 (success, result/error_message, stats)
+        """
+        while run:
+            retry, run = self._execute_pipeline(run, outcomes)
+            if retry is not None:
+                index, query, database, cluster, query_id = retry
+                time.sleep(retry_delay(0))
+                outcomes[index] = self.execute_query_with_stats(query, database, cluster, query_id)
+                outcomes[index][2]['attempts'] += 1
+
+    def _execute_pipeline(self, pending: List[Tuple], outcomes: List) -> Tuple[Tuple, List[Tuple]]:
+        """
+        在同一个 keep-alive 连接上流水线发送一组语句
 
-            # 添加认证
-            if self.user:
-                params['user'] = self.user
-            if self.password:
-                params['password'] = self.password
+        写线程逐个发送请求（已发送但未读到响应的请求不超过 PIPELINE_MAX_IN_FLIGHT 个），
+        当前线程同时按顺序读取响应，避免请求没写完时响应占满缓冲区、两端互相等待。
+        读到临时错误时停止发送，读完已发送语句的响应后返回：
+        已发送的后续语句中失败的（通常依赖失败的语句）和还没发送的语句需要在重试之后再执行。
 
-            # 执行查询
-            response = self.session.post(self.base_url, params=params)
+        Args:
+            pending: [(index, query, database, cluster, query_id), ...]
+            outcomes: 结果列表，按 index 写入 (success, result/error_message, stats)
 
-            if response.status_code == 200:
-                return True, response.text.strip()
-            else:
-                return False, f"HTTP {response.status_code}: {response.text}"
+        Returns:
+            (需要原地重试的语句或 None, 之后还需要按顺序执行的语句)
+        """
+        if not pending:
+            return None, []
+
+        endpoint = self.pool.route_batch([(query, database) for _, query, database, _, _ in pending])
+        requests_to_send = []
+        for index, query, database, cluster, query_id in pending:
+            params, text, body_offset = self._prepare_request(query, database, cluster, query_id)
+            body = b''.join(iter_request_body(text, body_offset, self.compression))
+            self._acquire_rate_limit(cluster)
+            requests_to_send.append(self._format_pipeline_request(params, body, endpoint))
+
+        answered = 0
+        failed_at = None
+        sent = [0]
+        window = threading.Semaphore(PIPELINE_MAX_IN_FLIGHT)
+        stopped = threading.Event()
+        writer = None
+        try:
+            sock, reader = self._get_pipeline_connection(endpoint)
+            last = time.perf_counter()
+            writer = threading.Thread(target=self._send_pipeline_requests,
+                                      args=(sock, requests_to_send, window, stopped, sent), daemon=True)
+            writer.start()
+
+            for position, (index, query, _, _, query_id) in enumerate(pending):
+                if failed_at is not None and position >= sent[0]:
+                    # 已发送请求的响应都读完了，写线程不会再阻塞在发送上
+                    writer.join()
+                    if position >= sent[0]:
+                        break
+                response = http.client.HTTPResponse(_PipelineSocket(reader), method='POST')
+                response.begin()
+                # 流水线中必须读完每个响应才能读取下一个，超出上限的部分读出后丢弃
+                chunks = iter(partial(response.read, RESPONSE_CHUNK_SIZE), b'')
+                content, truncated = capture_result(
+                    chunks, RESULT_CAPTURE_BYTES, 0 if is_binary_result(response.headers) else RESULT_CAPTURE_ROWS)
+                for _ in chunks:
+                    pass
+                window.release()
+                now = time.perf_counter()
+                stats = {'elapsed': now - last, 'endpoint': f"{endpoint[0]}:{endpoint[1]}"}
+                if query_id:
+                    stats['query_id'] = query_id
+                last = now
+                stats.update(parse_summary_header(response.headers))
+                if truncated:
+                    stats['truncated'] = True
+                answered += 1
+
+                if response.status == 200:
+                    outcomes[index] = (True, decode_result(content, response.headers, truncated), stats)
+                else:
+                    body = content.decode('utf-8', errors='replace')
+                    stats['error'] = guard_write_retry(
+                        query, parse_clickhouse_error(response.status, body, response.headers))
+                    outcomes[index] = (False, str(stats['error']), stats)
+                    if failed_at is None and stats['error'].transient and self.retries:
+                        # 停止发送后面的语句，读完已发送语句的响应
+                        failed_at = position
+                        stopped.set()
+                        window.release()
+
+                if response.will_close:
+                    # 服务端关闭了连接，剩余的请求没有被处理，在新连接上继续执行
+                    self._close_pipeline_connection()
+                    break
+
+        except (OSError, http.client.HTTPException) as e:
+            # 连接中断时无法确定剩余语句是否已执行，不重发，记为失败
+            self._close_pipeline_connection()
+            self.pool.release(endpoint, connected=answered > 0)
+            for index, *_ in pending[answered:]:
+                error = ClickHouseError(f"Pipeline aborted: {str(e)}")
+                outcomes[index] = (False, str(error), {'elapsed': 0.0, 'error': error})
+            return None, []
+
+        finally:
+            if writer is not None:
+                # 唤醒可能还在等待发送窗口的写线程并等它退出
+                stopped.set()
+                window.release(len(requests_to_send))
+                writer.join()
+
+        self.pool.release(endpoint)
+        if failed_at is None:
+            return None, pending[answered:]
+        # 状态未知的写入语句不重新执行
+        rest = [item for item in pending[failed_at + 1:answered]
+                if not outcomes[item[0]][0] and not outcomes[item[0]][2]['error'].unknown_status]
+        return pending[failed_at], rest + pending[answered:]
+
+    @staticmethod
+    def _send_pipeline_requests(sock: socket.socket, requests_to_send: List[bytes],
+                                window: threading.Semaphore, stopped: threading.Event, sent: List[int]):
+        """
+        流水线写线程：每发送一个请求占用一个发送窗口，读到对应响应后释放
 
-        except requests.exceptions.Timeout:
-            return False, "Timeout"
-        except requests.exceptions.ConnectionError:
-            return False, "Connection failed"
-        except Exception as e:
-            return False, f"Error: {str(e)}"
+        sent[0] 记录已发送的请求数。发送失败时关闭连接的读写两端，让读取响应的线程立即结束等待。
+        """
+        try:
+            for request in requests_to_send:
+                window.acquire()
+                if stopped.is_set():
+                    return
+                sock.sendall(request)
+                sent[0] += 1
+        except OSError:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _prepare_request(self, query: str, database: str = None, cluster: str = None,
+                         query_id: str = None) -> Tuple[Dict[str, str], str, int]:
+        """
+        构建 HTTP 请求参数和请求体
+
+        INSERT 的数据部分不经过清理，直接作为请求体；
+        语句头部（如 INSERT INTO t VALUES）放在 query 参数中。
+        其他语句清理注释后整体作为请求体。只读查询附加 SELECT_SETTINGS。
+
+        Returns:
+            (params, text, offset)，请求体为 text[offset:]
+        """
+        params = self._build_params(database, cluster)
+        if query_id:
+            params['query_id'] = query_id
+        if classify_statement(query) == STMT_SELECT:
+            params.update(SELECT_SETTINGS)
+        head, data_offset = split_insert_data(query)
+        if head is None:
+            return params, self._clean_query(query), 0
+        params['query'] = self._clean_query(head).strip()
+        return params, query, data_offset
+
+    def _build_params(self, database: str = None, cluster: str = None) -> Dict[str, str]:
+        """构建 HTTP 请求参数"""
+        params = {
+            'database': database if database else 'default'
+        }
+
+        if cluster:
+            params['cluster'] = cluster
+
+        # 添加认证
+        if self.user:
+            params['user'] = self.user
+        if self.password:
+            params['password'] = self.password
+
+        # 响应压缩（客户端还需发送 Accept-Encoding）
+        if self.compression:
+            params['enable_http_compression'] = '1'
+
+        return params
+
+    def _request_headers(self) -> Dict[str, str]:
+        """请求头：请求体压缩时声明 Content-Encoding"""
+        if self.compression:
+            return {'Content-Encoding': self.compression}
+        return {}
+
+    def _acquire_rate_limit(self, cluster: str = None):
+        """按集群配置限速"""
+        rate_limiter = get_rate_limiter(cluster) if cluster else self.rate_limiter
+        rate_limiter.acquire()
+
+    def _format_pipeline_request(self, params: Dict[str, str], body: bytes,
+                                 endpoint: Tuple[str, int]) -> bytes:
+        """构造原始 HTTP/1.1 POST 请求"""
+        headers = ''.join(f"{name}: {value}\r\n" for name, value in self._request_headers().items())
+        return (f"POST /?{urlencode(params)} HTTP/1.1\r\n"
+                f"Host: {endpoint[0]}:{endpoint[1]}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: keep-alive\r\n"
+                f"{headers}"
+                f"\r\n").encode('utf-8') + body
+
+    def _get_pipeline_connection(self, endpoint: Tuple[str, int]):
+        """获取（必要时建立）到指定节点的流水线持久连接"""
+        if self._pipeline is not None and self._pipeline_endpoint != endpoint:
+            self._close_pipeline_connection()
+        if self._pipeline is None:
+            sock = socket.create_connection(endpoint, timeout=CONNECT_TIMEOUT)
+            sock.settimeout(READ_TIMEOUT)
+            self._pipeline = (sock, _NonClosingReader(sock.makefile('rb')))
+            self._pipeline_endpoint = endpoint
+        return self._pipeline
+
+    def _close_pipeline_connection(self):
+        """关闭流水线连接"""
+        if self._pipeline is not None:
+            sock, reader = self._pipeline
+            self._pipeline = None
+            try:
+                # shutdown 会唤醒阻塞在 sendall 中的写线程
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            try:
+                reader.raw.close()
+                sock.close()
+            except OSError:
+                pass
 
     def _clean_query(self, query: str) -> str:
         """清理 SQL 查询"""
@@ -111,6 +1109,183 @@ class ClickHouseClient:
         return '\n'.join(lines)
 
 
+# 分词器状态
+_NORMAL, _SQUOTE, _DQUOTE, _BTICK, _LINE_COMMENT, _BLOCK_COMMENT, _HEREDOC = range(7)
+
+_HEREDOC_TAG = re.compile(r'\$(\w*)\$')
+# 普通文本和完整的字符串/标识符，一次正则匹配即可跳过（避免逐字符处理）
+_PLAIN_RUN = re.compile(
+    r"(?:[^;'\"`\-#/$]+"
+    r"|'[^'\\]*(?:\\.[^'\\]*)*'"
+    r'|"[^"\\]*(?:\\.[^"\\]*)*"'
+    r"|`[^`\\]*(?:\\.[^`\\]*)*`)+",
+    re.DOTALL)
+_QUOTE_STATES = {"'": _SQUOTE, '"': _DQUOTE, '`': _BTICK}
+_QUOTE_ENDS = {
+    _SQUOTE: re.compile(r"['\\]"),
+    _DQUOTE: re.compile(r'["\\]'),
+    _BTICK: re.compile(r'[`\\]'),
+}
+
+SQL_READ_CHUNK_SIZE = 64 * 1024
+
+
+def iter_sql_statements(stream: TextIO, chunk_size: int = SQL_READ_CHUNK_SIZE) -> Iterator[str]:
+    """
+    增量分割 SQL 语句（生成器）
+
+    按块读取输入，每遇到一个不在字符串/标识符/注释中的分号就产出一条语句，
+    内存占用只与单条语句的长度有关。支持：
+    - '单引号字符串'（\\ 转义和 '' 双写）
+    - "双引号" 和 `反引号` 标识符
+    - -- 和 # 单行注释（# 后需跟空格或 !，与 ClickHouse 一致）、/* */ 多行注释
+    - $$...$$ 和 $tag$...$tag$ heredoc 字符串
+
+    注释不会出现在产出的语句中。
+
+    Args:
+        stream: 文本输入流
+        chunk_size: 每次读取的字符数
+
+    Yields:
+        去除首尾空白后的 SQL 语句
+    """
+    state = _NORMAL
+    heredoc_end = ''
+    parts = []
+    buf = ''
+    eof = False
+
+    while not eof:
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buf += chunk
+        pos = 0
+        length = len(buf)
+
+        while pos < length:
+            if state == _NORMAL:
+                m = _PLAIN_RUN.match(buf, pos)
+                if m:
+                    parts.append(m.group())
+                    pos = m.end()
+                    if pos >= length:
+                        break
+                i = pos
+                c = buf[i]
+
+                if c == ';':
+                    stmt = ''.join(parts).strip()
+                    if stmt:
+                        yield stmt
+                    parts = []
+                    pos = i + 1
+                elif c in _QUOTE_STATES:
+                    parts.append(c)
+                    state = _QUOTE_STATES[c]
+                    pos = i + 1
+                elif c == '$':
+                    tag = _HEREDOC_TAG.match(buf, i)
+                    if tag:
+                        parts.append(tag.group())
+                        heredoc_end = tag.group()
+                        state = _HEREDOC
+                        pos = tag.end()
+                    elif not eof and re.fullmatch(r'\$\w*', buf[i:]):
+                        # 标签可能被块边界截断，等待更多输入
+                        pos = i
+                        break
+                    else:
+                        parts.append(c)
+                        pos = i + 1
+                else:
+                    # '-', '#', '/' 需要看下一个字符
+                    if i + 1 >= length and not eof:
+                        pos = i
+                        break
+                    nxt = buf[i + 1] if i + 1 < length else ''
+                    if (c == '-' and nxt == '-') or (c == '#' and nxt in (' ', '!')):
+                        state = _LINE_COMMENT
+                        pos = i + 2
+                    elif c == '/' and nxt == '*':
+                        state = _BLOCK_COMMENT
+                        pos = i + 2
+                    else:
+                        parts.append(c)
+                        pos = i + 1
+
+            elif state in _QUOTE_ENDS:
+                m = _QUOTE_ENDS[state].search(buf, pos)
+                if not m:
+                    parts.append(buf[pos:])
+                    pos = length
+                    break
+                i = m.start()
+                if i + 1 >= length and not eof:
+                    # 转义符或引号双写可能被块边界截断
+                    parts.append(buf[pos:i])
+                    pos = i
+                    break
+                if buf[i] == '\\' or buf[i + 1:i + 2] == buf[i]:
+                    parts.append(buf[pos:i + 2])
+                    pos = i + 2
+                else:
+                    parts.append(buf[pos:i + 1])
+                    pos = i + 1
+                    state = _NORMAL
+
+            elif state == _LINE_COMMENT:
+                i = buf.find('\n', pos)
+                if i < 0:
+                    pos = length
+                    break
+                pos = i
+                state = _NORMAL
+
+            elif state == _BLOCK_COMMENT:
+                i = buf.find('*/', pos)
+                if i < 0:
+                    pos = max(pos, length - 1)
+                    break
+                parts.append(' ')
+                pos = i + 2
+                state = _NORMAL
+
+            else:  # _HEREDOC
+                i = buf.find(heredoc_end, pos)
+                if i < 0:
+                    keep = max(pos, length - len(heredoc_end) + 1)
+                    parts.append(buf[pos:keep])
+                    pos = keep
+                    break
+                parts.append(buf[pos:i + len(heredoc_end)])
+                pos = i + len(heredoc_end)
+                state = _NORMAL
+
+        buf = buf[pos:]
+
+    # 处理最后一个语句（没有分号结尾）
+    if state != _BLOCK_COMMENT:
+        parts.append(buf)
+    stmt = ''.join(parts).strip()
+    if stmt:
+        yield stmt
+
+
+def read_sql_statements(sql_file: Path) -> Iterator[str]:
+    """
+    逐条读取 SQL 文件中的语句（生成器）
+
+    Args:
+        sql_file: SQL 文件路径
+
+    Yields:
+        SQL 语句
+    """
+    with open(sql_file, 'r', encoding='utf-8') as f:
+        yield from iter_sql_statements(f)
+
+
 def split_sql_statements(content: str) -> List[str]:
     """
     分割 SQL 内容为多个语句
@@ -121,46 +1296,207 @@ def split_sql_statements(content: str) -> List[str]:
     Returns:
         SQL 语句列表
     """
-    # 移除注释
-    content = re.sub(r'/\*.*?\*/', '', content, flags=re.DOTALL)
-
-    # 按分号分割
-    statements = []
-    buffer = []
-    in_string = False
-    escape = False
-
-    for char in content:
-        if char == "'" and not escape:
-            in_string = not in_string
-        escape = (char == '\\' and in_string)
-
-        if char == ';' and not in_string:
-            stmt = ''.join(buffer).strip()
-            if stmt:
-                statements.append(stmt)
-            buffer = []
-        else:
-            buffer.append(char)
+    return list(iter_sql_statements(io.StringIO(content)))
 
-    # 处理最后一个语句（没有分号结尾）
-    if buffer:
-        stmt = ''.join(buffer).strip()
-        if stmt:
-            statements.append(stmt)
 
-    return statements
+def detect_statement_target(stmt: str) -> Tuple[str, str]:
+    """
+    确定语句执行时使用的数据库和集群（语句类型见 classify_statement）
+
+    Args:
+        stmt: SQL 语句
+
+    Returns:
+        (database, cluster)，无法确定时为 None
+    """
+    database = None
+    cluster = None
+
+    # 检查 CREATE DATABASE
+    if re.match(r'CREATE\s+DATABASE', stmt, re.IGNORECASE):
+        db_match = re.search(r'CREATE\s+DATABASE\s+IF\s+NOT\s+EXISTS\s+(\w+)', stmt, re.IGNORECASE)
+        if db_match:
+            database = db_match.group(1)
+
+    # 检查 ON CLUSTER
+    if 'ON CLUSTER' in stmt.upper():
+        cluster_match = re.search(r'ON\s+CLUSTER\s+[\'"]?(\w+)[\'"]?', stmt, re.IGNORECASE)
+        if cluster_match:
+            cluster = cluster_match.group(1)
+
+    return database, cluster
+
+
+def _new_totals() -> Dict:
+    return {'total_files': 0, 'total_statements': 0, 'total_success': 0, 'total_errors': 0,
+            'total_elapsed': 0.0, 'total_read_rows': 0, 'total_read_bytes': 0}
+
+
+def _add_to_totals(totals: Dict, entry: Dict):
+    totals['total_statements'] += 1
+    totals['total_success' if entry['success'] else 'total_errors'] += 1
+    totals['total_elapsed'] += entry.get('elapsed', 0)
+    totals['total_read_rows'] += entry.get('read_rows', 0)
+    totals['total_read_bytes'] += entry.get('read_bytes', 0)
+
+
+class ReportWriter:
+    """
+    执行结果事件日志（JSON Lines）
+
+    每条语句的结果到达时立即追加一行 {"file": ..., ...} 并刷新到磁盘，
+    同时累加汇总统计。内存占用与语句数量无关；执行中途失败或被中断时，
+    已写入的结果仍可以用 generate_report() 生成报告。
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.totals = _new_totals()
+        self._files = set()
+        self._lock = threading.Lock()
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def record(self, file_key: str, entry: Dict):
+        """追加一条语句结果（线程安全）"""
+        line = json.dumps({'file': file_key, **entry}, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if file_key not in self._files:
+                self._files.add(file_key)
+                self.totals['total_files'] += 1
+            _add_to_totals(self.totals, entry)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def index_event_log(events_path: Path) -> Tuple[Dict[str, List[int]], Dict]:
+    """
+    扫描事件日志，只记录每个文件的行偏移量和汇总统计
+
+    Args:
+        events_path: 事件日志路径
+
+    Returns:
+        ({file_key: [行偏移量, ...]}（按首次出现顺序）, totals)
+    """
+    offsets = {}
+    totals = _new_totals()
+    position = 0
+    with open(events_path, 'rb') as f:
+        for line in f:
+            start = position
+            position += len(line)
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # 进程被强制结束时最后一行可能不完整
+                continue
+            offsets.setdefault(entry['file'], []).append(start)
+            _add_to_totals(totals, entry)
+    totals['total_files'] = len(offsets)
+    return offsets, totals
+
+
+def iter_file_results(events_path: Path,
+                      offsets: Dict[str, List[int]] = None) -> Iterator[Tuple[str, List[Dict]]]:
+    """
+    按文件逐个读出事件日志中的结果（并发执行时日志中各文件的结果是交错的）
+
+    Args:
+        events_path: 事件日志路径
+        offsets: index_event_log() 返回的偏移量（可选）
+
+    Returns:
+        (file_key, entries) 迭代器，同一时刻只有一个文件的结果在内存中
+    """
+    if offsets is None:
+        offsets, _ = index_event_log(events_path)
+    with open(events_path, 'rb') as f:
+        for file_key, positions in offsets.items():
+            entries = []
+            for position in positions:
+                f.seek(position)
+                entry = json.loads(f.readline())
+                del entry['file']
+                entries.append(entry)
+            yield file_key, entries
+
+
+def _record_statement_result(results: ReportWriter, file_key: str, index: int, stmt: str,
+                             success: bool, result: str, stats: Dict):
+    """打印并记录单条语句的执行结果"""
+    print(f"[{index}] 执行: {stmt[:80]}..." if len(stmt) > 80 else f"[{index}] 执行: {stmt}")
+    if success:
+        print(f"  ✓ 成功 ({stats['elapsed'] * 1000:.1f} ms)")
+        if result and len(result) < 500:
+            print(f"  结果: {result}")
+    else:
+        print(f"  ✗ 失败: {result}")
+
+    results.record(file_key, {
+        'statement': stmt[:200],
+        'success': success,
+        'result': result[:500] if success else result,
+        'elapsed': stats['elapsed'],
+        'read_rows': stats.get('read_rows', 0),
+        'read_bytes': stats.get('read_bytes', 0),
+        'server_elapsed_ns': stats.get('elapsed_ns', 0),
+        'kind': classify_statement(stmt),
+        'truncated': stats.get('truncated', False),
+        'attempts': stats.get('attempts', 1),
+        'endpoint': stats.get('endpoint'),
+        'error_code': stats['error'].code if 'error' in stats else None,
+        'error_name': stats['error'].name if 'error' in stats else None,
+        'statement_hash': statement_hash(stmt),
+        'query_id': stats.get('query_id')
+    })
+
+
+def _record_datagen_result(results: ReportWriter, file_key: str, table: str,
+                           success: bool, message: str, stats: Dict):
+    """打印并记录数据生成结果（不计入语句哈希，不进入结果缓存和执行历史）"""
+    print(f"[数据生成] {table}: {'✓' if success else '✗'} {message} ({stats['elapsed']:.1f} s)")
+    results.record(file_key, {
+        'statement': f"-- 数据生成: {table}",
+        'success': success,
+        'result': message,
+        'elapsed': stats['elapsed'],
+        'written_rows': stats['written_rows'],
+        'kind': 'datagen'
+    })
+
+
+def make_query_id(prefix: str, file_key: str, index: int) -> str:
+    """语句的确定性 query_id：前缀 + 文件路径哈希 + 语句序号（重试沿用同一个 ID）"""
+    return f"{prefix}-{hashlib.sha1(file_key.encode('utf-8')).hexdigest()[:12]}-{index}"
 
 
 def execute_sql_file(sql_file: Path, client: ClickHouseClient,
-                    results: Dict[str, List[Dict]]) -> int:
+                    results: ReportWriter, batch_size: int = 1,
+                    query_id_prefix: str = None, sandbox: 'FileSandbox' = None,
+                    datagen: 'DataGenerator' = None) -> int:
     """
     执行单个 SQL 文件
 
     Args:
         sql_file: SQL 文件路径
         client: ClickHouse 客户端
-        results: 结果字典
+        results: 结果事件日志
+        batch_size: 每批通过同一连接流水线发送的语句数（1 表示逐条执行）
+        query_id_prefix: 指定时每条语句使用 make_query_id() 生成的 query_id（用于性能分析）
+        sandbox: 沙箱模式下改写语句中的库名并使用沙箱库作为默认库（报告中记录原语句）
+        datagen: 数据生成阶段（可选），在读取表的语句执行前为表生成数据
 
     Returns:
         执行的语句数量
@@ -170,72 +1506,60 @@ def execute_sql_file(sql_file: Path, client: ClickHouseClient,
     print(f"{'=' * 80}")
 
     file_key = str(sql_file.relative_to(PROJECT_ROOT))
-    if file_key not in results:
-        results[file_key] = []
+    if datagen and not datagen.applies_to(file_key):
+        datagen = None
 
     try:
-        with open(sql_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-
-        # 分割语句
-        statements = split_sql_statements(content)
-        total_statements = len(statements)
+        # 边解析边执行，不需要先把整个文件读入内存
+        total_statements = 0
         success_count = 0
-        error_count = 0
-
-        print(f"找到 {total_statements} 个 SQL 语句\n")
+        pending = []
+        pending_bytes = 0
 
-        for i, stmt in enumerate(statements, 1):
+        def flush():
+            nonlocal success_count, pending_bytes
+            if len(pending) == 1:
+                outcomes = [client.execute_query_with_stats(*pending[0][2])]
+            else:
+                outcomes = client.execute_batch([request for _, _, request in pending])
+            for (index, stmt, _), (success, result, stats) in zip(pending, outcomes):
+                _record_statement_result(results, file_key, index, stmt, success, result, stats)
+                success_count += success
+            pending.clear()
+            pending_bytes = 0
+
+        for i, stmt in enumerate(read_sql_statements(sql_file), 1):
+            total_statements = i
             if not stmt.strip() or stmt.strip().startswith('--'):
                 continue
 
-            print(f"[{i}/{total_statements}] 执行: {stmt[:80]}..." if len(stmt) > 80 else f"[{i}/{total_statements}] 执行: {stmt}")
-
-            # 确定数据库和集群
-            database = None
-            cluster = None
-
-            # 检查 CREATE DATABASE
-            if re.match(r'CREATE\s+DATABASE', stmt, re.IGNORECASE):
-                db_match = re.search(r'CREATE\s+DATABASE\s+IF\s+NOT\s+EXISTS\s+(\w+)', stmt, re.IGNORECASE)
-                if db_match:
-                    database = db_match.group(1)
-
-            # 检查 ON CLUSTER
-            if 'ON CLUSTER' in stmt.upper():
-                cluster_match = re.search(r'ON\s+CLUSTER\s+[\'"]?(\w+)[\'"]?', stmt, re.IGNORECASE)
-                if cluster_match:
-                    cluster = cluster_match.group(1)
-
-            # 执行语句
-            success, result = client.execute_query(stmt, database, cluster)
-            elapsed = 0.1  # 模拟执行时间
-
-            if success:
-                success_count += 1
-                print(f"  ✓ 成功")
-                if result and len(result) < 500:
-                    print(f"  结果: {result}")
-            else:
-                error_count += 1
-                print(f"  ✗ 失败: {result}")
-
-            # 记录结果
-            results[file_key].append({
-                'statement': stmt[:200],
-                'success': success,
-                'result': result[:500] if success else result,
-                'elapsed': elapsed
-            })
-
-            time.sleep(0.05)  # 避免过快执行
-
+            query = sandbox.rewrite(stmt) if sandbox else stmt
+            database, cluster = detect_statement_target(query)
+            if sandbox:
+                database = sandbox.database
+            if datagen:
+                tables = datagen.tables_to_fill(query, database, file_key)
+                if tables:
+                    # 先执行完前面的语句（建表、加索引），再生成数据
+                    flush()
+                for table, truncate in tables:
+                    _record_datagen_result(results, file_key, table, *datagen.fill(client, table, truncate))
+            query_id = make_query_id(query_id_prefix, file_key, i) if query_id_prefix else None
+            pending.append((i, stmt, (query, database, cluster, query_id)))
+            pending_bytes += len(query)
+            if len(pending) >= batch_size or pending_bytes >= PIPELINE_MAX_BYTES:
+                flush()
+
+        if pending:
+            flush()
+
+        error_count = total_statements - success_count
         print(f"\n文件执行完成: {success_count}/{total_statements} 成功, {error_count} 失败")
         return total_statements
 
     except Exception as e:
         print(f"\n✗ 文件执行出错: {str(e)}")
-        results[file_key].append({
+        results.record(file_key, {
             'statement': 'FILE_READ_ERROR',
             'success': False,
             'result': f"File read error: {str(e)}",
@@ -261,142 +1585,1273 @@ def scan_sql_files(directory: Path) -> List[Path]:
     return sorted(sql_files)
 
 
-def generate_report(results: Dict[str, List[Dict]], output_dir: Path):
+# 写入对象的语句（DDL / DML）
+_WRITE_PATTERNS = [
+    re.compile(rf'^\s*(?:CREATE|ATTACH)\s+(?:OR\s+REPLACE\s+)?(?:TEMPORARY\s+)?'
+               rf'(?:MATERIALIZED\s+|LIVE\s+|WINDOW\s+)?(?:TABLE|VIEW|DICTIONARY)\s+'
+               rf'(?:IF\s+NOT\s+EXISTS\s+)?{_QUALIFIED}', re.IGNORECASE),
+    re.compile(rf'^\s*(?:DROP|DETACH)\s+(?:TEMPORARY\s+)?(?:TABLE|VIEW|DICTIONARY)\s+'
+               rf'(?:IF\s+EXISTS\s+)?{_QUALIFIED}', re.IGNORECASE),
+    re.compile(rf'^\s*(?:ALTER|OPTIMIZE|TRUNCATE)\s+TABLE\s+(?:IF\s+EXISTS\s+)?{_QUALIFIED}',
+               re.IGNORECASE),
+    re.compile(rf'^\s*INSERT\s+INTO\s+(?:TABLE\s+)?(?!FUNCTION\b){_QUALIFIED}', re.IGNORECASE),
+    re.compile(rf'^\s*DELETE\s+FROM\s+{_QUALIFIED}', re.IGNORECASE),
+    re.compile(rf'^\s*UPDATE\s+{_QUALIFIED}\s+SET\b', re.IGNORECASE),
+    re.compile(rf'^\s*SYSTEM\s+(?:(?:STOP|START)\s+(?:TTL\s+)?(?:MERGES|MOVES|FETCHES|'
+               rf'REPLICATED\s+SENDS|REPLICATION\s+QUEUES|DISTRIBUTED\s+SENDS)|'
+               rf'(?:SYNC|RESTART|RESTORE)\s+REPLICA|FLUSH\s+DISTRIBUTED)\s+{_QUALIFIED}',
+               re.IGNORECASE),
+]
+# 物化视图的 TO 目标表、MOVE/REPLACE PARTITION 的目标表
+_TO_PATTERN = re.compile(rf'\bTO\s+(?:TABLE\s+)?(?!(?:DISK|VOLUME)\b){_QUALIFIED}', re.IGNORECASE)
+_RENAME_PATTERN = re.compile(rf'{_QUALIFIED}\s+TO\s+{_QUALIFIED}', re.IGNORECASE)
+_DATABASE_PATTERN = re.compile(
+    rf'^\s*(?:CREATE|DROP|ATTACH|DETACH)\s+DATABASE\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?({_IDENT})',
+    re.IGNORECASE)
+_ACCESS_PATTERN = re.compile(
+    r'^\s*(?:(?:CREATE|DROP|ALTER)\s+(?:USER|ROLE|ROW\s+POLICY|POLICY|QUOTA|SETTINGS\s+PROFILE|PROFILE)'
+    r'|GRANT|REVOKE|SET\s+DEFAULT\s+ROLE)\b', re.IGNORECASE)
+# 读取对象：FROM / JOIN 后面的表名（排除表函数和子查询）
+_READ_PATTERN = re.compile(rf'\b(?:FROM|JOIN)\s+{_QUALIFIED}(?![\w.])(?!\s*\()', re.IGNORECASE)
+_EXCHANGE_PATTERN = re.compile(rf'^\s*EXCHANGE\s+(?:TABLES|DICTIONARIES)\s+{_QUALIFIED}\s+AND\s+{_QUALIFIED}',
+                               re.IGNORECASE)
+
+
+def _normalize_object(name: str, default_db: str) -> str:
+    """将表名规范化为 db.table 形式"""
+    parts = [p.strip().strip('`"') for p in name.split('.')]
+    if len(parts) == 1:
+        return f"{default_db}.{parts[0]}"
+    return f"{parts[0]}.{parts[1]}"
+
+
+def extract_object_refs(statements: Iterable[str],
+                        default_db: str = 'default') -> Tuple[Set[str], Set[str]]:
     """
-    生成执行报告
+    分析 SQL 语句创建/修改和读取的数据库对象
+
+    对象以 "db"（整个数据库）或 "db.table" 表示。未限定库名的表
+    视为 default_db 下的表（HTTP 接口无会话，USE 语句不生效）。
 
     Args:
-        results: 执行结果字典
-        output_dir: 输出目录
+        statements: SQL 语句（列表或生成器）
+        default_db: 默认数据库
+
+    Returns:
+        (writes, reads) 两个对象集合
     """
-    output_dir.mkdir(parents=True, exist_ok=True)
+    writes = set()
+    reads = set()
 
-    # 生成 HTML 报告
-    html_report = output_dir / "execution_report.html"
-    with open(html_report, 'w', encoding='utf-8') as f:
-        f.write("""<!DOCTYPE html>
+    for stmt in statements:
+        db_match = _DATABASE_PATTERN.match(stmt)
+        if db_match:
+            writes.add(db_match.group(1).strip('`"'))
+            continue
+
+        if _ACCESS_PATTERN.match(stmt):
+            writes.add(ACCESS_OBJECT)
+            continue
+
+        if re.match(r'^\s*RENAME\s+(?:TABLE|DICTIONARY)\b', stmt, re.IGNORECASE):
+            for src, dst in _RENAME_PATTERN.findall(stmt):
+                writes.add(_normalize_object(src, default_db))
+                writes.add(_normalize_object(dst, default_db))
+            continue
+
+        exchange_match = _EXCHANGE_PATTERN.match(stmt)
+        if exchange_match:
+            writes.update(_normalize_object(n, default_db) for n in exchange_match.groups())
+            continue
+
+        for pattern in _WRITE_PATTERNS:
+            match = pattern.match(stmt)
+            if match:
+                writes.add(_normalize_object(match.group(1), default_db))
+                for name in _TO_PATTERN.findall(stmt):
+                    writes.add(_normalize_object(name, default_db))
+                break
+
+        for name in _READ_PATTERN.findall(stmt):
+            reads.add(_normalize_object(name, default_db))
+
+    writes = {o for o in writes if o.split('.')[0] not in SYSTEM_DATABASES}
+    reads = {o for o in reads if o.split('.')[0] not in SYSTEM_DATABASES}
+    return writes, reads - writes
+
+
+def _objects_overlap(a: str, b: str) -> bool:
+    """判断两个对象是否相同，或一个是另一个所在的数据库"""
+    return a == b or a.startswith(b + '.') or b.startswith(a + '.')
+
+
+def _files_conflict(refs_a: Tuple[Set[str], Set[str]],
+                    refs_b: Tuple[Set[str], Set[str]]) -> bool:
+    """两个文件只要有一方写入了另一方读写的对象，就必须按顺序执行"""
+    writes_a, reads_a = refs_a
+    writes_b, reads_b = refs_b
+    for w in writes_a:
+        if any(_objects_overlap(w, o) for o in writes_b | reads_b):
+            return True
+    for w in writes_b:
+        if any(_objects_overlap(w, o) for o in reads_a):
+            return True
+    return False
+
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+
+
+class FileSandbox:
+    """
+    单个文件的沙箱数据库
+
+    文件引用的每个数据库（包括 default，即未限定库名的表所在的库）都映射到该文件独有的
+    临时数据库 {SANDBOX_PREFIX}_<文件路径哈希>_<原库名>。语句执行前改写库名
+    （db.table、DATABASE db，以及字符串中与库名相同的值和 ZooKeeper 路径中的库名段），
+    并以映射后的 default 库作为 HTTP 请求的 database 参数。系统库和字符串中的 'default' 不改写。
+
+    不同文件因此不再访问相同的对象，可以全部并发执行。
+    复制表的 ZooKeeper 路径中没有库名时仍可能冲突，应使用 {database} 宏。
+
+    Args:
+        file_key: 文件相对路径
+        statements: 文件中的语句
+    """
+
+    def __init__(self, file_key: str, statements: Iterable[str]):
+        digest = hashlib.sha1(file_key.encode('utf-8')).hexdigest()[:10]
+        names = {'default'}
+        self.created = set()
+        self.on_cluster = False
+        for stmt in statements:
+            db_match = _DATABASE_PATTERN.match(stmt)
+            if db_match:
+                name = db_match.group(1).strip('`"')
+                names.add(name)
+                if re.match(r'\s*CREATE\b', stmt, re.IGNORECASE):
+                    self.created.add(name)
+            else:
+                writes, reads = extract_object_refs([stmt])
+                names.update(o.split('.')[0] for o in writes | reads if o != ACCESS_OBJECT)
+            if re.search(r'\bON\s+CLUSTER\b', stmt, re.IGNORECASE):
+                self.on_cluster = True
+
+        self.databases = {name: f"{SANDBOX_PREFIX}_{digest}_{re.sub(r'[^0-9A-Za-z_]', '_', name)}"
+                          for name in sorted(names)}
+        self.database = self.databases['default']
+        alternatives = '|'.join(re.escape(n) for n in sorted(names, key=len, reverse=True))
+        self._qualified = re.compile(rf'(?<![\w.`"])([`"]?)({alternatives})\1(?=\s*\.)')
+        self._database_clause = re.compile(
+            rf'(\bDATABASE\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?)([`"]?)({alternatives})\2(?![\w`"])', re.IGNORECASE)
+
+    def rewrite(self, stmt: str) -> str:
+        """把语句中的库名改写为沙箱库名（INSERT 只改写头部，不扫描内联数据）"""
+        head, data_offset = split_insert_data(stmt)
+        end = data_offset if head is not None else len(stmt)
+        parts = []
+        pos = 0
+        for m in _STRING_LITERAL.finditer(stmt, 0, end):
+            parts.append(self._rewrite_code(stmt[pos:m.start()]))
+            parts.append(self._rewrite_literal(m.group()))
+            pos = m.end()
+        parts.append(self._rewrite_code(stmt[pos:end]))
+        return ''.join(parts) + stmt[end:]
+
+    def _rewrite_code(self, text: str) -> str:
+        text = self._qualified.sub(lambda m: m.group(1) + self.databases[m.group(2)] + m.group(1), text)
+        return self._database_clause.sub(
+            lambda m: m.group(1) + m.group(2) + self.databases[m.group(3)] + m.group(2), text)
+
+    def _rewrite_literal(self, literal: str) -> str:
+        value = literal[1:-1]
+        if value in self.databases and value != 'default':
+            return f"'{self.databases[value]}'"
+        if value.startswith('/'):
+            return "'" + '/'.join(self.databases.get(seg, seg) for seg in value.split('/')) + "'"
+        return literal
+
+    def setup_statements(self, cluster: str = None) -> List[str]:
+        """建库语句（文件自己创建的库除外）"""
+        on_cluster = f" ON CLUSTER {cluster}" if cluster and self.on_cluster else ''
+        return [f"CREATE DATABASE IF NOT EXISTS {sandbox}{on_cluster}"
+                for name, sandbox in self.databases.items() if name not in self.created]
+
+    def teardown_statements(self, cluster: str = None) -> List[str]:
+        """删库语句"""
+        on_cluster = f" ON CLUSTER {cluster}" if cluster and self.on_cluster else ''
+        return [f"DROP DATABASE IF EXISTS {sandbox}{on_cluster} SYNC" for sandbox in self.databases.values()]
+
+
+def run_sandbox_ddl(client: ClickHouseClient, statements: List[str], cluster: str = None) -> List[str]:
+    """
+    批量执行沙箱建库/删库语句（每 SANDBOX_DDL_BATCH 条通过一个连接流水线发送）
+
+    Returns:
+        失败语句的错误信息列表
+    """
+    errors = []
+    for i in range(0, len(statements), SANDBOX_DDL_BATCH):
+        batch = statements[i:i + SANDBOX_DDL_BATCH]
+        outcomes = client.execute_batch([(stmt, None, cluster) for stmt in batch])
+        errors.extend(f"{stmt}: {result}" for stmt, (success, result, _) in zip(batch, outcomes) if not success)
+    return errors
+
+
+def _unwrap_type(column_type: str) -> str:
+    """去掉 LowCardinality(...) / Nullable(...) 包装"""
+    while True:
+        m = re.fullmatch(r'(?:LowCardinality|Nullable)\((.*)\)', column_type)
+        if not m:
+            return column_type
+        column_type = m.group(1)
+
+
+def sql_string(value: str) -> str:
+    """ClickHouse 字符串字面量（转义反斜杠和单引号）"""
+    return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+
+def sql_identifier(name: str) -> str:
+    """ClickHouse 反引号标识符（转义反斜杠和反引号）"""
+    return '`' + name.replace('\\', '\\\\').replace('`', '\\`') + '`'
+
+
+def datagen_expression(table: str, name: str, column_type: str,
+                       days: int = DATAGEN_TIME_RANGE_DAYS) -> str:
+    """
+    为一列生成基于 numbers() 的取值表达式（确定性：同一行号总是生成相同的值）
+
+    - id / <表名单数>_id：行号，唯一且有序
+    - 其他 *_id：按 DATAGEN_CARDINALITY 取模的哈希值
+    - 时间、日期：均匀分布在最近 days 天
+    - DATAGEN_STRING_VALUES 中的列：从给定取值中选择；其他字符串：<列名>_<哈希>
+    - 其他整数、浮点数、Enum、Bool、UUID、IPv4：按类型生成
+
+    Args:
+        table: 表名
+        name: 列名
+        column_type: system.columns 中的类型
+
+    Returns:
+        表达式；无法生成的类型（Array、Map 等）返回 None，由列默认值填充
+    """
+    inner = _unwrap_type(column_type)
+    hashed = f"cityHash64(number, {sql_string(name)})"
+    own_id = re.sub(r'e?s$', '', table.lower()) + '_id'
+
+    if re.fullmatch(r'U?Int\d+', inner):
+        if name.lower() in ('id', own_id, f"{table.lower()}_id"):
+            return 'number'
+        if name.lower().endswith('id'):
+            return f"{hashed} % {DATAGEN_CARDINALITY}"
+        return f"{hashed} % 10" if inner.endswith('8') or name.lower() == 'status' else f"{hashed} % 1000000"
+    if re.fullmatch(r'Float\d+|Decimal.*', inner):
+        return f"({hashed} % 10000000) / 100"
+    if inner.startswith('DateTime'):
+        return f"now() - toIntervalSecond({hashed} % {days * 86400})"
+    if inner in ('Date', 'Date32'):
+        return f"today() - toIntervalDay({hashed} % {days})"
+    if inner in ('String', ) or inner.startswith('FixedString'):
+        values = DATAGEN_STRING_VALUES.get(name.lower())
+        if values:
+            array = ', '.join(sql_string(value) for value in values)
+            return f"[{array}][{hashed} % {len(values)} + 1]"
+        return f"concat({sql_string(name + '_')}, toString({hashed} % {DATAGEN_CARDINALITY}))"
+    if inner.startswith('Enum'):
+        # 类型定义中的取值已经是转义过的字面量内容，原样加上引号
+        values = re.findall(r"'((?:[^'\\]|\\.)*)'\s*=", inner)
+        array = ', '.join(f"'{value}'" for value in values)
+        return f"[{array}][{hashed} % {len(values)} + 1]" if values else None
+    if inner == 'Bool':
+        return f"{hashed} % 2 = 1"
+    if inner == 'UUID':
+        return 'generateUUIDv4()'
+    if inner == 'IPv4':
+        return f"toIPv4({hashed} % 4294967296)"
+    return None
+
+
+# 数据生成状态：表被删除、重建或清空（需要重新生成）；表新增了索引或投影（需要清空后重新生成）
+_DATAGEN_RESET = re.compile(r'^\s*(?:DROP\s+TABLE|CREATE\s+(?:OR\s+REPLACE\s+)?TABLE|REPLACE\s+TABLE|'
+                            r'TRUNCATE)\b', re.IGNORECASE)
+_DATAGEN_REINDEX = re.compile(rf'^\s*ALTER\s+TABLE\s+{_QUALIFIED}.*?\bADD\s+(?:INDEX|PROJECTION)\b',
+                              re.IGNORECASE | re.DOTALL)
+
+
+def parse_row_count(value: str) -> int:
+    """解析行数（支持 K / M / B 后缀，如 10M、1.5B）"""
+    units = {'K': 10 ** 3, 'M': 10 ** 6, 'B': 10 ** 9}
+    value = value.strip().upper().replace('_', '')
+    try:
+        if value and value[-1] in units:
+            return int(float(value[:-1]) * units[value[-1]])
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的行数: {value}")
+
+
+class DataGenerator:
+    """
+    性能示例的数据生成阶段
+
+    示例文件只插入几行数据，无法体现文档中的优化效果。对 DATAGEN_FILES 中的文件，
+    在第一条读取某张表的语句执行前（此时建表、添加索引等语句已经执行），
+    从 system.columns 读取表结构，用服务端的 INSERT ... SELECT ... FROM numbers()
+    按 chunk_rows 分批生成 rows 行数据，数据不经过客户端。
+
+    生成状态按文件记录：只为本文件写入过（建表、插入、修改）的表生成数据，
+    其他文件建的表、CTE 别名等误识别的名称不会生成。每张表在一个文件中只生成一次，
+    DROP / CREATE / TRUNCATE 之后再次读取时重新生成；ALTER ... ADD INDEX / PROJECTION 之后
+    清空表并重新生成，使新的索引覆盖全部数据。
+
+    Args:
+        rows: 每张表生成的行数
+        chunk_rows: 每个 INSERT 生成的行数
+        files: 需要生成数据的文件（相对 PROJECT_ROOT 的路径，支持通配符）
+        days: 时间列的分布范围（天）
+    """
+
+    def __init__(self, rows: int, chunk_rows: int = DATAGEN_CHUNK_ROWS,
+                 files: Iterable[str] = DATAGEN_FILES, days: int = DATAGEN_TIME_RANGE_DAYS):
+        self.rows = rows
+        self.chunk_rows = chunk_rows
+        self.files = list(files)
+        self.days = days
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def applies_to(self, file_key: str) -> bool:
+        """文件是否需要生成数据"""
+        path = Path(file_key).as_posix()
+        return any(fnmatch.fnmatch(path, pattern) for pattern in self.files)
+
+    def tables_to_fill(self, stmt: str, database: str, file_key: str) -> List[Tuple[str, bool]]:
+        """
+        执行 stmt 之前需要生成数据的表（返回的表在该文件中标记为已生成）
+
+        Args:
+            stmt: 即将执行的语句（沙箱模式下为改写后的语句）
+            database: 语句的默认数据库
+            file_key: 语句所在的文件
+
+        Returns:
+            [("db.table", 生成前是否先清空表), ...]
+        """
+        writes, reads = extract_object_refs([stmt], database or 'default')
+        with self._lock:
+            state = self._files.setdefault(file_key, {'written': set(), 'filled': set(), 'reindexed': set()})
+            if _DATAGEN_RESET.match(stmt):
+                # 表被删除、重建或清空，再次读取时重新生成
+                state['filled'] -= writes
+                state['reindexed'] -= writes
+            elif _DATAGEN_REINDEX.match(stmt):
+                # 已生成的数据没有新加的索引，再次读取时清空后重新生成
+                state['reindexed'] |= writes & state['filled']
+                state['filled'] -= writes
+            tables = sorted(o for o in reads & state['written'] if o not in state['filled'])
+            state['filled'].update(tables)
+            state['written'] |= writes
+            result = [(table, table in state['reindexed']) for table in tables]
+            state['reindexed'].difference_update(tables)
+        return result
+
+    def fill(self, client: ClickHouseClient, table: str, truncate: bool = False) -> Tuple[bool, str, Dict]:
+        """
+        为一张表生成数据
+
+        Args:
+            client: ClickHouse 客户端
+            table: "db.table"
+            truncate: 生成前先清空表
+
+        Returns:
+            (success, message, stats)，stats 包含 elapsed 和 written_rows
+        """
+        database, name = table.split('.', 1)
+        stats = {'elapsed': 0.0, 'written_rows': 0}
+        success, engine = client.execute_query(
+            f"SELECT engine FROM system.tables WHERE database = {sql_string(database)} "
+            f"AND name = {sql_string(name)} FORMAT TabSeparated")
+        if not success or not engine:
+            return False, f"表不存在或无法读取: {engine}", stats
+        if not engine.endswith(DATAGEN_ENGINES):
+            return True, f"跳过 {engine} 表", stats
+
+        success, result = client.execute_query(
+            f"SELECT name, type, default_kind FROM system.columns "
+            f"WHERE database = {sql_string(database)} AND table = {sql_string(name)} "
+            f"ORDER BY position FORMAT TabSeparated")
+        if not success:
+            return False, result, stats
+        columns = []
+        for line in result.splitlines():
+            column, column_type, default_kind = (line.split('\t') + ['', ''])[:3]
+            expression = None if default_kind else datagen_expression(name, column, column_type, self.days)
+            if expression:
+                columns.append((sql_identifier(column), expression))
+        if not columns:
+            return False, "没有可以生成数据的列", stats
+        if truncate:
+            success, result, truncate_stats = client.execute_query_with_stats(
+                f"TRUNCATE TABLE {sql_identifier(database)}.{sql_identifier(name)}", database)
+            stats['elapsed'] += truncate_stats['elapsed']
+            if not success:
+                return False, result, stats
+
+        head = f"INSERT INTO {sql_identifier(database)}.{sql_identifier(name)} " + \
+            f"({', '.join(c for c, _ in columns)}) SELECT " + ', '.join(expression for _, expression in columns)
+        for offset in range(0, self.rows, self.chunk_rows):
+            count = min(self.chunk_rows, self.rows - offset)
+            success, result, chunk_stats = client.execute_query_with_stats(
+                f"{head} FROM numbers({offset}, {count})", database)
+            stats['elapsed'] += chunk_stats['elapsed']
+            if not success:
+                return False, result, stats
+            stats['written_rows'] += count
+        return True, f"生成 {stats['written_rows']} 行", stats
+
+
+def build_dependency_graph(sql_files: List[Path],
+                           sandboxes: Dict[Path, FileSandbox] = None) -> Dict[Path, Set[Path]]:
+    """
+    构建文件之间的依赖图
+
+    文件按 scan_sql_files() 的顺序排列，每个文件依赖于排在它前面、
+    且与它访问相同对象的所有文件。
+
+    Args:
+        sql_files: SQL 文件列表（已排序）
+        sandboxes: 沙箱模式下每个文件的沙箱（按改写后的语句分析）
+
+    Returns:
+        {文件: 必须先执行完的文件集合}
+    """
+    refs = {}
+    for sql_file in sql_files:
+        try:
+            statements = read_sql_statements(sql_file)
+            default_db = 'default'
+            if sandboxes and sql_file in sandboxes:
+                statements = map(sandboxes[sql_file].rewrite, statements)
+                default_db = sandboxes[sql_file].database
+            refs[sql_file] = extract_object_refs(statements, default_db)
+        except Exception:
+            # 无法分析的文件按全局屏障处理，与所有文件串行
+            refs[sql_file] = None
+
+    graph = {}
+    for i, sql_file in enumerate(sql_files):
+        deps = set()
+        for prev in sql_files[:i]:
+            if refs[sql_file] is None or refs[prev] is None or _files_conflict(refs[sql_file], refs[prev]):
+                deps.add(prev)
+        graph[sql_file] = deps
+
+    return graph
+
+
+def execute_sql_files_parallel(sql_files: List[Path], results: ReportWriter,
+                               jobs: int,
+                               client_factory: Callable[[], ClickHouseClient] = ClickHouseClient,
+                               batch_size: int = 1, query_id_prefix: str = None,
+                               sandboxes: Dict[Path, FileSandbox] = None,
+                               datagen: DataGenerator = None) -> int:
+    """
+    按依赖关系并发执行多个 SQL 文件
+
+    互不相关的文件并发执行，存在依赖的文件保持原有顺序。
+    每个工作线程使用独立的 ClickHouseClient（requests.Session 非线程安全）。
+
+    Args:
+        sql_files: SQL 文件列表（已排序）
+        results: 结果事件日志
+        jobs: 最大并发文件数
+        client_factory: 创建客户端的函数
+        batch_size: 每批流水线发送的语句数
+        query_id_prefix: 语句 query_id 的前缀（可选）
+        sandboxes: 每个文件的沙箱（可选，沙箱之间互不冲突，文件可以全部并发执行）
+        datagen: 数据生成阶段（可选）
+
+    Returns:
+        执行的语句总数
+    """
+    graph = build_dependency_graph(sql_files, sandboxes)
+    independent = sum(1 for deps in graph.values() if not deps)
+    print(f"依赖分析完成: {independent}/{len(sql_files)} 个文件无前置依赖，并发数 {jobs}")
+
+    local = threading.local()
+
+    def run(sql_file: Path) -> int:
+        if not hasattr(local, 'client'):
+            local.client = client_factory()
+        return execute_sql_file(sql_file, local.client, results, batch_size, query_id_prefix,
+                                sandboxes.get(sql_file) if sandboxes else None, datagen)
+
+    done = set()
+    pending = list(sql_files)
+    running = {}
+    total_statements = 0
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            # 提交所有依赖已完成的文件（保持原有顺序）
+            for sql_file in list(pending):
+                if graph[sql_file] <= done:
+                    pending.remove(sql_file)
+                    running[executor.submit(run, sql_file)] = sql_file
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                sql_file = running.pop(future)
+                total_statements += future.result()
+                done.add(sql_file)
+
+    return total_statements
+
+
+def statement_hash(stmt: str) -> str:
+    """规范化语句（合并空白）后计算哈希，格式调整不会导致缓存失效"""
+    return hashlib.sha256(' '.join(stmt.split()).encode('utf-8')).hexdigest()
+
+
+def file_statement_hashes(sql_file: Path) -> List[str]:
+    """按顺序计算文件中每条会被执行的语句的哈希"""
+    return [statement_hash(stmt) for stmt in read_sql_statements(sql_file)
+            if stmt.strip() and not stmt.strip().startswith('--')]
+
+
+def _digest(hashes: List[str]) -> str:
+    """语句哈希序列的摘要（语句的增删和顺序变化都会改变摘要）"""
+    return hashlib.sha256('\n'.join(hashes).encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """
+    已通过语句的本地缓存（SQLite）
+
+    以 (规范化语句哈希, 服务端版本) 为键记录每条语句的执行结果，
+    并记录每个文件的语句哈希序列摘要。文件的摘要未变且上次全部成功时，
+    可以跳过该文件。
+    """
+
+    def __init__(self, path: Path, server_version: str):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.server_version = server_version
+        self.conn = sqlite3.connect(str(path))
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS statement_results (
+                stmt_hash TEXT NOT NULL,
+                server_version TEXT NOT NULL,
+                statement TEXT NOT NULL,
+                success INTEGER NOT NULL,
+                elapsed REAL NOT NULL,
+                run_at TEXT NOT NULL,
+                PRIMARY KEY (stmt_hash, server_version)
+            );
+            CREATE TABLE IF NOT EXISTS file_results (
+                file_key TEXT NOT NULL,
+                server_version TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                success INTEGER NOT NULL,
+                run_at TEXT NOT NULL,
+                PRIMARY KEY (file_key, server_version)
+            );
+        """)
+
+    def is_file_passed(self, file_key: str, hashes: List[str]) -> bool:
+        """文件内容（语句序列）未变，且上次在同一服务端版本上全部成功"""
+        row = self.conn.execute(
+            "SELECT digest, success FROM file_results WHERE file_key = ? AND server_version = ?",
+            (file_key, self.server_version)).fetchone()
+        return row is not None and row[0] == _digest(hashes) and bool(row[1])
+
+    def cached_results(self, hashes: List[str]) -> List[Dict]:
+        """
+        用缓存的语句结果生成报告条目
+
+        Returns:
+            报告条目列表；任何一条语句没有缓存结果时返回 None（视为缓存未命中，需要重新执行文件）
+        """
+        entries = []
+        for stmt_hash in hashes:
+            row = self.conn.execute(
+                "SELECT statement, success FROM statement_results WHERE stmt_hash = ? AND server_version = ?",
+                (stmt_hash, self.server_version)).fetchone()
+            if row is None:
+                return None
+            entries.append({
+                'statement': row[0],
+                'success': bool(row[1]),
+                'result': "Cached - skipped",
+                'elapsed': 0,
+                'statement_hash': stmt_hash,
+                'cached': True
+            })
+        return entries
+
+    def record_file(self, file_key: str, entries: List[Dict]):
+        """记录一个文件的执行结果"""
+        run_at = datetime.now().isoformat()
+        hashes = [e['statement_hash'] for e in entries if 'statement_hash' in e]
+        file_ok = bool(entries) and all(e['success'] for e in entries) and len(hashes) == len(entries)
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO statement_results VALUES (?, ?, ?, ?, ?, ?)",
+                [(e['statement_hash'], self.server_version, e['statement'], int(e['success']),
+                  e.get('elapsed', 0), run_at) for e in entries if 'statement_hash' in e])
+            self.conn.execute(
+                "INSERT OR REPLACE INTO file_results VALUES (?, ?, ?, ?, ?)",
+                (file_key, self.server_version, _digest(hashes), int(file_ok), run_at))
+
+    def close(self):
+        self.conn.close()
+
+
+def statement_elapsed_ms(entry: Dict) -> float:
+    """语句耗时（毫秒）：优先使用服务端耗时，没有时使用客户端耗时"""
+    if entry.get('server_elapsed_ns'):
+        return entry['server_elapsed_ns'] / 1e6
+    return entry.get('elapsed', 0) * 1000
+
+
+class RunHistory:
+    """
+    执行历史（SQLite），用于跨执行发现性能回退
+
+    每次执行在 runs 中记录一行（含服务端版本），每条实际执行的语句在 statement_runs
+    中记录耗时和服务端统计，以规范化语句哈希标识。与 ResultCache 不同，历史不会被覆盖，
+    可以与任意一次执行或最近若干次执行的基线比较（见 run_history.py）。
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(path))
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at TEXT NOT NULL,
+                server_version TEXT NOT NULL,
+                statements INTEGER NOT NULL,
+                errors INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS statement_runs (
+                run_id INTEGER NOT NULL,
+                stmt_hash TEXT NOT NULL,
+                file_key TEXT NOT NULL,
+                statement TEXT NOT NULL,
+                success INTEGER NOT NULL,
+                elapsed_ms REAL NOT NULL,
+                read_rows INTEGER NOT NULL,
+                read_bytes INTEGER NOT NULL,
+                memory_usage INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS statement_runs_run ON statement_runs (run_id, stmt_hash);
+        """)
+
+    def record_run(self, server_version: str, started_at: str,
+                   results: Iterable[Tuple[str, List[Dict]]],
+                   profiles: Dict[str, Dict] = None) -> int:
+        """
+        记录一次执行
+
+        Args:
+            server_version: 服务端版本
+            started_at: 开始时间（ISO 格式）
+            results: iter_file_results() 返回的 (file_key, entries)
+            profiles: load_query_profiles() 的结果（可选，用于记录内存）
+
+        Returns:
+            run_id
+        """
+        profiles = profiles or {}
+        with self.conn:
+            run_id = self.conn.execute(
+                "INSERT INTO runs (started_at, server_version, statements, errors) VALUES (?, ?, 0, 0)",
+                (started_at, server_version)).lastrowid
+            for file_key, entries in results:
+                # 缓存的结果和文件读取错误没有实际执行，不计入历史
+                rows = [(run_id, e['statement_hash'], file_key, e['statement'], int(e['success']),
+                         statement_elapsed_ms(e), e.get('read_rows', 0), e.get('read_bytes', 0),
+                         profiles.get(e.get('query_id'), {}).get('memory_usage'))
+                        for e in entries if 'statement_hash' in e and not e.get('cached')]
+                self.conn.executemany(
+                    "INSERT INTO statement_runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.conn.execute(
+                "UPDATE runs SET statements = (SELECT count(*) FROM statement_runs WHERE run_id = ?), "
+                "errors = (SELECT count(*) FROM statement_runs WHERE run_id = ? AND NOT success) "
+                "WHERE run_id = ?", (run_id, run_id, run_id))
+        return run_id
+
+    def runs(self, limit: int = 20, server_version: str = None, before: int = None) -> List[Dict]:
+        """
+        最近的执行（新的在前）
+
+        Args:
+            limit: 最多返回的条数
+            server_version: 只返回该服务端版本的执行（可选）
+            before: 只返回 run_id 小于该值的执行（可选）
+        """
+        sql = "SELECT run_id, started_at, server_version, statements, errors FROM runs WHERE 1"
+        args = []
+        if server_version:
+            sql += " AND server_version = ?"
+            args.append(server_version)
+        if before is not None:
+            sql += " AND run_id < ?"
+            args.append(before)
+        sql += " ORDER BY run_id DESC LIMIT ?"
+        args.append(limit)
+        columns = ('run_id', 'started_at', 'server_version', 'statements', 'errors')
+        return [dict(zip(columns, row)) for row in self.conn.execute(sql, args)]
+
+    def statement_samples(self, run_ids: List[int]) -> Dict[str, Dict]:
+        """
+        取出若干次执行中成功语句的耗时
+
+        Returns:
+            {stmt_hash: {'file': ..., 'statement': ..., 'runs': {run_id: [耗时 ms, ...]},
+                         'read_bytes': {run_id: [...]}}}
+            同一语句在一次执行中出现多次时有多个样本
+        """
+        samples = {}
+        if not run_ids:
+            return samples
+        placeholders = ','.join('?' * len(run_ids))
+        for run_id, stmt_hash, file_key, statement, elapsed_ms, read_bytes in self.conn.execute(
+                f"SELECT run_id, stmt_hash, file_key, statement, elapsed_ms, read_bytes FROM statement_runs "
+                f"WHERE success AND run_id IN ({placeholders})", run_ids):
+            item = samples.setdefault(stmt_hash, {'file': file_key, 'statement': statement,
+                                                  'runs': {}, 'read_bytes': {}})
+            item['runs'].setdefault(run_id, []).append(elapsed_ms)
+            item['read_bytes'].setdefault(run_id, []).append(read_bytes)
+        return samples
+
+    def close(self):
+        self.conn.close()
+
+
+def select_changed_files(sql_files: List[Path], cache: ResultCache,
+                         results: ReportWriter) -> List[Path]:
+    """
+    挑出需要重新执行的文件：内容有变化、上次未全部通过，或依赖于需要重新执行的文件
+
+    跳过的文件的缓存结果写入 results。
+
+    Args:
+        sql_files: SQL 文件列表（已排序）
+        cache: 结果缓存
+        results: 结果事件日志
+
+    Returns:
+        需要执行的文件列表
+    """
+    graph = build_dependency_graph(sql_files)
+    rerun = set()
+
+    for sql_file in sql_files:
+        file_key = str(sql_file.relative_to(PROJECT_ROOT))
+        hashes = file_statement_hashes(sql_file)
+        entries = None
+        if not graph[sql_file] & rerun and cache.is_file_passed(file_key, hashes):
+            entries = cache.cached_results(hashes)
+        if entries is None:
+            rerun.add(sql_file)
+        else:
+            for entry in entries:
+                results.record(file_key, entry)
+
+    return [f for f in sql_files if f in rerun]
+
+
+_PROFILE_QUERY = """
+SELECT query_id, toString(type) AS type, hostName() AS host, query_duration_ms, memory_usage,
+       read_rows, read_bytes, written_rows, written_bytes, result_rows, result_bytes,
+       exception_code, ProfileEvents
+FROM $source
+WHERE event_date >= yesterday() AND type != 'QueryStart' AND startsWith(query_id, '$prefix')
+ORDER BY event_time_microseconds
+FORMAT JSONEachRow
+"""
+
+
+def fetch_query_profiles(client: ClickHouseClient, query_id_prefix: str, output_path: Path,
+                         cluster: str = None) -> int:
+    """
+    按 query_id 前缀从 system.query_log 一次性取回本次执行的语句统计
+
+    先刷新日志缓冲（SYSTEM FLUSH LOGS），再用一个查询取回所有语句的耗时、内存、
+    读写行数/字节数和 ProfileEvents，流式写入 JSON Lines 文件。
+    同一语句重试过时会有多行，以最后一行为准。
+
+    Args:
+        client: ClickHouse 客户端
+        query_id_prefix: 执行时使用的 query_id 前缀
+        output_path: 输出文件
+        cluster: 指定时通过 clusterAllReplicas 查询所有节点的日志（语句分散到多个节点执行时）
+
+    Returns:
+        取回的记录数
+    """
+    flush = f"SYSTEM FLUSH LOGS ON CLUSTER {cluster}" if cluster else "SYSTEM FLUSH LOGS"
+    success, result = client.execute_query(flush)
+    if not success:
+        print(f"  ⚠ 刷新日志失败（最近的语句可能还没有写入 query_log）: {result}")
+
+    source = f"clusterAllReplicas('{cluster}', system.query_log)" if cluster else "system.query_log"
+    query = Template(_PROFILE_QUERY).substitute(source=source, prefix=query_id_prefix)
+    params = client._build_params('system')
+    # 结果可能很大，不经过 SELECT_SETTINGS 的结果上限和 capture_result 截断
+    params['output_format_json_quote_64bit_integers'] = '0'
+    endpoint = client.pool.route(query, 'system')
+    count = 0
+    connected = True
+    try:
+        response = client.session.post(f"http://{endpoint[0]}:{endpoint[1]}", params=params,
+                                       data=query.encode('utf-8'), timeout=client.timeout, stream=True)
+        if response.status_code != 200:
+            error = parse_clickhouse_error(response.status_code, response.text, response.headers)
+            print(f"  ⚠ 读取 system.query_log 失败: {error}")
+            return 0
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, 'wb') as f:
+            for line in response.iter_lines(RESPONSE_CHUNK_SIZE):
+                if line:
+                    f.write(line + b'\n')
+                    count += 1
+    except requests.exceptions.RequestException as e:
+        connected = False
+        print(f"  ⚠ 读取 system.query_log 失败: {str(e)}")
+    finally:
+        client.pool.release(endpoint, connected)
+    return count
+
+
+def load_query_profiles(profiles_path: Path) -> Dict[str, Dict]:
+    """
+    读取 fetch_query_profiles() 写入的文件
+
+    Returns:
+        {query_id: profile}，重试过的语句保留最后一次的记录
+    """
+    profiles = {}
+    with open(profiles_path, 'rb') as f:
+        for line in f:
+            try:
+                profile = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(profile, dict) and profile.get('query_id'):
+                profiles[profile.pop('query_id')] = profile
+    return profiles
+
+
+# HTML 报告模板（$ 占位符由 generate_report 填充）
+_REPORT_HTML_HEAD = Template("""<!DOCTYPE html>
 <html>
 <head>
     <meta charset="UTF-8">
     <title>ClickHouse SQL 执行报告</title>
     <style>
         body { font-family: Arial, sans-serif; margin: 20px; background: #f5f5f5; }
-        .container { max-width: 1200px; margin: 0 auto; background: white; padding: 20px; border-radius: 8px; }
+        .container { max-width: 1400px; margin: 0 auto; background: white; padding: 20px; border-radius: 8px; }
         h1 { color: #333; border-bottom: 3px solid #FF6B35; padding-bottom: 10px; }
-        .summary { display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 15px; margin: 20px 0; }
+        .summary { display: grid; grid-template-columns: repeat(auto-fit, minmax(160px, 1fr)); gap: 15px; margin: 20px 0; }
         .summary-card { background: #f8f9fa; padding: 15px; border-radius: 5px; border-left: 4px solid #FF6B35; }
-        .summary-card h3 { margin: 0 0 10px 0; color: #555; }
-        .summary-card .value { font-size: 28px; font-weight: bold; color: #FF6B35; }
-        .file-section { margin: 20px 0; border: 1px solid #ddd; border-radius: 5px; overflow: hidden; }
-        .file-header { background: #f8f9fa; padding: 10px 15px; border-bottom: 1px solid #ddd; }
-        .file-header h3 { margin: 0; color: #333; }
-        .statement { padding: 10px 15px; border-bottom: 1px solid #eee; }
-        .statement:last-child { border-bottom: none; }
-        .statement.success { border-left: 4px solid #28a745; }
-        .statement.error { border-left: 4px solid #dc3545; }
-        .statement .stmt-text { font-family: monospace; font-size: 12px; color: #666; margin: 5px 0; }
-        .statement .result { margin-top: 5px; padding: 8px; background: #f8f9fa; border-radius: 3px; font-size: 13px; }
-        .statement.error .result { background: #f8d7da; color: #721c24; }
+        .summary-card h3 { margin: 0 0 10px 0; color: #555; font-size: 14px; }
+        .summary-card .value { font-size: 24px; font-weight: bold; color: #FF6B35; }
+        .toolbar { display: flex; flex-wrap: wrap; gap: 10px; align-items: center; margin: 15px 0; }
+        .toolbar label { color: #555; font-size: 13px; }
+        .toolbar select, .toolbar input { padding: 4px 6px; font-size: 13px; }
+        .count { color: #999; font-size: 13px; margin-left: auto; }
+        .list-header, .row { display: grid; grid-template-columns: 24px 260px 50px 90px 90px 100px 90px 1fr; gap: 8px; align-items: center; font-size: 12px; }
+        .list-header { font-weight: bold; color: #555; padding: 6px 10px; border-bottom: 2px solid #ddd; }
+        .viewport { height: 600px; overflow-y: auto; position: relative; border: 1px solid #ddd; }
+        .spacer { position: relative; }
+        .row { position: absolute; left: 0; right: 0; height: 28px; padding: 0 10px; border-bottom: 1px solid #eee; cursor: pointer; box-sizing: border-box; }
+        .row:hover { background: #fff4ef; }
+        .row.selected { background: #ffe3d6; }
+        .row.success { border-left: 4px solid #28a745; }
+        .row.error { border-left: 4px solid #dc3545; }
+        .row span { overflow: hidden; white-space: nowrap; text-overflow: ellipsis; }
+        .num { text-align: right; }
+        .row .stmt { font-family: monospace; color: #666; }
+        .detail { margin-top: 15px; padding: 10px 15px; border: 1px solid #ddd; border-radius: 5px; display: none; }
+        .detail pre { white-space: pre-wrap; word-break: break-all; background: #f8f9fa; padding: 8px; border-radius: 3px; font-size: 12px; }
+        .detail.error pre.result { background: #f8d7da; color: #721c24; }
+        .metrics { color: #999; font-size: 12px; }
         .timestamp { color: #999; font-size: 12px; }
     </style>
 </head>
 <body>
     <div class="container">
         <h1>🚀 ClickHouse SQL 执行报告</h1>
-        <p class="timestamp">生成时间: """ + datetime.now().strftime('%Y-%m-%d %H:%M:%S') + """</p>
+        <p class="timestamp">生成时间: $timestamp</p>
 
         <div class="summary">
-""")
-
-        # 统计
-        total_files = len(results)
-        total_statements = sum(len(stmts) for stmts in results.values())
-        total_success = sum(sum(1 for s in stmts if s['success']) for stmts in results.values())
-        total_errors = total_statements - total_success
-
-        f.write(f"""
-            <div class="summary-card">
-                <h3>文件总数</h3>
-                <div class="value">{total_files}</div>
-            </div>
-            <div class="summary-card">
-                <h3>语句总数</h3>
-                <div class="value">{total_statements}</div>
-            </div>
-            <div class="summary-card">
-                <h3>成功</h3>
-                <div class="value" style="color: #28a745;">{total_success}</div>
-            </div>
-            <div class="summary-card">
-                <h3>失败</h3>
-                <div class="value" style="color: #dc3545;">{total_errors}</div>
-            </div>
+            <div class="summary-card"><h3>文件总数</h3><div class="value">$total_files</div></div>
+            <div class="summary-card"><h3>语句总数</h3><div class="value">$total_statements</div></div>
+            <div class="summary-card"><h3>成功</h3><div class="value" style="color: #28a745;">$total_success</div></div>
+            <div class="summary-card"><h3>失败</h3><div class="value" style="color: #dc3545;">$total_errors</div></div>
+            <div class="summary-card"><h3>总耗时</h3><div class="value">${total_elapsed}s</div></div>
+            <div class="summary-card"><h3>读取行数</h3><div class="value">$total_read_rows</div></div>
+            <div class="summary-card"><h3>读取字节</h3><div class="value">$total_read_bytes</div></div>
         </div>
-""")
 
-        # 详细结果
-        for file_key, statements in results.items():
-            file_success = sum(1 for s in statements if s['success'])
-            file_total = len(statements)
-
-            f.write(f"""
-        <div class="file-section">
-            <div class="file-header">
-                <h3>📄 {file_key}</h3>
-                <span style="color: #666;">{file_success}/{file_total} 成功</span>
-            </div>
-""")
-
-            for stmt in statements:
-                status_class = 'success' if stmt['success'] else 'error'
-                status_icon = '✓' if stmt['success'] else '✗'
-
-                f.write(f"""
-            <div class="statement {status_class}">
-                <div style="font-weight: bold;">{status_icon} {stmt['statement']}</div>
-                <div class="result">
-                    <strong>结果:</strong> {stmt['result']}
-                </div>
-            </div>
-""")
-
-            f.write("""
+        <div class="toolbar">
+            <label>状态 <select id="status">
+                <option value="all">全部</option>
+                <option value="failed">仅失败</option>
+                <option value="success">仅成功</option>
+            </select></label>
+            <label>文件 <select id="file"><option value="-1">全部文件</option></select></label>
+            <label>排序 <select id="sort">
+                <option value="order">执行顺序</option>
+                <option value="elapsed_desc">耗时（从高到低）</option>
+                <option value="elapsed_asc">耗时（从低到高）</option>
+                <option value="bytes_desc">读取字节（从高到低）</option>
+                <option value="memory_desc">内存（从高到低，需 --profile）</option>
+                <option value="cpu_desc">CPU 时间（从高到低，需 --profile）</option>
+            </select></label>
+            <label>最慢前 <input id="top" type="number" min="0" value="0" style="width: 70px;"> 条（0 表示不限）</label>
+            <label>搜索 <input id="search" type="search" placeholder="语句或结果"></label>
+            <span class="count" id="count"></span>
         </div>
-""")
 
-        f.write("""
+        <div class="list-header">
+            <span></span><span>文件</span><span class="num">#</span><span class="num">耗时 ms</span>
+            <span class="num">服务端 ms</span><span class="num">读取行数</span><span class="num">内存</span><span>语句</span>
+        </div>
+        <div class="viewport" id="viewport"><div class="spacer" id="spacer"></div></div>
+
+        <div class="detail" id="detail">
+            <h3 id="detail-title"></h3>
+            <div class="metrics" id="detail-metrics"></div>
+            <pre id="detail-statement"></pre>
+            <pre id="detail-profile"></pre>
+            <strong>结果:</strong>
+            <pre class="result" id="detail-result"></pre>
+        </div>
     </div>
+
+    <script type="application/json" id="report-data">""")
+
+_REPORT_HTML_TAIL = """</script>
+    <script>
+    (function () {
+        var data = JSON.parse(document.getElementById('report-data').textContent);
+        var files = data.files, rows = data.rows;
+        var ROW_HEIGHT = 28, OVERSCAN = 20;
+        var viewport = document.getElementById('viewport');
+        var spacer = document.getElementById('spacer');
+        var controls = {};
+        ['status', 'file', 'sort', 'top', 'search'].forEach(function (id) {
+            controls[id] = document.getElementById(id);
+        });
+        var view = [], selected = -1;
+
+        // 文件下拉框显示每个文件的语句数和失败数
+        var counts = files.map(function () { return 0; });
+        var failures = files.map(function () { return 0; });
+        rows.forEach(function (r) { counts[r[0]]++; if (!r[2]) failures[r[0]]++; });
+        files.forEach(function (name, i) {
+            var option = document.createElement('option');
+            option.value = i;
+            option.textContent = name + ' (' + counts[i] + (failures[i] ? ', ' + failures[i] + ' 失败' : '') + ')';
+            controls.file.appendChild(option);
+        });
+
+        function applyFilters() {
+            var status = controls.status.value, file = +controls.file.value;
+            var sort = controls.sort.value, top = +controls.top.value || 0;
+            var search = controls.search.value.toLowerCase();
+            view = [];
+            for (var i = 0; i < rows.length; i++) {
+                var r = rows[i];
+                if (status === 'failed' && r[2]) continue;
+                if (status === 'success' && !r[2]) continue;
+                if (file >= 0 && r[0] !== file) continue;
+                if (search && r[7].toLowerCase().indexOf(search) < 0 && r[8].toLowerCase().indexOf(search) < 0) continue;
+                view.push(i);
+            }
+            if (top > 0 || sort === 'elapsed_desc') {
+                view.sort(function (a, b) { return rows[b][3] - rows[a][3]; });
+            } else if (sort === 'elapsed_asc') {
+                view.sort(function (a, b) { return rows[a][3] - rows[b][3]; });
+            } else if (sort === 'bytes_desc') {
+                view.sort(function (a, b) { return rows[b][6] - rows[a][6]; });
+            } else if (sort === 'memory_desc') {
+                view.sort(function (a, b) { return (rows[b][9] || 0) - (rows[a][9] || 0); });
+            } else if (sort === 'cpu_desc') {
+                view.sort(function (a, b) { return (rows[b][10] || 0) - (rows[a][10] || 0); });
+            }
+            if (top > 0) view = view.slice(0, top);
+            document.getElementById('count').textContent = '显示 ' + view.length + ' / ' + rows.length + ' 条';
+            spacer.style.height = (view.length * ROW_HEIGHT) + 'px';
+            viewport.scrollTop = 0;
+            render();
+        }
+
+        function formatBytes(value) {
+            if (value === null || value === undefined) return '';
+            var units = ['B', 'KiB', 'MiB', 'GiB', 'TiB'], n = 0;
+            while (value >= 1024 && n < units.length - 1) { value /= 1024; n++; }
+            return (n ? value.toFixed(1) : value) + ' ' + units[n];
+        }
+
+        function cell(text, className) {
+            var span = document.createElement('span');
+            span.textContent = text;
+            if (className) span.className = className;
+            return span;
+        }
+
+        // 只渲染可见区域附近的行
+        function render() {
+            var first = Math.max(0, Math.floor(viewport.scrollTop / ROW_HEIGHT) - OVERSCAN);
+            var last = Math.min(view.length, Math.ceil((viewport.scrollTop + viewport.clientHeight) / ROW_HEIGHT) + OVERSCAN);
+            var fragment = document.createDocumentFragment();
+            for (var n = first; n < last; n++) {
+                var index = view[n], r = rows[index];
+                var row = document.createElement('div');
+                row.className = 'row ' + (r[2] ? 'success' : 'error') + (index === selected ? ' selected' : '');
+                row.style.top = (n * ROW_HEIGHT) + 'px';
+                row.dataset.index = index;
+                row.appendChild(cell(r[2] ? '✓' : '✗'));
+                row.appendChild(cell(files[r[0]]));
+                row.appendChild(cell(r[1], 'num'));
+                row.appendChild(cell(r[3].toFixed(1), 'num'));
+                row.appendChild(cell(r[4].toFixed(1), 'num'));
+                row.appendChild(cell(r[5], 'num'));
+                row.appendChild(cell(formatBytes(r[9]), 'num'));
+                row.appendChild(cell(r[7].split('\\n')[0], 'stmt'));
+                fragment.appendChild(row);
+            }
+            spacer.replaceChildren(fragment);
+        }
+
+        function showDetail(index) {
+            var r = rows[index];
+            var detail = document.getElementById('detail');
+            selected = index;
+            detail.className = 'detail' + (r[2] ? '' : ' error');
+            detail.style.display = 'block';
+            document.getElementById('detail-title').textContent = (r[2] ? '✓ ' : '✗ ') + files[r[0]] + ' #' + r[1];
+            document.getElementById('detail-metrics').textContent =
+                '耗时: ' + r[3].toFixed(1) + ' ms | 服务端: ' + r[4].toFixed(1) + ' ms | 读取: ' +
+                r[5] + ' 行 / ' + r[6] + ' 字节' +
+                (r[9] === null ? '' : ' | 内存: ' + formatBytes(r[9]) + ' | CPU: ' + r[10].toFixed(1) + ' ms');
+            document.getElementById('detail-statement').textContent = r[7];
+            var profile = document.getElementById('detail-profile');
+            profile.style.display = r[11] ? 'block' : 'none';
+            profile.textContent = r[11] ? Object.keys(r[11]).map(function (name) {
+                return name + ': ' + r[11][name];
+            }).join('\\n') : '';
+            document.getElementById('detail-result').textContent = r[8];
+            render();
+        }
+
+        viewport.addEventListener('scroll', function () { window.requestAnimationFrame(render); });
+        viewport.addEventListener('click', function (event) {
+            var row = event.target.closest('.row');
+            if (row) showDetail(+row.dataset.index);
+        });
+        ['status', 'file', 'sort', 'top'].forEach(function (id) {
+            controls[id].addEventListener('change', applyFilters);
+        });
+        var timer = null;
+        controls.search.addEventListener('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(applyFilters, 200);
+        });
+        applyFilters();
+    })();
+    </script>
 </body>
 </html>
-""")
+"""
+
+
+def _embed_json(value) -> str:
+    """序列化为可以嵌入 <script> 的紧凑 JSON（转义所有 <，避免内容中的 </script> 提前结束脚本）"""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).replace('<', '\\u003c')
+
+
+def _profile_cost(profile: Dict) -> Tuple[int, float, Dict]:
+    """从 query_log 记录中取出报告列表使用的 (内存, CPU ms, 主要 ProfileEvents)"""
+    events = profile.get('ProfileEvents') or {}
+    cpu_us = events.get('OSCPUVirtualTimeMicroseconds') or (
+        events.get('UserTimeMicroseconds', 0) + events.get('SystemTimeMicroseconds', 0))
+    shown = {name: events[name] for name in REPORT_PROFILE_EVENTS if name in events}
+    return profile.get('memory_usage', 0), round(cpu_us / 1000, 2), shown
+
+
+def generate_report(events_path: Path, output_dir: Path, profiles_path: Path = None):
+    """
+    从事件日志生成执行报告
+
+    先扫描一遍日志得到汇总统计和每个文件的行偏移量，再按文件逐个读出结果写入
+    HTML 和 JSON，内存中同一时刻只保留一个文件的结果。
+    有性能分析结果（fetch_query_profiles()）时按 query_id 合并到每条语句。
+
+    Args:
+        events_path: ReportWriter 写入的事件日志
+        output_dir: 输出目录
+        profiles_path: 性能分析结果（可选，默认使用事件日志旁的 execution_profiles.jsonl）
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    offsets, totals = index_event_log(events_path)
+
+    if profiles_path is None:
+        profiles_path = events_path.with_name("execution_profiles.jsonl")
+    profiles = load_query_profiles(profiles_path) if profiles_path.exists() else {}
+
+    # 生成 HTML 报告：汇总卡片直接渲染，语句列表以紧凑 JSON 嵌入页面，
+    # 由浏览器按需渲染（虚拟滚动、筛选、排序），所有内容都通过 textContent 写入
+    html_report = output_dir / "execution_report.html"
+    with open(html_report, 'w', encoding='utf-8') as f:
+        f.write(_REPORT_HTML_HEAD.substitute(
+            timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            total_elapsed=f"{totals['total_elapsed']:.2f}",
+            **{k: v for k, v in totals.items() if k != 'total_elapsed'}))
+
+        # rows: [文件序号, 语句序号, 成功, 耗时 ms, 服务端 ms, 读取行数, 读取字节, 语句, 结果,
+        #        内存, CPU ms, ProfileEvents]（后三项没有性能分析结果时为 null）
+        f.write(f'{{"files":{_embed_json(list(offsets))},"rows":[')
+        first = True
+        for file_no, (file_key, statements) in enumerate(iter_file_results(events_path, offsets)):
+            for stmt_no, stmt in enumerate(statements, 1):
+                profile = profiles.get(stmt.get('query_id'))
+                row = [file_no, stmt_no, int(stmt['success']),
+                       round(stmt.get('elapsed', 0) * 1000, 2),
+                       round(stmt.get('server_elapsed_ns', 0) / 1e6, 2),
+                       stmt.get('read_rows', 0), stmt.get('read_bytes', 0),
+                       stmt['statement'], str(stmt['result']),
+                       *(_profile_cost(profile) if profile else (None, None, None))]
+                f.write(('' if first else ',\n') + _embed_json(row))
+                first = False
+        f.write(']}')
+        f.write(_REPORT_HTML_TAIL)
 
     print(f"\n报告已生成: {html_report}")
 
-    # 生成 JSON 报告
+    # 生成 JSON 报告（逐个文件写出，每条语句一行）
     json_report = output_dir / "execution_report.json"
     with open(json_report, 'w', encoding='utf-8') as f:
-        json.dump({
-            'timestamp': datetime.now().isoformat(),
-            'summary': {
-                'total_files': total_files,
-                'total_statements': total_statements,
-                'total_success': total_success,
-                'total_errors': total_errors
-            },
-            'results': results
-        }, f, indent=2, ensure_ascii=False)
+        f.write('{\n')
+        f.write(f'"timestamp": {json.dumps(datetime.now().isoformat())},\n')
+        f.write(f'"summary": {json.dumps(totals)},\n')
+        f.write('"results": {')
+        for n, (file_key, statements) in enumerate(iter_file_results(events_path, offsets)):
+            f.write(',\n' if n else '\n')
+            f.write(f'{json.dumps(file_key, ensure_ascii=False)}: [\n')
+            for stmt in statements:
+                if stmt.get('query_id') in profiles:
+                    stmt['profile'] = profiles[stmt['query_id']]
+            f.write(',\n'.join(json.dumps(stmt, ensure_ascii=False) for stmt in statements))
+            f.write('\n]')
+        f.write('\n}\n}\n')
 
     print(f"JSON 报告已生成: {json_report}")
 
 
+def parse_endpoints(value: str) -> List[Tuple[str, int]]:
+    """解析 host:port,host:port 形式的节点列表"""
+    endpoints = []
+    for item in value.split(','):
+        host, _, port = item.strip().rpartition(':')
+        if not host or not port.isdigit():
+            raise argparse.ArgumentTypeError(f"节点格式应为 host:port: {item}")
+        endpoints.append((host, int(port)))
+    return endpoints
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="ClickHouse SQL 文件扫描和执行工具")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="并发执行的文件数（默认 1，按顺序执行）；"
+                             "访问相同数据库/表的文件仍按顺序执行")
+    parser.add_argument('--rate-limit', type=float, default=None,
+                        help=f"{CLICKHOUSE_CLUSTER} 集群的每秒最大查询数"
+                             "（覆盖 CLUSTER_RATE_LIMITS 配置，0 表示不限速）")
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help="每批通过同一 keep-alive 连接流水线发送的语句数（默认 1，逐条执行）；"
+                             "每条语句仍单独记录结果")
+    parser.add_argument('--changed-only', action='store_true',
+                        help="跳过内容未变且上次（同一服务端版本）全部成功的文件，"
+                             "只执行修改过的文件及依赖它们的文件")
+    parser.add_argument('--compression', choices=['gzip', 'zstd'], default=HTTP_COMPRESSION,
+                        help="压缩请求体并启用响应压缩（enable_http_compression）")
+    parser.add_argument('--retries', type=int, default=RETRY_ATTEMPTS,
+                        help=f"临时错误（过载、Keeper 故障、副本未就绪、连接中断）的最多重试次数"
+                             f"（默认 {RETRY_ATTEMPTS}，0 表示不重试）")
+    parser.add_argument('--endpoints', type=parse_endpoints, default=CLICKHOUSE_ENDPOINTS,
+                        help="集群节点列表（host:port，逗号分隔）；只读语句分散到各节点，"
+                             "其他语句发往第一个节点（协调节点）")
+    parser.add_argument('--routing', choices=['round_robin', 'least_in_flight'], default=ROUTING_POLICY,
+                        help=f"只读语句的路由策略（默认 {ROUTING_POLICY}）")
+    parser.add_argument('--select-max-rows', type=int, default=int(SELECT_SETTINGS['max_result_rows']),
+                        help="只读查询最多返回的行数，超出部分截断（max_result_rows）")
+    parser.add_argument('--select-max-bytes', type=int, default=int(SELECT_SETTINGS['max_result_bytes']),
+                        help="只读查询最多返回的字节数，超出部分截断（max_result_bytes）")
+    parser.add_argument('--select-format', default=SELECT_SETTINGS['default_format'],
+                        help="只读查询的输出格式（如 RowBinary、Native，报告中只记录结果大小）")
+    parser.add_argument('--capture-bytes', type=int, default=RESULT_CAPTURE_BYTES,
+                        help=f"每条语句最多读取的结果字节数，超出后断开连接（默认 {RESULT_CAPTURE_BYTES}，0 表示不限）")
+    parser.add_argument('--capture-rows', type=int, default=RESULT_CAPTURE_ROWS,
+                        help=f"每条语句最多读取的结果行数（默认 {RESULT_CAPTURE_ROWS}，0 表示不限）")
+    parser.add_argument('--sandbox', action='store_true',
+                        help="沙箱模式：每个文件改写到自己的临时数据库中执行（执行前批量建库、结束后批量删库），"
+                             "文件之间不再冲突，可以配合 -j 全部并发执行")
+    parser.add_argument('--keep-sandboxes', action='store_true',
+                        help="沙箱模式下执行结束后保留沙箱数据库（用于排查问题）")
+    parser.add_argument('--datagen', type=parse_row_count, default=None, metavar='ROWS',
+                        help="为性能示例（DATAGEN_FILES）读取的表在服务端生成 ROWS 行数据"
+                             "（支持 K/M/B 后缀，如 10M、1B），使文档中的优化效果可以实际测量")
+    parser.add_argument('--datagen-files', default=None,
+                        help="需要生成数据的文件（相对路径，逗号分隔，支持通配符；默认 DATAGEN_FILES）")
+    parser.add_argument('--datagen-chunk-rows', type=parse_row_count, default=DATAGEN_CHUNK_ROWS,
+                        help=f"每个 INSERT ... SELECT 生成的行数（默认 {DATAGEN_CHUNK_ROWS}）")
+    parser.add_argument('--profile', action='store_true',
+                        help="性能分析：每条语句使用确定的 query_id，执行结束后从 system.query_log "
+                             "批量取回 ProfileEvents、内存、读取行数/字节数和耗时，合并到报告中")
+    parser.add_argument('--report-from', type=Path, default=None, metavar='EVENTS_JSONL',
+                        help="不执行 SQL，只从已有的事件日志（如被中断的执行留下的）重新生成报告")
+    return parser.parse_args()
+
+
 def main():
     """主函数"""
+    args = parse_args()
+
     print("=" * 80)
     print("ClickHouse SQL 文件扫描和执行工具")
     print("=" * 80)
 
+    if args.rate_limit is not None:
+        CLUSTER_RATE_LIMITS[CLICKHOUSE_CLUSTER] = args.rate_limit
+    global RESULT_CAPTURE_BYTES, RESULT_CAPTURE_ROWS
+    RESULT_CAPTURE_BYTES, RESULT_CAPTURE_ROWS = args.capture_bytes, args.capture_rows
+    SELECT_SETTINGS.update(max_result_rows=str(args.select_max_rows),
+                           max_result_bytes=str(args.select_max_bytes),
+                           default_format=args.select_format)
+
+    output_dir = PROJECT_ROOT / "00-infra" / "execution_results"
+    if args.report_from:
+        generate_report(args.report_from, output_dir)
+        sys.exit(0)
+
     # 初始化客户端
-    client = ClickHouseClient()
+    pool = EndpointPool(args.endpoints, args.routing)
+    client_factory = partial(ClickHouseClient, compression=args.compression, retries=args.retries, pool=pool)
+    client = client_factory()
+
+    if len(args.endpoints) > 1:
+        print(f"\n检查 {len(args.endpoints)} 个节点（路由策略: {args.routing}）...")
+        for (host, port), healthy in pool.check_health().items():
+            print(f"  {'✓' if healthy else '✗'} {host}:{port}")
 
     # 测试连接
     print("\n测试 ClickHouse 连接...")
@@ -406,6 +2861,10 @@ def main():
     else:
         print(f"✗ 连接失败: {result}")
         sys.exit(1)
+    server_version = result
+
+    cache = ResultCache(output_dir / "result_cache.sqlite", server_version)
+    started_at = datetime.now().isoformat()
 
     # 扫描 SQL 文件
     print("\n扫描 SQL 文件...")
@@ -417,39 +2876,105 @@ def main():
 
     print(f"找到 {len(sql_files)} 个 SQL 文件\n")
 
+    # 结果边执行边写入事件日志，报告在结束后（包括中断后）从日志生成
+    events_path = output_dir / "execution_events.jsonl"
+    results = ReportWriter(events_path)
+    if args.changed_only:
+        sql_files_to_run = select_changed_files(sql_files, cache, results)
+        print(f"增量执行: {len(sql_files_to_run)} 个文件有变化或依赖有变化，"
+              f"{len(sql_files) - len(sql_files_to_run)} 个文件使用缓存结果")
+    else:
+        sql_files_to_run = sql_files
+
     # 询问是否执行
-    response = input(f"\n是否执行所有 {len(sql_files)} 个 SQL 文件？ (y/n): ")
+    response = input(f"\n是否执行 {len(sql_files_to_run)} 个 SQL 文件？ (y/n): ")
     if response.lower() != 'y':
+        results.close()
         print("已取消")
         sys.exit(0)
 
-    # 执行 SQL 文件
-    results = {}
-    total_statements = 0
-
-    for sql_file in sql_files:
-        count = execute_sql_file(sql_file, client, results)
-        total_statements += count
-
-    # 生成报告
-    print("\n" + "=" * 80)
-    print("生成执行报告...")
-    print("=" * 80)
-
-    output_dir = PROJECT_ROOT / "00-infra" / "execution_results"
-    generate_report(results, output_dir)
+    # 性能分析：本次执行的 query_id 统一使用带时间戳的前缀，结束后按前缀批量查询 query_log
+    profiles_path = output_dir / "execution_profiles.jsonl"
+    query_id_prefix = None
+    if args.profile:
+        query_id_prefix = f"{QUERY_ID_PREFIX}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    elif profiles_path.exists():
+        # 上一次执行的分析结果与本次无关
+        profiles_path.unlink()
+
+    # 沙箱模式：一次性创建所有文件的沙箱数据库
+    sandboxes = None
+    if args.sandbox:
+        sandboxes = {sql_file: FileSandbox(str(sql_file.relative_to(PROJECT_ROOT)), read_sql_statements(sql_file))
+                     for sql_file in sql_files_to_run}
+        setup = [stmt for sandbox in sandboxes.values() for stmt in sandbox.setup_statements(CLICKHOUSE_CLUSTER)]
+        print(f"\n沙箱模式: 为 {len(sandboxes)} 个文件创建 {len(setup)} 个数据库...")
+        for error in run_sandbox_ddl(client, setup, CLICKHOUSE_CLUSTER):
+            print(f"  ✗ {error}")
+
+    datagen = None
+    if args.datagen:
+        files = args.datagen_files.split(',') if args.datagen_files else DATAGEN_FILES
+        datagen = DataGenerator(args.datagen, args.datagen_chunk_rows, [f.strip() for f in files])
+        print(f"\n数据生成: 每张表 {args.datagen} 行（{', '.join(datagen.files)}）")
+
+    # 执行 SQL 文件；中途出错或被中断也照样生成报告
+    try:
+        if args.jobs > 1:
+            execute_sql_files_parallel(sql_files_to_run, results, args.jobs,
+                                       client_factory, args.batch_size, query_id_prefix, sandboxes, datagen)
+        else:
+            for sql_file in sql_files_to_run:
+                execute_sql_file(sql_file, client, results, args.batch_size, query_id_prefix,
+                                 sandboxes[sql_file] if sandboxes else None, datagen)
+    finally:
+        results.close()
+
+        if sandboxes and not args.keep_sandboxes:
+            teardown = [stmt for sandbox in sandboxes.values()
+                        for stmt in sandbox.teardown_statements(CLICKHOUSE_CLUSTER)]
+            print(f"\n删除 {len(teardown)} 个沙箱数据库...")
+            for error in run_sandbox_ddl(client, teardown, CLICKHOUSE_CLUSTER):
+                print(f"  ✗ {error}")
+
+        # 更新结果缓存
+        run_keys = {str(sql_file.relative_to(PROJECT_ROOT)) for sql_file in sql_files_to_run}
+        for file_key, entries in iter_file_results(events_path):
+            if file_key in run_keys:
+                cache.record_file(file_key, entries)
+        cache.close()
+
+        if query_id_prefix:
+            print(f"\n从 system.query_log 读取性能分析数据（query_id 前缀 {query_id_prefix}）...")
+            count = fetch_query_profiles(client, query_id_prefix, profiles_path,
+                                         CLICKHOUSE_CLUSTER if len(args.endpoints) > 1 else None)
+            print(f"  取回 {count} 条记录: {profiles_path}")
+
+        # 记录执行历史，供 run_history.py compare 比较
+        history = RunHistory(output_dir / "run_history.sqlite")
+        profiles = load_query_profiles(profiles_path) if profiles_path.exists() else {}
+        run_id = history.record_run(server_version, started_at, iter_file_results(events_path), profiles)
+        history.close()
+        print(f"\n执行历史已记录: run #{run_id}")
+
+        # 生成报告
+        print("\n" + "=" * 80)
+        print("生成执行报告...")
+        print("=" * 80)
+
+        generate_report(events_path, output_dir)
 
     # 显示总结
-    total_success = sum(sum(1 for s in stmts if s['success']) for stmts in results.values())
-    total_errors = total_statements - total_success
+    total_errors = results.totals['total_errors']
 
     print("\n" + "=" * 80)
     print("执行总结")
     print("=" * 80)
     print(f"文件总数: {len(sql_files)}")
-    print(f"语句总数: {total_statements}")
-    print(f"成功: {total_success}")
+    print(f"语句总数: {results.totals['total_statements']}")
+    print(f"成功: {results.totals['total_success']}")
     print(f"失败: {total_errors}")
+    print(f"语句总耗时: {results.totals['total_elapsed']:.2f}s")
 
     if total_errors > 0:
         print(f"\n⚠️  有 {total_errors} 个语句执行失败，请查看报告详情")
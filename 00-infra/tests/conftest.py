@@ -0,0 +1,90 @@
+"""
+测试公共设施：在进程内启动模拟 ClickHouse 服务器（mock_clickhouse_server.py）
+
+运行方法（在 00-infra 目录下）：
+    python -m pytest tests -q
+"""
+
+import re
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import run_sql_files
+from mock_clickhouse_server import ERROR_NAMES, MOCK_VERSION, MockClickHouseServer
+from run_sql_files import ClickHouseClient
+
+_CREATE_TABLE = re.compile(r'^\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\S+)', re.IGNORECASE)
+_INSERT_INTO = re.compile(r'^\s*INSERT\s+INTO\s+(\S+)', re.IGNORECASE)
+
+
+class ScriptedServer(MockClickHouseServer):
+    """
+    记录收到的语句，并按脚本返回错误的模拟服务器
+
+    - fail(pattern, *codes)：匹配 pattern 的语句依次返回 codes 中的异常码，用完后正常执行
+    - 记录 CREATE TABLE 创建的表，INSERT 到不存在的表返回 UNKNOWN_TABLE
+    - insert_response_bytes：INSERT 的响应体大小（用于验证大响应不会阻塞流水线）
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.statements = []
+        self.tables = set()
+        self.insert_response_bytes = 0
+        self._scripted = []
+        self._script_lock = threading.Lock()
+
+    def fail(self, pattern: str, *codes: int):
+        self._scripted.append((re.compile(pattern, re.IGNORECASE), list(codes)))
+
+    def respond(self, query: str):
+        statement = ' '.join(query.split())
+        with self._script_lock:
+            self.statements.append(statement)
+            code = None
+            for pattern, codes in self._scripted:
+                if codes and pattern.search(statement):
+                    code = codes.pop(0)
+                    break
+            if code is None:
+                create = _CREATE_TABLE.match(statement)
+                insert = _INSERT_INTO.match(statement)
+                if create:
+                    self.tables.add(create.group(1))
+                elif insert and insert.group(1) not in self.tables:
+                    code = 60
+
+        if code is not None:
+            name = ERROR_NAMES.get(code, 'UNKNOWN_EXCEPTION')
+            summary = {'read_rows': 0, 'read_bytes': 0, 'written_rows': 0, 'written_bytes': 0,
+                       'result_rows': 0, 'result_bytes': 0, 'elapsed_ns': 0, 'exception_code': code}
+            return 500, f"Code: {code}. DB::Exception: Scripted error. ({name}) (version {MOCK_VERSION})\n", summary
+
+        status, text, summary = super().respond(query)
+        if self.insert_response_bytes and statement.upper().startswith('INSERT'):
+            text = 'x' * self.insert_response_bytes + '\n'
+        return status, text, summary
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    """重试不等待"""
+    monkeypatch.setattr(run_sql_files, 'RETRY_BASE_DELAY', 0.0)
+
+
+@pytest.fixture
+def server():
+    with ScriptedServer() as mock:
+        yield mock
+
+
+@pytest.fixture
+def client(server):
+    client = ClickHouseClient(host=server.host, port=server.port)
+    yield client
+    client._close_pipeline_connection()
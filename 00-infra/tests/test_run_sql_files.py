@@ -0,0 +1,344 @@
+"""run_sql_files.py 的测试（使用模拟 ClickHouse 服务器，不需要真实集群）"""
+
+import contextlib
+import io
+import socket
+import threading
+
+import pytest
+
+import run_sql_files
+from conftest import ScriptedServer
+
+
+def _queries(*statements):
+    return [(statement, None, None) for statement in statements]
+
+
+def _succeeded(outcomes):
+    return [success for success, _, _ in outcomes]
+
+
+# ---------------------------------------------------------------------------
+# 流水线批量执行（execute_batch）
+# ---------------------------------------------------------------------------
+
+def test_pipeline_keeps_order_when_statement_fails(server, client):
+    server.fail(r'^CREATE TABLE b\b', 62)
+    statements = [
+        "CREATE TABLE a (x UInt8) ENGINE = Memory",
+        "INSERT INTO a VALUES (1)",
+        "CREATE TABLE b (x UInt8) ENGINE = Memory",
+        "CREATE TABLE c (x UInt8) ENGINE = Memory",
+        "INSERT INTO c VALUES (1)",
+    ]
+
+    outcomes = client.execute_batch(_queries(*statements))
+
+    assert _succeeded(outcomes) == [True, True, False, True, True]
+    assert 'SYNTAX_ERROR' in outcomes[2][1]
+    assert server.statements == statements
+
+
+def test_pipeline_runs_selects_individually_in_order(server, client):
+    statements = [
+        "CREATE TABLE a (x UInt8) ENGINE = Memory",
+        "SELECT count() FROM a",
+        "INSERT INTO a VALUES (1)",
+        "SELECT count() FROM a",
+    ]
+
+    outcomes = client.execute_batch(_queries(*statements))
+
+    assert all(_succeeded(outcomes))
+    assert server.statements == statements
+    assert outcomes[1][1] == '1'
+
+
+def test_pipeline_does_not_stall_on_large_responses(server, client, monkeypatch):
+    monkeypatch.setattr(run_sql_files, 'READ_TIMEOUT', 10)
+    server.insert_response_bytes = 1024 * 1024
+    values = ', '.join(f"({i})" for i in range(2000))
+    statements = ["CREATE TABLE a (x UInt32) ENGINE = Memory"] + [f"INSERT INTO a VALUES {values}"] * 40
+
+    outcomes = client.execute_batch(_queries(*statements))
+
+    assert all(_succeeded(outcomes))
+    assert len(server.statements) == len(statements)
+
+
+def test_pipeline_marks_unanswered_statements_failed_when_connection_drops():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+
+    def answer_one_then_close():
+        conn, _ = listener.accept()
+        conn.recv(65536)
+        conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+        # 只关闭写方向并读完剩余请求，避免未读数据触发 RST 丢掉已发送的响应
+        conn.shutdown(socket.SHUT_WR)
+        while conn.recv(65536):
+            pass
+        conn.close()
+
+    thread = threading.Thread(target=answer_one_then_close, daemon=True)
+    thread.start()
+    client = run_sql_files.ClickHouseClient(host='127.0.0.1', port=listener.getsockname()[1], retries=0)
+    try:
+        outcomes = client.execute_batch(_queries(*["CREATE TABLE t (x UInt8) ENGINE = Memory"] * 5))
+    finally:
+        listener.close()
+
+    assert outcomes[0][0]
+    assert not any(_succeeded(outcomes[1:]))
+    assert all('Pipeline aborted' in result for _, result, _ in outcomes[1:])
+
+
+# ---------------------------------------------------------------------------
+# 临时错误重试
+# ---------------------------------------------------------------------------
+
+def test_transient_error_is_retried_until_success(server, client):
+    server.fail(r'^SELECT', 202, 999)
+
+    success, _, stats = client.execute_query_with_stats("SELECT 1")
+
+    assert success
+    assert stats['attempts'] == 3
+
+
+def test_permanent_error_is_not_retried(server, client):
+    server.fail(r'^SELECT', 62)
+
+    success, result, stats = client.execute_query_with_stats("SELECT 1")
+
+    assert not success
+    assert stats['attempts'] == 1
+    assert stats['error'].code == 62 and not stats['error'].transient
+
+
+def test_pipeline_retries_transient_failure_in_place(server, client):
+    # CREATE 第一次因 Keeper 故障失败：必须先重试成功，后面的 INSERT 才能写入
+    server.fail(r'^CREATE TABLE b\b', 999)
+    statements = [
+        "CREATE TABLE a (x UInt8) ENGINE = Memory",
+        "CREATE TABLE b (x UInt8) ENGINE = Memory",
+        "INSERT INTO b VALUES (1)",
+        "INSERT INTO a VALUES (1)",
+    ]
+
+    outcomes = client.execute_batch(_queries(*statements))
+
+    assert all(_succeeded(outcomes))
+    assert outcomes[1][2]['attempts'] == 2
+    # 已发送的 INSERT INTO a 成功后不会重复执行；失败的 INSERT INTO b 在重试之后重新执行
+    assert server.statements.count("INSERT INTO a VALUES (1)") == 1
+    last = {statement: i for i, statement in enumerate(server.statements)}
+    assert server.statements.count("CREATE TABLE b (x UInt8) ENGINE = Memory") == 2
+    assert last["CREATE TABLE b (x UInt8) ENGINE = Memory"] < last["INSERT INTO b VALUES (1)"]
+
+
+def test_insert_with_unknown_status_is_not_retried(server, client):
+    server.fail(r'^INSERT', 319)
+    client.execute_query_with_stats("CREATE TABLE t (x UInt8) ENGINE = Memory")
+
+    success, result, stats = client.execute_query_with_stats("INSERT INTO t VALUES (1)")
+
+    assert not success
+    assert stats['attempts'] == 1
+    assert stats['error'].unknown_status
+    assert server.statements.count("INSERT INTO t VALUES (1)") == 1
+
+
+def test_insert_rejected_before_execution_is_retried(server, client):
+    server.fail(r'^INSERT', 202)
+    client.execute_query_with_stats("CREATE TABLE t (x UInt8) ENGINE = Memory")
+
+    success, _, stats = client.execute_query_with_stats("INSERT INTO t VALUES (1)")
+
+    assert success
+    assert stats['attempts'] == 2
+
+
+def test_connection_refused_is_retried():
+    probe = socket.socket()
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    client = run_sql_files.ClickHouseClient(host='127.0.0.1', port=port, retries=2)
+
+    success, result, stats = client.execute_query_with_stats("INSERT INTO t VALUES (1)")
+
+    assert not success
+    assert stats['attempts'] == 3
+    assert result == "Connection failed"
+
+
+# ---------------------------------------------------------------------------
+# 多节点路由（EndpointPool）
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def nodes():
+    with contextlib.ExitStack() as stack:
+        yield [stack.enter_context(ScriptedServer()) for _ in range(3)]
+
+
+def _received(node, statement):
+    return statement in node.statements
+
+
+def test_select_after_write_goes_to_coordinator(nodes):
+    coordinator, *replicas = nodes
+    pool = run_sql_files.EndpointPool([(node.host, node.port) for node in nodes])
+    client = run_sql_files.ClickHouseClient(pool=pool)
+
+    client.execute_query("CREATE TABLE t (x UInt8) ENGINE = Memory", database='db')
+    client.execute_query("INSERT INTO t VALUES (1)", database='db')
+    for _ in range(4):
+        client.execute_query("SELECT count() FROM db.t")
+
+    assert coordinator.statements.count("SELECT count() FROM db.t") == 4
+    assert not any(_received(replica, "SELECT count() FROM db.t") for replica in replicas)
+    assert not any(_received(replica, "INSERT INTO t VALUES (1)") for replica in replicas)
+
+
+def test_select_of_unwritten_table_is_spread_to_replicas(nodes):
+    pool = run_sql_files.EndpointPool([(node.host, node.port) for node in nodes])
+    client = run_sql_files.ClickHouseClient(pool=pool)
+
+    client.execute_query("INSERT INTO db.t VALUES (1)")
+    for _ in range(6):
+        client.execute_query("SELECT count() FROM db.other")
+
+    assert sum(_received(node, "SELECT count() FROM db.other") for node in nodes) == 3
+
+
+def test_statement_head_strips_insert_data():
+    assert run_sql_files.statement_head("INSERT INTO t VALUES (1), (2)") == "INSERT INTO t VALUES"
+    assert run_sql_files.statement_head("INSERT INTO t SELECT * FROM s") == "INSERT INTO t SELECT * FROM s"
+    assert run_sql_files.statement_head("SELECT 1") == "SELECT 1"
+
+
+# ---------------------------------------------------------------------------
+# 语句分割（iter_sql_statements）
+# ---------------------------------------------------------------------------
+
+TOKENIZER_SQL = r"""-- header; comment
+CREATE TABLE t (s String) ENGINE = Memory;
+INSERT INTO t VALUES ('a;b'), ('it''s'), ('back\\slash\';');
+SELECT `odd;name`, "quoted;id" FROM t /* block; comment */ WHERE 1;
+# hash comment; here
+SELECT 1 #!shebang-style; comment
+;
+CREATE FUNCTION f AS $$ SELECT 1; $$;
+SELECT $tag$ a;$$b $tag$, 'x' -- trailing; comment
+"""
+
+TOKENIZER_STATEMENTS = [
+    "CREATE TABLE t (s String) ENGINE = Memory",
+    r"INSERT INTO t VALUES ('a;b'), ('it''s'), ('back\\slash\';')",
+    'SELECT `odd;name`, "quoted;id" FROM t   WHERE 1',
+    "SELECT 1",
+    "CREATE FUNCTION f AS $$ SELECT 1; $$",
+    "SELECT $tag$ a;$$b $tag$, 'x'",
+]
+
+
+def test_tokenizer_splits_identically_at_every_chunk_size():
+    # 块边界落在每一个位置上：引号双写、转义符、注释起始符和 heredoc 标签都可能被截断
+    for chunk_size in range(1, len(TOKENIZER_SQL) + 2):
+        statements = list(run_sql_files.iter_sql_statements(io.StringIO(TOKENIZER_SQL), chunk_size))
+        assert statements == TOKENIZER_STATEMENTS, f"chunk_size={chunk_size}"
+
+
+# ---------------------------------------------------------------------------
+# 文件依赖分析（build_dependency_graph）
+# ---------------------------------------------------------------------------
+
+def test_files_conflict():
+    conflict = run_sql_files._files_conflict
+    assert conflict(({'db.a'}, set()), (set(), {'db.a'}))
+    assert conflict((set(), {'db.a'}), ({'db.a'}, set()))
+    assert conflict(({'db.a'}, set()), ({'db.a'}, set()))
+    # 写入数据库与读取库中的表冲突
+    assert conflict(({'db'}, set()), (set(), {'db.a'}))
+    # 只读同一个对象不冲突
+    assert not conflict((set(), {'db.a'}), (set(), {'db.a'}))
+    assert not conflict(({'db.a'}, {'db.src'}), ({'db.b'}, {'db.src'}))
+    assert not conflict(({'db.a'}, set()), ({'db.ab'}, set()))
+
+
+def test_dependency_graph(tmp_path):
+    files = {
+        'a.sql': "CREATE TABLE db.a (x UInt8) ENGINE = Memory;\nINSERT INTO db.a VALUES (1);",
+        'b.sql': "CREATE TABLE db.b (x UInt8) ENGINE = Memory;",
+        'c.sql': "INSERT INTO db.b SELECT * FROM db.a;",
+        'd.sql': "SELECT * FROM db.a;",
+        'e.sql': "DROP DATABASE db;",
+    }
+    for name, content in files.items():
+        (tmp_path / name).write_text(content, encoding='utf-8')
+    a, b, c, d, e = (tmp_path / name for name in files)
+    # 无法读取的文件作为全局屏障
+    missing = tmp_path / 'missing.sql'
+
+    graph = run_sql_files.build_dependency_graph([a, b, c, d, e, missing])
+
+    assert graph[a] == set()
+    assert graph[b] == set()
+    assert graph[c] == {a, b}
+    assert graph[d] == {a}
+    assert graph[e] == {a, b, c, d}
+    assert graph[missing] == {a, b, c, d, e}
+
+
+# ---------------------------------------------------------------------------
+# 数据生成（DataGenerator）
+# ---------------------------------------------------------------------------
+
+def test_datagen_fills_only_tables_written_by_the_file():
+    datagen = run_sql_files.DataGenerator(rows=10)
+    create = "CREATE TABLE db.events (id UInt64) ENGINE = MergeTree ORDER BY id"
+    query = "SELECT count() FROM db.events"
+
+    assert datagen.tables_to_fill(create, None, 'a.sql') == []
+    assert datagen.tables_to_fill(query, None, 'a.sql') == [('db.events', False)]
+    # 同一文件只生成一次
+    assert datagen.tables_to_fill(query, None, 'a.sql') == []
+    # 其他文件没有写入过这张表
+    assert datagen.tables_to_fill(query, None, 'b.sql') == []
+
+
+def test_datagen_ignores_cte_names():
+    datagen = run_sql_files.DataGenerator(rows=10)
+    datagen.tables_to_fill("CREATE TABLE events (id UInt64) ENGINE = MergeTree ORDER BY id", 'db', 'a.sql')
+
+    tables = datagen.tables_to_fill(
+        "WITH recent AS (SELECT id FROM events) SELECT count() FROM recent", 'db', 'a.sql')
+
+    assert tables == [('db.events', False)]
+
+
+def test_datagen_refills_after_reset_and_reindex():
+    datagen = run_sql_files.DataGenerator(rows=10)
+    query = "SELECT count() FROM db.events"
+    datagen.tables_to_fill("CREATE TABLE db.events (id UInt64) ENGINE = MergeTree ORDER BY id", None, 'a.sql')
+    datagen.tables_to_fill(query, None, 'a.sql')
+
+    # 加索引后清空并重新生成
+    datagen.tables_to_fill("ALTER TABLE db.events ADD INDEX idx id TYPE minmax", None, 'a.sql')
+    assert datagen.tables_to_fill(query, None, 'a.sql') == [('db.events', True)]
+
+    # 重建的表是空的，不需要清空
+    datagen.tables_to_fill("DROP TABLE db.events", None, 'a.sql')
+    datagen.tables_to_fill("CREATE TABLE db.events (id UInt64) ENGINE = MergeTree ORDER BY id", None, 'a.sql')
+    assert datagen.tables_to_fill(query, None, 'a.sql') == [('db.events', False)]
+
+
+def test_sql_literals_are_escaped():
+    assert run_sql_files.sql_string("it's") == r"'it\'s'"
+    assert run_sql_files.sql_string("a\\b") == r"'a\\b'"
+    assert run_sql_files.sql_identifier("we`ird") == r"`we\`ird`"
+    assert run_sql_files.sql_identifier("a\\b") == r"`a\\b`"
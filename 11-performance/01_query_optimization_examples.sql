@@ -1,7 +1,17 @@
--- 创建数据库（如果存在则不创建）
-CREATE DATABASE IF NOT EXISTS example;
+-- ================================================
+-- 01_query_optimization_examples.sql
+-- 从 01_query_optimization.md 提取的 SQL 示例
+-- 提取时间: 2026-10-17 03:54:10
+-- ================================================
 
 
+-- ========================================
+-- 查询优化基础 > 基本原则 > 1. 使用分区裁剪
+-- 来源: 01_query_optimization.md:9
+-- 属性: bench=partition_pruning
+-- ========================================
+
+-- ✅ 使用分区裁剪（快速）
 SELECT * FROM events
 WHERE event_time >= now() - INTERVAL 7 DAY;
 
@@ -10,7 +20,9 @@ SELECT * FROM events
 WHERE toYYYYMM(event_time) >= toYYYYMM(now() - INTERVAL 7 DAY);
 
 -- ========================================
--- 1. 使用分区裁剪
+-- 查询优化基础 > 基本原则 > 2. 使用主键查询
+-- 来源: 01_query_optimization.md:21
+-- 属性: bench=primary_key_lookup
 -- ========================================
 
 -- ✅ 使用主键（快速）
@@ -22,7 +34,8 @@ SELECT * FROM users
 WHERE email = 'user@example.com';
 
 -- ========================================
--- 1. 使用分区裁剪
+-- 查询优化基础 > 基本原则 > 3. 避免在 WHERE 中使用函数
+-- 来源: 01_query_optimization.md:33
 -- ========================================
 
 -- ❌ 在 WHERE 中使用函数（慢速）
@@ -35,7 +48,8 @@ WHERE created_at >= '2024-01-01'
   AND created_at < '2024-02-01';
 
 -- ========================================
--- 1. 使用分区裁剪
+-- 查询优化基础 > 基本原则 > 4. 使用 PREWHERE 优化
+-- 来源: 01_query_optimization.md:46
 -- ========================================
 
 -- 使用 PREWHERE 过滤大列
@@ -48,7 +62,8 @@ PREWHERE event_time >= now() - INTERVAL 7 DAY
 WHERE user_id = 123;
 
 -- ========================================
--- 1. 使用分区裁剪
+-- 查询优化基础 > 基本原则 > 5. 限制返回的数据量
+-- 来源: 01_query_optimization.md:59
 -- ========================================
 
 -- 使用 LIMIT
@@ -62,7 +77,8 @@ SAMPLE 0.1  -- 10% 的数据
 WHERE event_time >= now() - INTERVAL 7 DAY;
 
 -- ========================================
--- 1. 使用分区裁剪
+-- 查询优化基础 > 查询执行计划 > EXPLAIN PLAN
+-- 来源: 01_query_optimization.md:75
 -- ========================================
 
 -- 查看查询执行计划
@@ -75,7 +91,8 @@ WHERE event_time >= now() - INTERVAL 7 DAY
 GROUP BY user_id;
 
 -- ========================================
--- 1. 使用分区裁剪
+-- 查询优化基础 > 查询执行计划 > EXPLAIN PIPELINE
+-- 来源: 01_query_optimization.md:108
 -- ========================================
 
 -- 查看查询管道
@@ -88,7 +105,8 @@ WHERE event_time >= now() - INTERVAL 7 DAY
 GROUP BY user_id;
 
 -- ========================================
--- 1. 使用分区裁剪
+-- 查询优化基础 > 查询执行计划 > EXPLAIN ESTIMATE
+-- 来源: 01_query_optimization.md:121
 -- ========================================
 
 -- 查看查询预估
@@ -101,7 +119,9 @@ WHERE event_time >= now() - INTERVAL 7 DAY
 GROUP BY user_id;
 
 -- ========================================
--- 1. 使用分区裁剪
+-- 查询优化基础 > 查询优化技巧 > 技巧 1: 使用 IN 而非 OR
+-- 来源: 01_query_optimization.md:136
+-- 属性: bench=in_vs_or
 -- ========================================
 
 -- ❌ 使用 OR（慢速）
@@ -115,7 +135,8 @@ SELECT * FROM users
 WHERE user_id IN (1, 2, 3);
 
 -- ========================================
--- 1. 使用分区裁剪
+-- 查询优化基础 > 查询优化技巧 > 技巧 2: 使用 JOIN 而非子查询
+-- 来源: 01_query_optimization.md:150
 -- ========================================
 
 -- ❌ 使用子查询（慢速）
@@ -128,11 +149,12 @@ FROM orders o
 INNER JOIN active_users u ON o.user_id = u.user_id;
 
 -- ========================================
--- 1. 使用分区裁剪
+-- 查询优化基础 > 查询优化技巧 > 技巧 3: 使用物化列
+-- 来源: 01_query_optimization.md:163
 -- ========================================
 
 -- 创建物化列
-CREATE TABLE IF NOT EXISTS events (
+CREATE TABLE events (
     event_id UInt64,
     user_id UInt64,
     event_type String,
@@ -152,7 +174,8 @@ WHERE event_month = '2024-01'
 GROUP BY user_id;
 
 -- ========================================
--- 1. 使用分区裁剪
+-- 查询优化基础 > 查询优化技巧 > 技巧 4: 使用 LIMIT BY
+-- 来源: 01_query_optimization.md:187
 -- ========================================
 
 -- 获取每个用户的最新事件
@@ -163,7 +186,9 @@ ORDER BY user_id, event_time DESC
 LIMIT 1 BY user_id;
 
 -- ========================================
--- 1. 使用分区裁剪
+-- 查询优化基础 > 查询优化技巧 > 技巧 5: 使用 DISTINCT 替代 GROUP BY
+-- 来源: 01_query_optimization.md:198
+-- 属性: bench=distinct_vs_group_by
 -- ========================================
 
 -- ❌ 使用 GROUP BY（慢速）
@@ -173,21 +198,23 @@ SELECT user_id FROM events GROUP BY user_id;
 SELECT DISTINCT user_id FROM events;
 
 -- ========================================
--- 1. 使用分区裁剪
+-- 查询优化基础 > 查询并行化 > 设置并行度
+-- 来源: 01_query_optimization.md:210
 -- ========================================
 
 -- 设置并行线程数
 SELECT * FROM events
--- REMOVED SET max_threads (not supported) 8
+SETTINGS max_threads = 8
 WHERE event_time >= now() - INTERVAL 7 DAY;
 
 -- 设置并发读取
 SELECT * FROM events
--- REMOVED SET max_concurrent_queries (not supported) 4
+SETTINGS max_concurrent_queries = 4
 WHERE event_time >= now() - INTERVAL 7 DAY;
 
 -- ========================================
--- 1. 使用分区裁剪
+-- 查询优化基础 > 查询并行化 > 分布式查询并行
+-- 来源: 01_query_optimization.md:224
 -- ========================================
 
 -- 设置分布式查询并行
@@ -196,7 +223,8 @@ SETTINGS max_parallel_replicas = 2
 WHERE event_time >= now() - INTERVAL 7 DAY;
 
 -- ========================================
--- 1. 使用分区裁剪
+-- 查询优化基础 > 查询性能分析 > 查看查询日志
+-- 来源: 01_query_optimization.md:235
 -- ========================================
 
 -- 查看最近的查询
@@ -215,7 +243,8 @@ ORDER BY event_time DESC
 LIMIT 10;
 
 -- ========================================
--- 1. 使用分区裁剪
+-- 查询优化基础 > 查询性能分析 > 分析慢查询
+-- 来源: 01_query_optimization.md:254
 -- ========================================
 
 -- 查看慢查询
@@ -233,7 +262,8 @@ ORDER BY query_duration_ms DESC
 LIMIT 20;
 
 -- ========================================
--- 1. 使用分区裁剪
+-- 查询优化基础 > 查询性能分析 > 查看查询统计
+-- 来源: 01_query_optimization.md:272
 -- ========================================
 
 -- 查看查询统计
@@ -252,7 +282,8 @@ ORDER BY query_count DESC
 LIMIT 10;
 
 -- ========================================
--- 1. 使用分区裁剪
+-- 查询优化基础 > 查询优化示例 > 示例 1: 时间范围查询优化
+-- 来源: 01_query_optimization.md:293
 -- ========================================
 
 -- ❌ 优化前
@@ -266,7 +297,8 @@ WHERE event_time >= '2024-01-01'
   AND event_time < '2024-02-01';
 
 -- ========================================
--- 1. 使用分区裁剪
+-- 查询优化基础 > 查询优化示例 > 示例 2: 聚合查询优化
+-- 来源: 01_query_optimization.md:307
 -- ========================================
 
 -- ❌ 优化前
@@ -299,7 +331,8 @@ GROUP BY user_id
 HAVING sumMerge(event_count) > 100;
 
 -- ========================================
--- 1. 使用分区裁剪
+-- 查询优化基础 > 查询优化示例 > 示例 3: JOIN 查询优化
+-- 来源: 01_query_optimization.md:340
 -- ========================================
 
 -- ❌ 优化前
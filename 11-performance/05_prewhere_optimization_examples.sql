@@ -1,3 +1,15 @@
+-- ================================================
+-- 05_prewhere_optimization_examples.sql
+-- 从 05_prewhere_optimization.md 提取的 SQL 示例
+-- 提取时间: 2026-10-17 03:54:10
+-- ================================================
+
+
+-- ========================================
+-- PREWHERE 优化 > PREWHERE 语法 > 基本 PREWHERE
+-- 来源: 05_prewhere_optimization.md:32
+-- ========================================
+
 SELECT 
     user_id,
     event_type,
@@ -7,7 +19,8 @@ PREWHERE event_time >= now() - INTERVAL 7 DAY
 WHERE user_id = 123;
 
 -- ========================================
--- 基本 PREWHERE
+-- PREWHERE 优化 > PREWHERE 语法 > 复合 PREWHERE
+-- 来源: 05_prewhere_optimization.md:44
 -- ========================================
 
 SELECT 
@@ -21,7 +34,8 @@ WHERE user_id = 123
   AND event_type = 'click';
 
 -- ========================================
--- 基本 PREWHERE
+-- PREWHERE 优化 > PREWHERE 语法 > 自动 PREWHERE
+-- 来源: 05_prewhere_optimization.md:60
 -- ========================================
 
 -- 编写的查询
@@ -43,7 +57,8 @@ PREWHERE event_time >= now() - INTERVAL 7 DAY
 WHERE user_id = 123;
 
 -- ========================================
--- 基本 PREWHERE
+-- PREWHERE 优化 > PREWHERE 优化场景 > 场景 1: 时间范围过滤
+-- 来源: 05_prewhere_optimization.md:84
 -- ========================================
 
 -- ✅ 使用 PREWHERE 过滤时间范围
@@ -65,7 +80,8 @@ WHERE event_time >= now() - INTERVAL 30 DAY
   AND user_id IN (1, 2, 3, ..., 1000);
 
 -- ========================================
--- 基本 PREWHERE
+-- PREWHERE 优化 > PREWHERE 优化场景 > 场景 2: 大列过滤
+-- 来源: 05_prewhere_optimization.md:108
 -- ========================================
 
 -- ✅ 使用 PREWHERE 过滤大列
@@ -85,7 +101,8 @@ WHERE event_data LIKE '%keyword%'
   AND user_id IN (1, 2, 3, ..., 1000);
 
 -- ========================================
--- 基本 PREWHERE
+-- PREWHERE 优化 > PREWHERE 优化场景 > 场景 3: 状态过滤
+-- 来源: 05_prewhere_optimization.md:130
 -- ========================================
 
 -- ✅ 使用 PREWHERE 过滤状态
@@ -109,7 +126,9 @@ WHERE status = 1
   AND event_time >= now() - INTERVAL 7 DAY;
 
 -- ========================================
--- 基本 PREWHERE
+-- PREWHERE 优化 > PREWHERE 优化技巧 > 技巧 1: 选择高选择性条件
+-- 来源: 05_prewhere_optimization.md:158
+-- 属性: bench=prewhere_selectivity
 -- ========================================
 
 -- ✅ 高选择性条件
@@ -123,7 +142,9 @@ PREWHERE status = 1  -- 低选择性
 WHERE user_id = 123;
 
 -- ========================================
--- 基本 PREWHERE
+-- PREWHERE 优化 > PREWHERE 优化技巧 > 技巧 2: 使用列名而非表达式
+-- 来源: 05_prewhere_optimization.md:172
+-- 属性: bench=prewhere_column
 -- ========================================
 
 -- ✅ 使用列名
@@ -137,7 +158,8 @@ PREWHERE toDate(event_time) >= now() - INTERVAL 7 DAY
 WHERE user_id = 123;
 
 -- ========================================
--- 基本 PREWHERE
+-- PREWHERE 优化 > PREWHERE 优化技巧 > 技巧 3: 组合多个条件
+-- 来源: 05_prewhere_optimization.md:186
 -- ========================================
 
 -- ✅ 组合多个 PREWHERE 条件
@@ -148,7 +170,9 @@ PREWHERE event_time >= now() - INTERVAL 7 DAY
 WHERE user_id IN (1, 2, 3, ..., 1000);
 
 -- ========================================
--- 基本 PREWHERE
+-- PREWHERE 优化 > PREWHERE 优化技巧 > 技巧 4: 避免复杂表达式
+-- 来源: 05_prewhere_optimization.md:197
+-- 属性: bench=prewhere_complex_expression
 -- ========================================
 
 -- ✅ 简单条件
@@ -163,7 +187,8 @@ PREWHERE event_time >= now() - INTERVAL 7 DAY
 WHERE user_id = 123;
 
 -- ========================================
--- 基本 PREWHERE
+-- PREWHERE 优化 > PREWHERE 性能分析 > 查看执行计划
+-- 来源: 05_prewhere_optimization.md:214
 -- ========================================
 
 -- 查看是否使用了 PREWHERE
@@ -176,7 +201,8 @@ PREWHERE event_time >= now() - INTERVAL 7 DAY
 WHERE user_id = 123;
 
 -- ========================================
--- 基本 PREWHERE
+-- PREWHERE 优化 > PREWHERE 性能分析 > 查看 PREWHERE 过滤效果
+-- 来源: 05_prewhere_optimization.md:227
 -- ========================================
 
 -- 查看过滤统计
@@ -197,7 +223,8 @@ ORDER BY filter_ratio DESC
 LIMIT 10;
 
 -- ========================================
--- 基本 PREWHERE
+-- PREWHERE 优化 > PREWHERE 最佳实践 > 1. 用于大表
+-- 来源: 05_prewhere_optimization.md:250
 -- ========================================
 
 -- ✅ 大表使用 PREWHERE
@@ -211,7 +238,8 @@ WHERE event_time >= now() - INTERVAL 7 DAY
   AND user_id = 123;
 
 -- ========================================
--- 基本 PREWHERE
+-- PREWHERE 优化 > PREWHERE 最佳实践 > 2. 用于高选择性条件
+-- 来源: 05_prewhere_optimization.md:264
 -- ========================================
 
 -- ✅ 高选择性条件
@@ -225,7 +253,8 @@ PREWHERE status = 1  -- 只过滤 10% 数据
 WHERE user_id = 123;
 
 -- ========================================
--- 基本 PREWHERE
+-- PREWHERE 优化 > PREWHERE 最佳实践 > 3. 用于大列
+-- 来源: 05_prewhere_optimization.md:278
 -- ========================================
 
 -- ✅ 大列使用 PREWHERE
@@ -245,7 +274,8 @@ WHERE user_id = 123
   AND event_data LIKE '%keyword%';
 
 -- ========================================
--- 基本 PREWHERE
+-- PREWHERE 优化 > PREWHERE 最佳实践 > 4. 定期分析效果
+-- 来源: 05_prewhere_optimization.md:298
 -- ========================================
 
 -- 分析 PREWHERE 效果